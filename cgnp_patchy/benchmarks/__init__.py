@@ -0,0 +1 @@
+from cgnp_patchy.benchmarks.suite import benchmarks, compare, load_baseline, run_benchmarks, save_baseline
@@ -0,0 +1,38 @@
+""" Runs the benchmark suite and compares it to the stored baseline.
+
+    python -m cgnp_patchy.benchmarks [names ...] [--save-baseline] [--time-tolerance 0.25]
+
+Exits with status 1 if any benchmark regressed beyond the tolerances.
+"""
+import argparse
+import sys
+
+import mbuild as mb
+from cgnp_patchy.benchmarks.suite import BASELINE_FILE, compare, load_baseline, run_benchmarks, save_baseline
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m cgnp_patchy.benchmarks',
+                                     description='Benchmarks the cgnp_patchy builders.')
+    parser.add_argument('names', nargs='*', help='Benchmarks to run, or substrings of their names')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed calls of each benchmark')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline results file')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--time-tolerance', type=float, default=0.25,
+                        help='Allowed fractional increase of the wall time')
+    parser.add_argument('--memory-tolerance', type=float, default=0.25,
+                        help='Allowed fractional increase of the peak memory')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.names, repeat=args.repeat, verbose=True)
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        return 0
+
+    regressions = compare(results, load_baseline(args.baseline), args.time_tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import mbuild as mb
+import numpy as np
+
+import cgnp_patchy
+
+# Baseline results shipped with the package
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+RADII = [2.5, 5.0, 10.0, 20.0]
+PATTERNS = ['polar', 'bipolar', 'equatorial', 'square', 'cube', 'tetrahedral', 'ring', 'random']
+DENSITIES = [1.0, 3.0, 6.0]
+BOX_SIZES = [10, 100, 1000]
+SAVE_FORMATS = ['mol2', 'pdb', 'xyz', 'hoomdxml', 'lammps', 'gsd']
+
+_BENCHMARKS = OrderedDict()
+
+def benchmark(name):
+    ''' Registers a benchmark. The decorated function takes no arguments and
+    returns the function to time, so setup is not included in the timing.
+    '''
+    def register(setup):
+        _BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+def _register_all():
+    from cgnp_patchy.cgnp_patchy import _coating_pattern, cgnp_patchy
+    from cgnp_patchy.lib.chains import CGAlkane
+    from cgnp_patchy.lib.nanoparticles import Nanoparticle
+    from cgnp_patchy.lib.patterns.coating_pattern import fibonacci_sphere
+    from cgnp_patchy.lib.utils.write_gsd import write_gsd
+    from cgnp_patchy.systems import PatchyBox
+
+    for radius in RADII:
+        @benchmark('nanoparticle[r={}]'.format(radius))
+        def core(radius=radius):
+            return lambda: Nanoparticle(radius, 0.6)
+
+    for coating_pattern in PATTERNS:
+        for density in DENSITIES:
+            @benchmark('pattern[{},cd={}]'.format(coating_pattern, density))
+            def pattern(coating_pattern=coating_pattern, density=density):
+                def run():
+                    # Time the lattice generation too, not just the cached lattice
+                    fibonacci_sphere.cache_clear()
+                    _coating_pattern(density, 5.0, coating_pattern, 0.2, None)
+                return run
+
+    for backfill in (False, True):
+        @benchmark('cgnp_patchy[polar,backfill={}]'.format(backfill))
+        def tethered(backfill=backfill):
+            backfill = CGAlkane(n=3) if backfill else None
+            return lambda: cgnp_patchy(radius=2.5, chain_density=2.0, coating_pattern='polar', backfill=backfill)
+
+        @benchmark('cgnp_patchy.build_arrays[polar,backfill={}]'.format(backfill))
+        def tethered_arrays(backfill=backfill):
+            backfill = CGAlkane(n=3) if backfill else None
+            return lambda: cgnp_patchy.build_arrays(radius=2.5, chain_density=2.0, coating_pattern='polar',
+                                                    backfill=backfill)
+
+    for n in BOX_SIZES:
+        lengths = np.ones(3) * 12.0 * n**(1.0/3.0)
+        # Compound boxes already take seconds at n=10, so only the smallest is timed
+        if n <= 10:
+            @benchmark('patchy_box[n={}]'.format(n))
+            def box(n=n, lengths=lengths):
+                nano = cgnp_patchy(radius=2.5, chain_density=2.0)
+                return lambda: PatchyBox(nano, n=n, box=mb.Box(lengths=lengths))
+
+        @benchmark('patchy_box.build_arrays[n={}]'.format(n))
+        def box_arrays(n=n, lengths=lengths):
+            nano = cgnp_patchy.build_arrays(radius=2.5, chain_density=2.0)
+            return lambda: PatchyBox.build_arrays(nano, n=n, box=mb.Box(lengths=lengths))
+
+    for extension in SAVE_FORMATS:
+        @benchmark('save[{}]'.format(extension))
+        def save(extension=extension):
+            nano = cgnp_patchy(radius=2.5, chain_density=2.0)
+            nano.periodicity = np.ones(3) * 10.0
+            return lambda: nano.save('nanoparticle.' + extension, overwrite=True)
+
+    @benchmark('write_gsd[n=1000]')
+    def write_box():
+        nano = cgnp_patchy.build_arrays(radius=2.5, chain_density=2.0)
+        box = PatchyBox.build_arrays(nano, n=1000, box=mb.Box(lengths=np.ones(3) * 120.0))
+        return lambda: write_gsd('box.gsd', box, overwrite=True)
+
+    @benchmark('patchy_box.stream[n=1000]')
+    def stream_box():
+        nano = cgnp_patchy.build_arrays(radius=2.5, chain_density=2.0)
+        return lambda: PatchyBox.stream(nano, n=1000, box=mb.Box(lengths=np.ones(3) * 120.0),
+                                        filename='box.gsd', overwrite=True)
+
+def benchmarks():
+    ''' Returns the registered benchmarks by name. '''
+    if not _BENCHMARKS:
+        _register_all()
+
+    return _BENCHMARKS
+
+def _measure(run, repeat):
+    ''' Returns the best wall time of `repeat` calls and the peak traced memory (MB) of one more call. '''
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return min(times), peak / 1024.0**2
+
+def run_benchmarks(names=None, repeat=3, verbose=False):
+    ''' Runs benchmarks and returns their results.
+
+    Parameters
+    ----------
+    names : list of str, optional, default=None
+        Benchmarks to run, or substrings of their names. All are run if None.
+    repeat : int, default=3
+        Number of timed calls of each benchmark; the best is kept
+    verbose : bool, default=False
+        Print each result as it is measured
+
+    Returns
+    -------
+    dict
+        Machine information and, for each benchmark, the best wall time (s)
+        and peak traced memory (MB)
+    '''
+    results = OrderedDict()
+    # Files are written to a scratch directory
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    try:
+        for name, setup in benchmarks().items():
+            if names and not any(pattern in name for pattern in names):
+                continue
+            try:
+                run = setup()
+                wall_time, peak_memory = _measure(run, repeat)
+            except ImportError as e:
+                if verbose:
+                    print('{:<48s} skipped: {}'.format(name, e))
+                continue
+            results[name] = {'wall_time': wall_time, 'peak_memory': peak_memory}
+            if verbose:
+                print('{:<48s} {:>10.4f} s {:>10.1f} MB'.format(name, wall_time, peak_memory))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {'version': cgnp_patchy.__version__, 'machine': platform.platform(),
+            'python': platform.python_version(), 'numpy': np.__version__, 'results': results}
+
+def load_baseline(filename=BASELINE_FILE):
+    with open(filename) as f:
+        return json.load(f)
+
+def save_baseline(results, filename=BASELINE_FILE):
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(results, f, indent=2)
+    shutil.move(tmp, filename)
+
+def compare(results, baseline, time_tolerance=0.25, memory_tolerance=0.25, min_time=0.01):
+    ''' Finds benchmarks that regressed against a baseline.
+
+    Parameters
+    ----------
+    results : dict
+        Results of `run_benchmarks`
+    baseline : dict
+        Baseline results, e.g. from `load_baseline`
+    time_tolerance : float, default=0.25
+        Allowed fractional increase of the wall time
+    memory_tolerance : float, default=0.25
+        Allowed fractional increase of the peak memory, on top of 1 MB of slack
+    min_time : float, default=0.01
+        Wall time increases smaller than this (s) are taken as noise
+
+    Returns
+    -------
+    list of str
+        Description of each regression
+    '''
+    regressions = []
+    for name, result in results['results'].items():
+        if name not in baseline['results']:
+            continue
+        base = baseline['results'][name]
+        if (result['wall_time'] > base['wall_time'] * (1.0 + time_tolerance)
+                and result['wall_time'] - base['wall_time'] > min_time):
+            regressions.append('{}: wall time {:.4f} s vs. baseline {:.4f} s'.format(
+                name, result['wall_time'], base['wall_time']))
+        if result['peak_memory'] > base['peak_memory'] * (1.0 + memory_tolerance) + 1.0:
+            regressions.append('{}: peak memory {:.1f} MB vs. baseline {:.1f} MB'.format(
+                name, result['peak_memory'], base['peak_memory']))
+
+    return regressions
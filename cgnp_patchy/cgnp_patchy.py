@@ -4,6 +4,130 @@ import numpy as np
 from cgnp_patchy.lib.nanoparticles import Nanoparticle
 from cgnp_patchy.lib.chains import CGAlkane
 from cgnp_patchy.lib.patterns import *
+from cgnp_patchy.lib.utils.graft_chains import _prototype_key, graft_arrays, graft_chains
+from cgnp_patchy.lib.utils.particle_array import ParticleArray
+from cgnp_patchy.lib.utils.particle_cache import ParticleCache, particle_key
+from cgnp_patchy.lib.utils.stage_timer import StageTimer
+
+def _coating_pattern(chain_density, radius, coating_pattern, fractional_sa, backfill, **kwargs):
+    """Builds the coating pattern for a tethered nanoparticle. Parameters are the same as `cgnp_patchy`. """
+    if coating_pattern == 'isotropic':
+        pattern = IsotropicPattern(chain_density, radius, **kwargs)
+    elif coating_pattern == 'polar':
+        pattern = PolarPattern(chain_density, radius, fractional_sa, **kwargs)
+    elif coating_pattern == 'bipolar':
+        pattern = BipolarPattern(chain_density, radius, fractional_sa, **kwargs)
+    elif coating_pattern == 'equatorial':
+        pattern = EquatorialPattern(chain_density, radius, fractional_sa, **kwargs)
+    elif coating_pattern == 'square':
+        pattern = SquarePattern(chain_density, radius, fractional_sa, **kwargs)
+    elif coating_pattern == 'random':
+        pattern = RandomPattern(chain_density, radius, **kwargs)
+    elif coating_pattern == 'cube':
+        pattern = CubePattern(chain_density, radius, fractional_sa, **kwargs)
+    elif coating_pattern == 'tetrahedral':
+        pattern = TetrahedralPattern(chain_density, radius, fractional_sa, **kwargs)
+    elif coating_pattern == 'ring':
+        pattern = RingPattern(chain_density, radius, fractional_sa, **kwargs)
+    elif coating_pattern == 'patch':
+        pattern = PatchPattern(chain_density, radius, fractional_sa=fractional_sa, **kwargs)
+    else:
+        raise Exception("Coating pattern '{}' not supported. Valid options are 'polar', 'bipolar', 'isotropic', 'equatorial', 'square', 'random', 'cube', 'tetrahedral', 'ring', and 'patch'.".format(coating_pattern))
+
+    if backfill and coating_pattern == 'random':
+        raise Exception("Backfill not supported for coating pattern type 'random'.")
+    elif backfill and coating_pattern == 'isotropic':
+        raise Exception("Backfill not supported for coating pattern type 'isotropic'.")
+
+    return pattern
+
+class NanoparticlePlan(object):
+    """
+    Counts and point sets of a tethered nanoparticle, computed without building it.
+
+    Only the core and graft site coordinates are generated, so a plan takes
+    milliseconds. Use `build` or `build_arrays` to build the nanoparticle it
+    describes. Parameters are the same as `cgnp_patchy`.
+
+    Attributes
+    ----------
+    parameters : dict
+        Parameters of the build
+    core_points : np.ndarray (n_core, 3)
+        Core bead positions relative to the core center
+    pattern : CoatingPattern
+        Coating pattern of the graft sites
+    chain_points : np.ndarray (n_chains, 3)
+        Graft sites of the chains relative to the core center
+    backfill_points : np.ndarray (n_backfill, 3)
+        Graft sites of the backfill relative to the core center
+    chain_length : int
+        Number of beads per chain
+    backfill_length : int
+        Number of beads per backfill chain
+    """
+    def __init__(self, radius, chain_density, bead_diameter=0.6, backfill=None, coating_pattern='isotropic', fractional_sa=0.2, chain=None, **kwargs):
+        if chain is None:
+            chain = CGAlkane.prototype()
+        self.parameters = dict(radius=radius, chain_density=chain_density, bead_diameter=bead_diameter,
+                               backfill=backfill, coating_pattern=coating_pattern,
+                               fractional_sa=fractional_sa, chain=chain, **kwargs)
+        self.core_points = Nanoparticle.core_points(radius, bead_diameter)
+        self.pattern = _coating_pattern(chain_density, radius, coating_pattern, fractional_sa, backfill, **kwargs)
+        self.chain_points = self.pattern.points
+        self.backfill_points = self.pattern.removed_points if backfill else np.empty((0, 3))
+        self.chain_length = chain.n_particles
+        self.backfill_length = backfill.n_particles if backfill else 0
+        self._arrays = None
+
+    @property
+    def n_core(self):
+        return len(self.core_points)
+
+    @property
+    def n_chains(self):
+        return len(self.chain_points)
+
+    @property
+    def n_backfill(self):
+        return len(self.backfill_points)
+
+    @property
+    def n_particles(self):
+        return self.n_core + self.n_chains * self.chain_length + self.n_backfill * self.backfill_length
+
+    @property
+    def surface_area(self):
+        """Surface area of the nanoparticle (nm^2). """
+        return 4.0 * np.pi * self.parameters['radius']**2.0
+
+    @property
+    def grafting_density(self):
+        """Number of grafted chains per surface area (chains / nm^2). """
+        return self.n_chains / self.surface_area
+
+    @property
+    def patch_area(self):
+        """Uncoated surface area (nm^2), from the fraction of lattice sites removed by the pattern. """
+        # Random patterns sample a denser lattice, so their removed sites are not a patch
+        if self.parameters['coating_pattern'] == 'random':
+            return 0.0
+        return self.surface_area * len(self.pattern.removed_indices) / len(self.pattern.lattice)
+
+    @property
+    def arrays(self):
+        """The nanoparticle as a ParticleArray, built on first access. """
+        if self._arrays is None:
+            self._arrays = self.build_arrays()
+        return self._arrays
+
+    def build(self):
+        """Builds the planned nanoparticle as a `cgnp_patchy` compound. """
+        return cgnp_patchy(**self.parameters)
+
+    def build_arrays(self):
+        """Builds the planned nanoparticle with `cgnp_patchy.build_arrays`. """
+        return cgnp_patchy.build_arrays(**self.parameters)
 
 class cgnp_patchy(mb.Compound):
     """
@@ -13,8 +137,6 @@ class cgnp_patchy(mb.Compound):
     ----------
     radius : float
         Radius of the nanoparticle (nm)
-    chain : mb.Compound
-        Prototype of alkane chain to attach to the nanoparticle core. Not currently implemented.
     chain_density : float
         Density of chain coating on the nanoparticle (chains / nm^2)
     bead_diameter : float, default=0.6
@@ -23,87 +145,136 @@ class cgnp_patchy(mb.Compound):
         Protoype of backfill to place at vacant sites on the nanoparticle
     coating_pattern : str, optional, default='isotropic'
         Type of pattern for the chain coating.
-        Supported types are 'polar', 'bipolar', 'isotropic', 'equatorial', 'square', 'random', 'cube', 'tetrahedral', and 'ring'.
+        Supported types are 'polar', 'bipolar', 'isotropic', 'equatorial', 'square', 'random', 'cube', 'tetrahedral', 'ring', and 'patch'.
+        The 'patch' pattern takes the patch centers as a `centers` keyword argument, see `PatchPattern`.
     fractional_sa : float, default=0.2
         Fractional surface rea of the nanoparticle to exclude coating (nm^2)
+    chain : mb.Compound, optional, default=None
+        Prototype of chain to attach to the nanoparticle core, grafted by its 'up' port.
+        Defaults to a shared CGAlkane prototype with 6 beads.
+    bond_free : bool, default=True
+        Assign the core and chain anchor beads to the core's rigid body directly,
+        without creating and then removing bonds between the core and chains.
+        If False, the legacy bond-and-remove workflow is used.
     """
-    def __init__(self, radius, chain_density, bead_diameter=0.6, backfill=None, coating_pattern='isotropic', fractional_sa=0.2, **kwargs):
+    def __init__(self, radius, chain_density, bead_diameter=0.6, backfill=None, coating_pattern='isotropic', fractional_sa=0.2, chain=None, bond_free=True, **kwargs):
         super(cgnp_patchy, self).__init__()
         
         self.bead_diameter = bead_diameter
+        self.timings = StageTimer('cgnp_patchy')
         
-        nano = Nanoparticle(radius, bead_diameter)
-        self.add(nano, 'nanoparticle')
+        with self.timings.stage('core'):
+            nano = Nanoparticle(radius, bead_diameter)
+            self.add(nano, 'nanoparticle')
 
-        chain = CGAlkane()
-        
-        isotropic_pattern = mb.SpherePattern(int(chain_density*4.0*np.pi*radius**2.0))
-        isotropic_pattern.scale(radius)
-       
-        if coating_pattern == 'isotropic':
-            pattern = isotropic_pattern
-        elif coating_pattern == 'polar':
-            pattern = PolarPattern(chain_density, radius, fractional_sa, **kwargs)
-        elif coating_pattern == 'bipolar':
-            pattern = BipolarPattern(chain_density, radius, fractional_sa, **kwargs)
-        elif coating_pattern == 'equatorial':
-            pattern = EquatorialPattern(chain_density, radius, fractional_sa, **kwargs)
-        elif coating_pattern == 'square':
-            pattern = SquarePattern(chain_density, radius, fractional_sa, **kwargs)
-        elif coating_pattern == 'random':
-            pattern = RandomPattern(chain_density, radius, **kwargs)
-        elif coating_pattern == 'cube':
-            pattern = CubePattern(chain_density, radius, fractional_sa, **kwargs)
-        elif coating_pattern == 'tetrahedral':
-            pattern = TetrahedralPattern(chain_density, radius, fractional_sa, **kwargs)
-        elif coating_pattern == 'ring':
-            pattern = RingPattern(chain_density, radius, fractional_sa, **kwargs)
-        else:
-            raise Exception("Coating pattern '{}' not supported. Valid options are 'polar', 'bipolar', 'isotropic', 'equatorial', 'square', 'random', 'cube', 'tetrahedral', and 'ring'.".format(coating_pattern))
+        with self.timings.stage('pattern'):
+            pattern = _coating_pattern(chain_density, radius, coating_pattern, fractional_sa, backfill, **kwargs)
+
+        with self.timings.stage('grafting'):
+            if chain is None:
+                chain = CGAlkane.prototype()
+            chains, anchors = graft_chains(chain, pattern.points, nano.center, radius)
+            self.add(chains)
+            if not bond_free:
+                for anchor in anchors:
+                    self.add_bond((anchor, nano))
 
-        if backfill and coating_pattern == 'random':
-            raise Exception("Backfill not supported for coating pattern type 'random'.")
-        elif backfill and coating_pattern == 'isotropic':
-            raise Exception("Backfill not supported for coating pattern type 'isotropic'.")
-        
         if backfill:
-            backfill_points = []
-            for point in isotropic_pattern.points:
-                if not np.all(np.isin(point, pattern.points)):
-                    backfill_points.append(point)
-      
-        # Hacky workaround until apply_to_compound below can be used
-        for pos in pattern.points:
-            port = mb.Port(anchor=self['nanoparticle'], orientation=pos, separation=radius)
-            self['nanoparticle'].add(port, 'port[$]')
-            chain = CGAlkane()
-            self.add(chain)
-            mb.force_overlap(chain, chain['up'], port)  
-
-        #chain_protos, empty_backfill = pattern.apply_to_compound(guest=chain, guest_port_name='up', host=self)
-        #self.add(chain_protos)
-        
+            with self.timings.stage('backfill'):
+                b_chains, b_anchors = graft_chains(backfill, pattern.removed_points, nano.center, radius)
+                self.add(b_chains)
+                if not bond_free:
+                    for anchor in b_anchors:
+                        self.add_bond((anchor, nano))
+            anchors = anchors + b_anchors
+
+        with self.timings.stage('label_rigid_bodies'):
+            self.label_rigid_bodies(rigid_particles='_CGN')
+
+        if bond_free:
+            with self.timings.stage('rigid_ids'):
+                for anchor in anchors:
+                    anchor.rigid_id = 0
+        else:
+            # This is a temporary workaround until the 'apply_to_compound' method in mBuild is fixed -Andrew
+            # Has the problem this was working around been fixed yet? If so, this code can be updated.
+            with self.timings.stage('remove_bonds'):
+                for bond in self.bonds():
+                    if bond[0].name == 'Nanoparticle' or bond[1].name == 'Nanoparticle':
+                        if bond[0].name == 'Nanoparticle':
+                            bond[1].rigid_id = 0
+                        if bond[1].name == 'Nanoparticle':
+                            bond[0].rigid_id = 0
+                        self.remove_bond(bond)
+
+    @classmethod
+    def plan(cls, radius, chain_density, bead_diameter=0.6, backfill=None, coating_pattern='isotropic', fractional_sa=0.2, chain=None, **kwargs):
+        """Returns a NanoparticlePlan with the counts and point sets of the nanoparticle, without building it.
+
+        Parameters are the same as `cgnp_patchy`.
+        """
+        return NanoparticlePlan(radius, chain_density, bead_diameter=bead_diameter, backfill=backfill,
+                                coating_pattern=coating_pattern, fractional_sa=fractional_sa, chain=chain, **kwargs)
+
+    @classmethod
+    def build_arrays(cls, radius, chain_density, bead_diameter=0.6, backfill=None, coating_pattern='isotropic', fractional_sa=0.2, chain=None, **kwargs):
+        """Builds the tethered nanoparticle as a ParticleArray without creating an mb.Compound per bead.
+
+        Parameters are the same as `cgnp_patchy`. Core beads and chain anchor
+        beads have rigid id 0, and no bonds are made between the core and chains.
+        """
+        timings = StageTimer('cgnp_patchy')
+        with timings.stage('core'):
+            core_xyz = Nanoparticle.core_points(radius, bead_diameter)
+            n_core = len(core_xyz)
+            core = ParticleArray(core_xyz, ['_CGN'], np.zeros(n_core), rigid_id=np.zeros(n_core))
+            center = core.center
+
+        with timings.stage('pattern'):
+            pattern = _coating_pattern(chain_density, radius, coating_pattern, fractional_sa, backfill, **kwargs)
+
+        with timings.stage('grafting'):
+            if chain is None:
+                chain = CGAlkane.prototype()
+            parts = [core, graft_arrays(chain, pattern.points, center, radius)]
+
         if backfill:
-            pattern.points = np.array(backfill_points)
-            # Problems with apply_to_compound again, temporarily replaced with workaround used with pattern
-            for pos in pattern.points:
-                port = mb.Port(anchor=self['nanoparticle'], orientation=pos, separation=radius)
-                self['nanoparticle'].add(port, 'b_port[$]')
-                b_chain = mb.clone(backfill)
-                self.add(b_chain)
-                mb.force_overlap(b_chain, b_chain['up'], port)
-            #backfill_protos, empty_backfill = pattern.apply_to_compound(backfill, guest_port_name='up', host=self['nanoparticle'])
-            #self.add(backfill_protos)
-        
-        self.label_rigid_bodies(rigid_particles='_CGN')
-
-        # This is a temporary workaround until the 'apply_to_compound' method in mBuild is fixed -Andrew
-        # Has the problem this was working around been fixed yet? If so, this code can be updated.
-        for bond in self.bonds():
-            if bond[0].name == 'Nanoparticle' or bond[1].name == 'Nanoparticle':
-                if bond[0].name == 'Nanoparticle':
-                    bond[1].rigid_id = 0
-                if bond[1].name == 'Nanoparticle':
-                    bond[0].rigid_id = 0
-                self.remove_bond(bond)
+            with timings.stage('backfill'):
+                parts.append(graft_arrays(backfill, pattern.removed_points, center, radius))
+
+        with timings.stage('concatenate'):
+            arrays = ParticleArray.concatenate(parts, offset_ids=False)
+        arrays.timings = timings
+
+        return arrays
+
+    @classmethod
+    def build_cached(cls, radius, chain_density, bead_diameter=0.6, backfill=None, coating_pattern='isotropic', fractional_sa=0.2, chain=None, cache=None, **kwargs):
+        """Returns the tethered nanoparticle as a ParticleArray, loading it from an on-disk cache if it was built before.
+
+        Entries are keyed by a hash of the parameters, the content of the chain
+        and backfill prototypes and the package version. Arrays loaded from
+        the cache are memory-mapped and read-only; use `copy` to modify them.
+        Other parameters are the same as `cgnp_patchy`.
+
+        Parameters
+        ----------
+        cache : ParticleCache, optional, default=None
+            Cache to use. Defaults to a ParticleCache in `cache_dir()`.
+        """
+        if cache is None:
+            cache = ParticleCache()
+        if chain is None:
+            chain = CGAlkane.prototype()
+        key = particle_key(builder='cgnp_patchy', radius=radius, chain_density=chain_density,
+                           bead_diameter=bead_diameter, coating_pattern=coating_pattern,
+                           fractional_sa=fractional_sa, chain=_prototype_key(chain),
+                           backfill=_prototype_key(backfill) if backfill else None, kwargs=kwargs)
+        arrays = cache.get(key)
+        if arrays is None:
+            arrays = cls.build_arrays(radius, chain_density, bead_diameter=bead_diameter, backfill=backfill,
+                                      coating_pattern=coating_pattern, fractional_sa=fractional_sa,
+                                      chain=chain, **kwargs)
+            cache.put(key, arrays)
 
+        return arrays
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 import mbuild as mb
 import numpy as np
 from cgnp_patchy.lib.moieties import MMM, MME
@@ -44,6 +46,16 @@ class CGAlkane(mb.Compound):
             # Hoist port label to CGAlkane level.
             self.add(chain['down'], label='down', containment=False)
 
+    @classmethod
+    @lru_cache(maxsize=32)
+    def prototype(cls, n=6, cap_front=False, cap_end=True):
+        """ Returns a CGAlkane built once per process for each (n, cap_front, cap_end).
+
+        The prototype is shared between callers and must not be modified; use
+        mb.clone to get a copy that can be.
+        """
+        return cls(n=n, cap_front=cap_front, cap_end=cap_end)
+
 if __name__ == "__main__":
     chain = CGAlkane()
     chain.save('chain.mol2', overwrite=True)
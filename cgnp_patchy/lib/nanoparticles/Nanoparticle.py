@@ -1,29 +1,111 @@
 from __future__ import division
 
+import json
 import math
+import os
 
 import mbuild as mb
 import numpy as np
-from scipy.spatial import distance
+from scipy.spatial import cKDTree
+
+from cgnp_patchy.lib.patterns.coating_pattern import _fibonacci_sphere, fibonacci_sphere
+from cgnp_patchy.lib.utils.cache_dir import cache_dir
+
+# Solved (r, sigma) -> number of core beads shipped with the package
+_CORE_TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'core_table.json')
+_core_table = None
+# Only cores with a radius and bead diameter on this grid (nm) are saved to the user's table
+_CORE_TABLE_RESOLUTION = 0.01
 
 def _fast_sphere_pattern(n, radius):
-    """Faster version of mBuild's SpherePattern. """
-    phi = (1 + np.sqrt(5)) / 2
-    long_incr = 2*np.pi / phi
+    """Faster version of mBuild's SpherePattern. Returns a shared, read-only array. """
+    return fibonacci_sphere(n, radius)
+
+def _fibonacci_offsets(n):
+    """Fibonacci numbers below `n`, the index offsets between neighbors in a Fibonacci lattice. """
+    offsets = [1, 2]
+    while offsets[-1] < n:
+        offsets.append(offsets[-1] + offsets[-2])
+
+    return [offset for offset in offsets if offset < n]
+
+def _min_spacing(n, radius):
+    """Minimum distance between points of an `n` point Fibonacci lattice.
+
+    Nearest neighbors in the lattice are separated by Fibonacci numbers in
+    index, so only those O(log n) offsets are compared instead of all pairs.
+    Points `offset` apart in index are a fixed azimuth apart, so each distance
+    follows from the heights of the two points and the lattice isn't built.
+    """
+    if n < 2:
+        return np.inf
+    # Same lattice as `_fibonacci_sphere`
+    long_incr = 2 * np.pi / ((1 + np.sqrt(5)) / 2)
     dz = 2.0 / float(n)
-    bands = np.arange(n)
-    z = bands * dz - 1.0 + (dz/2.0)
-    r = np.sqrt(1.0 - z*z)
-    az = bands * long_incr
-    x = r * np.cos(az)
-    y = r * np.sin(az)
-    points = np.column_stack((x, y, z)) * np.asarray([radius])
+    z = np.arange(n) * dz - 1.0 + (dz / 2.0)
+    r = np.sqrt(1.0 - z * z)
+
+    min_sq = min(np.min(r[offset:]**2 + r[:-offset]**2 - 2 * r[offset:] * r[:-offset] * np.cos(offset * long_incr))
+                 + (offset * dz)**2 for offset in _fibonacci_offsets(n))
+
+    return radius * np.sqrt(max(min_sq, 0.0))
 
-    return points
+def _core_table_key(r, sigma):
+    # Floats, so that integer radii and diameters match the shipped keys
+    return '{},{}'.format(round(float(r), 6), round(float(sigma), 6))
+
+def _user_core_table_file():
+    """Path of the user's core table, or None if the cache directory can't be created. """
+    try:
+        return os.path.join(cache_dir(), 'core_table.json')
+    except OSError:
+        return None
+
+def _load_core_table():
+    """Loads the shipped core table merged with the user's table of solved cores, if there is one. """
+    global _core_table
+    if _core_table is None:
+        _core_table = {}
+        for filename in (_CORE_TABLE_FILE, _user_core_table_file()):
+            if filename is None or not os.path.isfile(filename):
+                continue
+            try:
+                with open(filename) as f:
+                    _core_table.update(json.load(f))
+            except (OSError, ValueError):
+                if filename == _CORE_TABLE_FILE:
+                    raise
+
+    return _core_table
+
+def _on_core_grid(*values):
+    """Whether every value is a multiple of `_CORE_TABLE_RESOLUTION`. """
+    return all(abs(value / _CORE_TABLE_RESOLUTION - round(value / _CORE_TABLE_RESOLUTION)) < 1e-6
+               for value in values)
+
+def _store_core_table(key, n, persist=True):
+    """Adds a solved core to the core table, and to the user's table on disk if `persist`. """
+    table = _load_core_table()
+    table[key] = n
+    filename = _user_core_table_file() if persist else None
+    if filename is None:
+        return
+    try:
+        user_table = {}
+        if os.path.isfile(filename):
+            with open(filename) as f:
+                user_table = json.load(f)
+        user_table[key] = n
+        tmp = '{}.{}.tmp'.format(filename, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(user_table, f, indent=0, sort_keys=True)
+        os.replace(tmp, filename)
+    except (OSError, ValueError):
+        pass
 
 class Nanoparticle(mb.Compound):
     """ Builds a coarse-grained, silica nanoparticle core
-    
+
         Parameters
         ----------
         r : float, default=5.0
@@ -34,10 +116,48 @@ class Nanoparticle(mb.Compound):
     def __init__(self, r=5.0, sigma=0.8):
         super(Nanoparticle, self).__init__()
 
+        for i, pos in enumerate(self.core_points(r, sigma)):
+            particle = mb.Compound(name="_CGN", pos=pos)
+            self.add(particle, "CGN_{}".format(i))
+
+    @classmethod
+    def core_points(cls, r, sigma):
+        """ Returns the positions of the core beads, relative to the core center.
+
+        The array is shared through the lattice cache of `fibonacci_sphere` and is read-only.
+        """
+        return _fast_sphere_pattern(cls.n_beads(r, sigma), cls.bead_radius(r, sigma))
+
+    @staticmethod
+    def bead_radius(r, sigma):
+        """ Returns the radius of the sphere the core beads are placed on. """
         r_CG = sigma / 2
         r_silica = 0.40323 / 2
 
-        r = r - r_CG + r_silica
+        return r - r_CG + r_silica
+
+    @classmethod
+    def n_beads(cls, r, sigma):
+        """ Returns the number of core beads for a core of radius `r` and bead diameter `sigma`.
+
+        Solved cores are read from the shipped core table or the user's table
+        in the cache directory. New cores are solved and added to the user's
+        table if `r` and `sigma` are multiples of 0.01 nm, so that continuous
+        radii, e.g. the means of a `PolydispersePopulation`, don't grow it
+        without bound; other cores are only kept for the session.
+        """
+        key = _core_table_key(r, sigma)
+        table = _load_core_table()
+        if key not in table:
+            _store_core_table(key, cls._solve_n_beads(r, sigma), persist=_on_core_grid(r, sigma))
+
+        return table[key]
+
+    @classmethod
+    def _solve_n_beads(cls, r, sigma):
+        """ Finds the maximum number of CG beads without overlaps. """
+        r_CG = sigma / 2
+        r = cls.bead_radius(r, sigma)
 
         # N_approx = a(R/sigma)^2 + b(R/sigma) + c
         # Not an exact number but very close
@@ -46,42 +166,61 @@ class Nanoparticle(mb.Compound):
         c = -1.3333
         N_approx = a * ((r/sigma)**2) + b * (r/sigma) + c
 
-        # Binary search algorithm to find maximum number of CG beads without overlaps
-        min_points = max(N_approx - 500, 1)
-        max_points = N_approx + 500
-        opt_points = 0
-        while opt_points == 0:
-            mid = math.ceil((max_points + min_points) / 2)
-            points = _fast_sphere_pattern(mid, r)
-            points_high = _fast_sphere_pattern(mid+1, r)
-            check = self._check_overlap(points, r_CG)
-            check_high = self._check_overlap(points_high, r_CG)
-            if check == False and check_high == True:
-                points = _fast_sphere_pattern(mid, r)
-                opt_points = mid
-            elif check == True:
-                max_points = mid - 1
-            else:
-                min_points = mid + 1
-
-        for i, pos in enumerate(points):
-            particle = mb.Compound(name="_CGN", pos=pos)
-            self.add(particle, "CGN_{}".format(i))
+        def spacing_overlap(n):
+            return _min_spacing(n, r) < 2.0 * r_CG
 
-    def _check_overlap(self, points, radius):
+        def neighbor_overlap(n):
+            return cls._check_overlap(_fibonacci_sphere(n, r), r_CG)
+
+        # Binary search on the minimum lattice spacing, which is computed
+        # directly from the number of points. The result is confirmed with a
+        # full neighbor search and the search is repeated with it on a mismatch.
+        for overlaps in (spacing_overlap, neighbor_overlap):
+            min_points = max(N_approx - 500, 1)
+            max_points = N_approx + 500
+            opt_points = 0
+            while opt_points == 0:
+                mid = math.ceil((max_points + min_points) / 2)
+                check = overlaps(mid)
+                check_high = overlaps(mid+1)
+                if check == False and check_high == True:
+                    opt_points = mid
+                elif check == True:
+                    max_points = mid - 1
+                else:
+                    min_points = mid + 1
+            if not neighbor_overlap(opt_points) and neighbor_overlap(opt_points+1):
+                break
+
+        return opt_points
+
+    @staticmethod
+    def _check_overlap(points, radius, chunk_size=4096):
         """ Determines if there is any overlap for a set of uniform spheres.
 
+        Nearest neighbors are found with a KD-tree in chunks of points, so
+        memory grows linearly with the number of spheres and the search
+        stops at the first chunk containing an overlapping pair.
+
         Parameters:
         ----------
             points : np.ndarray (n, 3)
                 Sphere locations
             radius : float
                 Radius of spheres
+            chunk_size : int, default=4096
+                Number of points queried against the tree at a time
         """
-        dists = distance.cdist(points, points, 'euclidean')
-        dists = dists[np.nonzero(dists)]
+        tree = cKDTree(points)
+        for start in range(0, len(points), chunk_size):
+            # The closest match to each point is the point itself
+            dists, _ = tree.query(points[start:start+chunk_size], k=2,
+                                  distance_upper_bound=2.0 * radius)
+            dists = dists[:, 1]
+            if np.any((dists > 0) & (dists < 2.0 * radius)):
+                return True
 
-        return np.any(dists < 2.0 * radius)
+        return False
 
 if __name__ == "__main__":
     nano = Nanoparticle(2.5, 0.6)
@@ -6,3 +6,5 @@ from cgnp_patchy.lib.patterns.square_pattern import SquarePattern
 from cgnp_patchy.lib.patterns.cube_pattern import CubePattern
 from cgnp_patchy.lib.patterns.tetrahedral_pattern import TetrahedralPattern
 from cgnp_patchy.lib.patterns.ring_pattern import RingPattern
+from cgnp_patchy.lib.patterns.patch_pattern import PatchPattern
+from cgnp_patchy.lib.patterns.coating_pattern import CoatingPattern, IsotropicPattern
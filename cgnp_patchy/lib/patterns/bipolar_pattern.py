@@ -1,10 +1,11 @@
 from __future__ import division
 
-import mbuild as mb
 import numpy as np
 
+from cgnp_patchy.lib.patterns.coating_pattern import CoatingPattern, isotropic_lattice
 
-class BipolarPattern(mb.Pattern):
+
+class BipolarPattern(CoatingPattern):
     """ A nanoparticle coating pattern where points are removed from two opposite poles.
 
     Parameters
@@ -17,15 +18,14 @@ class BipolarPattern(mb.Pattern):
         Fractional surface area of the nanoparticle to exclude coating (nm^2)
     """
     def __init__(self, chain_density, radius, fractional_sa, **args):
-        pattern = mb.SpherePattern(int(chain_density * 4.0 * np.pi * radius**2.0))
-        pattern.scale(radius)
+        lattice = isotropic_lattice(chain_density, radius)
         total_sa = 4.0 * np.pi * radius**2.0
         patch_sa = total_sa * fractional_sa
         cutoff = patch_sa / (4 * np.pi * radius)
-        points = np.array([xyz for xyz in pattern.points if xyz[2] < radius-cutoff
-                           and xyz[2] > cutoff-radius])
+        z = lattice[:, 2]
+        mask = (z < radius-cutoff) & (z > cutoff-radius)
 
-        super(BipolarPattern, self).__init__(points=points, orientations=None)
+        super(BipolarPattern, self).__init__(lattice, mask)
 
 if __name__ == "__main__":
     from save_pattern import save_pattern
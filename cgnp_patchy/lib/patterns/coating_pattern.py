@@ -0,0 +1,121 @@
+from __future__ import division
+
+from functools import lru_cache
+
+import mbuild as mb
+import numpy as np
+
+# Maximum number of lattices kept by `fibonacci_sphere`
+LATTICE_CACHE_SIZE = 128
+
+def _fibonacci_sphere(n, radius=1.0):
+    """Generates a new, writeable Fibonacci lattice. Parameters are the same as `fibonacci_sphere`. """
+    phi = (1 + np.sqrt(5)) / 2
+    long_incr = 2*np.pi / phi
+    dz = 2.0 / float(n)
+    bands = np.arange(n)
+    z = bands * dz - 1.0 + (dz/2.0)
+    r = np.sqrt(1.0 - z*z)
+    az = bands * long_incr
+    x = r * np.cos(az)
+    y = r * np.sin(az)
+
+    return np.column_stack((x, y, z)) * radius
+
+@lru_cache(maxsize=LATTICE_CACHE_SIZE)
+def fibonacci_sphere(n, radius=1.0):
+    """Generates `n` points on a sphere using the Fibonacci lattice used by mBuild's SpherePattern.
+
+    Lattices are memoized for the most recently used (n, radius) and shared
+    between callers, so the returned array is read-only; copy it to modify it.
+
+    Parameters
+    ----------
+    n : int
+        Number of points on the sphere
+    radius : float, default=1.0
+        Radius of the sphere (nm)
+    """
+    points = _fibonacci_sphere(n, radius)
+    points.flags.writeable = False
+
+    return points
+
+def isotropic_lattice(chain_density, radius):
+    """Returns the isotropic lattice of graft sites for a nanoparticle surface, as a shared read-only array.
+
+    Parameters
+    ----------
+    chain_density : float
+        Density of chain coating on the nanoparticle (chains / nm^2)
+    radius : float
+        Radius of the nanoparticle (nm)
+    """
+    return fibonacci_sphere(int(chain_density * 4.0 * np.pi * radius**2.0), radius)
+
+class CoatingPattern(mb.Pattern):
+    """Base class for nanoparticle coating patterns selected from an isotropic lattice.
+
+    The isotropic lattice is generated once and subclasses choose the coated
+    sites with a boolean mask computed over the whole lattice array.
+
+    Parameters
+    ----------
+    lattice : np.ndarray (n, 3)
+        Isotropic lattice of candidate graft sites
+    mask : np.ndarray (n,), optional, default=None
+        Boolean mask of lattice sites kept in the pattern. All sites are kept if None.
+    """
+    def __init__(self, lattice, mask=None, **args):
+        if mask is None:
+            mask = np.ones(len(lattice), dtype=bool)
+        self.lattice = lattice
+        self.mask = np.asarray(mask, dtype=bool)
+        super(CoatingPattern, self).__init__(points=lattice[self.mask], orientations=None)
+
+    @property
+    def indices(self):
+        """Indices of the coated sites in the isotropic lattice. """
+        return np.flatnonzero(self.mask)
+
+    @property
+    def removed_indices(self):
+        """Indices of the sites removed from the isotropic lattice by the pattern. """
+        return np.flatnonzero(~self.mask)
+
+    @property
+    def removed_points(self):
+        """Coordinates of the sites removed from the isotropic lattice by the pattern. """
+        return self.lattice[~self.mask]
+
+class IsotropicPattern(CoatingPattern):
+    """A nanoparticle coating pattern where every point of the isotropic lattice is coated.
+
+    Parameters
+    ----------
+    chain_density : float
+        Density of chain coating on the nanoparticle (chains / nm^2)
+    radius : float
+        Radius of the nanoparticle (nm)
+    """
+    def __init__(self, chain_density, radius, **args):
+        lattice = isotropic_lattice(chain_density, radius)
+        super(IsotropicPattern, self).__init__(lattice)
+
+def in_box_mask(points, centers, half_width):
+    """Returns a mask of points lying within axis-aligned boxes around any of the given centers.
+
+    Parameters
+    ----------
+    points : np.ndarray (n, 3)
+        Points to test
+    centers : np.ndarray (m, 3)
+        Centers of the boxes
+    half_width : float
+        Half of the edge length of each box
+    """
+    mask = np.zeros(len(points), dtype=bool)
+    for center in np.atleast_2d(centers):
+        mask |= np.all((points > center - half_width) & (points < center + half_width), axis=1)
+
+    return mask
@@ -1,10 +1,11 @@
 from __future__ import division
 
-import mbuild as mb
 import numpy as np
 
+from cgnp_patchy.lib.patterns.coating_pattern import CoatingPattern, isotropic_lattice
 
-class CubePattern(mb.Pattern):
+
+class CubePattern(CoatingPattern):
     """A nanoparticle coating pattern where points are removed from points on six axies.
 
     Parameters
@@ -27,17 +28,13 @@ class CubePattern(mb.Pattern):
         if fractional_sa >= 0.8:
             raise Exception("Coating pattern 'cubic' only works for fraction surface area values of 0.8 and below.")
 
-        pattern = mb.SpherePattern(int(chain_density * 4.0 * np.pi * radius**2.0))
-        pattern.scale(radius)
+        lattice = isotropic_lattice(chain_density, radius)
         total_sa = 4.0 * np.pi * radius**2.0
         patch_sa = total_sa * fractional_sa
         cutoff = patch_sa / (8 * np.pi * radius)
-        points = np.array([xyz for xyz in pattern.points if xyz[2] < radius-cutoff
-                           and xyz[2] > cutoff-radius and xyz[1] < radius-cutoff
-                           and xyz[1] > cutoff-radius and xyz[0] < radius-cutoff
-                           and xyz[0] > cutoff-radius])
+        mask = np.all((lattice < radius-cutoff) & (lattice > cutoff-radius), axis=1)
         
-        super(CubePattern, self).__init__(points=points, orientations=None)
+        super(CubePattern, self).__init__(lattice, mask)
 
 if __name__ == "__main__":
     from save_pattern import save_pattern
@@ -1,10 +1,11 @@
 from __future__ import division
 
-import mbuild as mb
 import numpy as np
 
+from cgnp_patchy.lib.patterns.coating_pattern import CoatingPattern, isotropic_lattice
 
-class EquatorialPattern(mb.Pattern):
+
+class EquatorialPattern(CoatingPattern):
     """A nanoparticle coating pattern where points are removed from a band around the equator of the nanoparticle.
 
     Parameters
@@ -17,14 +18,13 @@ class EquatorialPattern(mb.Pattern):
         Fractional surface area of the nanoparticle to exclude coating (nm^2)
     """
     def __init__(self, chain_density, radius, fractional_sa, **args):
-        pattern = mb.SpherePattern(int(chain_density * 4.0 * np.pi * radius**2.0))
-        pattern.scale(radius)
+        lattice = isotropic_lattice(chain_density, radius)
         total_sa = 4.0 * np.pi * radius**2.0
         patch_sa = total_sa * fractional_sa
         width = patch_sa / (2 * np.pi * radius)
-        points = np.array([xyz for xyz in pattern.points if xyz[2] < (-width)/2
-                          or xyz[2] > width/2])
-        super(EquatorialPattern, self).__init__(points=points, orientations=None)
+        z = lattice[:, 2]
+        mask = (z < (-width)/2) | (z > width/2)
+        super(EquatorialPattern, self).__init__(lattice, mask)
 
 if __name__ == "__main__":
     from save_pattern import save_pattern
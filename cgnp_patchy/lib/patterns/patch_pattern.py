@@ -0,0 +1,96 @@
+from __future__ import division
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from cgnp_patchy.lib.patterns.coating_pattern import CoatingPattern, isotropic_lattice
+
+def cap_angle(fractional_sa):
+    """Angular radius (radians) of a spherical cap covering a fraction of the sphere's surface area.
+
+    Parameters
+    ----------
+    fractional_sa : float or np.ndarray
+        Fraction of the surface area in the cap
+    """
+    return np.arccos(1.0 - 2.0 * np.clip(fractional_sa, 0.0, 1.0))
+
+def in_cap_mask(points, centers, angles, tree_threshold=32):
+    """Returns a mask of points lying within spherical caps around any of the given centers.
+
+    A point is in a cap if the angle between it and the cap center, seen from
+    the origin, is at most the cap's angular radius. With few caps this is one
+    matrix of dot products; with more than `tree_threshold` caps, KD-trees
+    over the points and the centers are used to find only the nearby pairs.
+
+    Parameters
+    ----------
+    points : np.ndarray (n, 3)
+        Points to test, relative to the center of the sphere
+    centers : np.ndarray (m, 3)
+        Directions of the cap centers
+    angles : float or np.ndarray (m,)
+        Angular radius of each cap (radians)
+    tree_threshold : int, default=32
+        Number of caps above which the KD-tree search is used
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+    angles = np.broadcast_to(np.asarray(angles, dtype=float), (len(centers),))
+    units = points / np.linalg.norm(points, axis=1)[:, None]
+    centers = centers / np.linalg.norm(centers, axis=1)[:, None]
+    if len(centers) == 0:
+        return np.zeros(len(points), dtype=bool)
+
+    if len(centers) <= tree_threshold:
+        return np.any(np.dot(units, centers.T) >= np.cos(angles), axis=1)
+
+    # Angles of up to pi map to chord lengths of up to 2 between unit vectors
+    chords = 2.0 * np.sin(np.minimum(angles, np.pi) / 2.0)
+    pairs = cKDTree(units).sparse_distance_matrix(cKDTree(centers), chords.max() + 1e-12,
+                                                  output_type='ndarray')
+    inside = pairs['v'] <= chords[pairs['j']] + 1e-12
+    mask = np.zeros(len(points), dtype=bool)
+    mask[pairs['i'][inside]] = True
+
+    return mask
+
+class PatchPattern(CoatingPattern):
+    """A nanoparticle coating pattern where points are removed from spherical caps around any number of patch centers.
+
+    Parameters
+    ----------
+    chain_density : float
+        Density of chain coating on the nanoparticle (chains / nm^2)
+    radius : float
+        Radius of the nanoparticle (nm)
+    centers : np.ndarray (m, 3)
+        Directions of the patch centers from the center of the nanoparticle, at least one
+    angles : float or np.ndarray (m,), optional, default=None
+        Angular radius of each patch (radians)
+    fractional_sa : float or np.ndarray (m,), default=0.2
+        Fractional surface area of the nanoparticle to exclude coating, used if
+        `angles` is not given. A float is split evenly between the patches; an
+        array gives the fraction of each patch.
+    tree_threshold : int, default=32
+        Number of patches above which a KD-tree is used to find the points in each patch
+    """
+    def __init__(self, chain_density, radius, centers, angles=None, fractional_sa=0.2, tree_threshold=32, **args):
+        lattice = isotropic_lattice(chain_density, radius)
+        self.centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+        if len(self.centers) == 0:
+            raise ValueError("A patch pattern needs at least one patch center.")
+        if angles is None:
+            if np.ndim(fractional_sa) == 0:
+                fractional_sa = fractional_sa / len(self.centers)
+            angles = cap_angle(fractional_sa)
+        self.angles = np.broadcast_to(np.asarray(angles, dtype=float), (len(self.centers),))
+
+        # Points inside the patches are removed; the remaining points are coated.
+        mask = ~in_cap_mask(lattice, self.centers, self.angles, tree_threshold)
+
+        super(PatchPattern, self).__init__(lattice, mask)
+
+if __name__ == "__main__":
+    from cgnp_patchy.lib.patterns.coating_pattern import fibonacci_sphere
+    patch_pattern = PatchPattern(3.0, 5.0, fibonacci_sphere(100), fractional_sa=0.3)
@@ -1,29 +1,126 @@
 from __future__ import division
 
-import mbuild as mb
 import numpy as np
+from scipy.spatial import cKDTree
 
+from cgnp_patchy.lib.patterns.coating_pattern import CoatingPattern, isotropic_lattice
+from cgnp_patchy.lib.utils.rng import as_random_state
 
-class RandomPattern(mb.Pattern):
+def _greedy_independent_set(n, pairs):
+    """Returns a mask of the points kept by a greedy pass in index order, where a
+    point is dropped if it is paired with a point kept before it.
+
+    The pass is resolved in vectorized rounds: a point is kept once none of
+    its lower-index partners are undecided or kept.
+
+    Parameters
+    ----------
+    n : int
+        Number of points
+    pairs : np.ndarray (m, 2)
+        Index pairs (i, j) with i < j of points that exclude each other
+    """
+    undecided = np.ones(n, dtype=bool)
+    kept = np.zeros(n, dtype=bool)
+    first, second = pairs[:, 0], pairs[:, 1]
+    while undecided.any():
+        waiting = np.zeros(n, dtype=bool)
+        waiting[second[undecided[first]]] = True
+        newly_kept = undecided & ~waiting
+        kept |= newly_kept
+        undecided &= ~newly_kept
+        # Partners of kept points are dropped
+        undecided[second[kept[first]]] = False
+        pairs = pairs[undecided[second]]
+        first, second = pairs[:, 0], pairs[:, 1]
+
+    return kept
+
+def poisson_disk_sphere(n, radius, min_separation, random_state=None, max_oversample=64):
+    """Draws `n` random points on a sphere with no two points closer than `min_separation` (Poisson-disk sampling).
+
+    Uniform candidates are drawn in batches and accepted greedily in their
+    random order. Each batch is first checked against the points already
+    accepted with a KD-tree query, and the pairs within the remaining
+    candidates are found with a second KD-tree, so the cost grows as
+    O(n log n).
+
+    Parameters
+    ----------
+    n : int
+        Number of points
+    radius : float
+        Radius of the sphere (nm)
+    min_separation : float
+        Minimum straight-line distance between points (nm)
+    random_state : np.random.RandomState, optional, default=None
+        Random number generator, or a seed for one (see `as_random_state`)
+    max_oversample : int, default=64
+        Maximum number of candidates drawn per point before giving up
+    """
+    random_state = as_random_state(random_state)
+    accepted = np.empty((0, 3))
+    n_drawn = 0
+    acceptance = 0.5
+    while len(accepted) < n:
+        if n_drawn > max_oversample * n:
+            raise Exception("Could not place {} points at least {} nm apart on a sphere of radius {}. "
+                            "Try a smaller minimum separation.".format(n, min_separation, radius))
+        # Size the batch from the last acceptance rate so few batches are needed
+        batch = max(int(1.5 * (n - len(accepted)) / max(acceptance, 1.0 / max_oversample)), 64)
+        n_drawn += batch
+        candidates = random_state.standard_normal((batch, 3))
+        candidates *= radius / np.linalg.norm(candidates, axis=1)[:, None]
+        if len(accepted):
+            dists, _ = cKDTree(accepted).query(candidates, k=1, distance_upper_bound=min_separation)
+            candidates = candidates[np.isinf(dists)]
+        pairs = cKDTree(candidates).query_pairs(min_separation, output_type='ndarray')
+        kept = _greedy_independent_set(len(candidates), pairs)
+        accepted = np.concatenate([accepted, candidates[kept]])
+        acceptance = np.count_nonzero(kept) / batch
+
+    return accepted[:n]
+
+class RandomPattern(CoatingPattern):
     """A nanoparticle coating pattern where points are distributed semi-randomly.
 
+    By default a fifth of the points of an isotropic lattice five times denser
+    than the coating are kept at random. With mode='poisson', points are drawn
+    by Poisson-disk sampling instead, so they are random but never closer than
+    a minimum separation.
+
     Parameters
     ----------
     chain_density : float
         Density of chain coating on the nanoparticle (chains / nm^2)
     radius : float
         Radius of the nanoparticle (nm)
-    seed : int, optional, default=12345
-        Seed for the random number generator
+    seed : int, np.random.SeedSequence or np.random.RandomState, optional, default=12345
+        Seed for the random number generator, or the generator itself. NumPy's
+        global random state is not used.
+    mode : str, optional, default='lattice'
+        'lattice' to select points from a dense lattice, or 'poisson' for Poisson-disk sampling
+    min_separation : float, optional, default=None
+        Minimum distance between points in 'poisson' mode (nm). Defaults to 0.7
+        times the square root of the surface area per point.
     """
-    def __init__(self, chain_density, radius, seed=12345, **args):
-        np.random.seed(12345)
-        pattern = mb.SpherePattern(int(chain_density * 20.0 * np.pi * radius**2.0))
-        pattern.scale(radius)
-        np.random.shuffle(pattern.points)
-        points = pattern.points[:int(len(pattern.points)/5)]
-
-        super(RandomPattern, self).__init__(points=points, orientations=None)
+    def __init__(self, chain_density, radius, seed=12345, mode='lattice', min_separation=None, **args):
+        if mode == 'lattice':
+            lattice = isotropic_lattice(5.0 * chain_density, radius)
+            order = as_random_state(seed).permutation(len(lattice))
+            mask = np.zeros(len(lattice), dtype=bool)
+            mask[order[:int(len(lattice)/5)]] = True
+        elif mode == 'poisson':
+            n = int(chain_density * 4.0 * np.pi * radius**2.0)
+            if min_separation is None:
+                min_separation = 0.7 * np.sqrt(4.0 * np.pi * radius**2.0 / max(n, 1))
+            lattice = poisson_disk_sphere(n, radius, min_separation, as_random_state(seed))
+            mask = None
+        else:
+            raise Exception("Random pattern mode '{}' not supported. Valid options are 'lattice' and 'poisson'.".format(mode))
+        self.min_separation = min_separation
+
+        super(RandomPattern, self).__init__(lattice, mask)
 
 if __name__ == "__main__":
     from save_pattern import save_pattern 
@@ -1,8 +1,9 @@
 from __future__ import division
 
-import mbuild as mb
 import numpy as np
 
+from cgnp_patchy.lib.patterns.coating_pattern import CoatingPattern, in_box_mask, isotropic_lattice
+
 
 def cartesian_to_spherical(origin=None, pos=None):
     """ Converts cartesian coordinates to spherical coordinates
@@ -62,7 +63,7 @@ def spherical_to_cartesian(pos=None):
 
     return np.array((x, y, z))
 
-class RingPattern(mb.Pattern):
+class RingPattern(CoatingPattern):
     """A nanoparticle coating pattern where points are removed from three poles. This is the tetrahedral pattern without the top patch.
 
     Parameters
@@ -75,50 +76,22 @@ class RingPattern(mb.Pattern):
         Fractional surface area of the nanoparticle to exclude coating (nm^2)
     """
     def __init__(self, chain_density, radius, fractional_sa, **args):
-        
-        pattern = mb.SpherePattern(int(chain_density * 4.0 * np.pi * radius**2.0))
-        pattern.scale(radius)
+        lattice = isotropic_lattice(chain_density, radius)
         total_sa = 4.0 * np.pi * radius**2.0
         patch_sa = total_sa * fractional_sa
-        patch_cutoff = np.sqrt((patch_sa)/(4*np.pi)) 
-        #cutoff = patch_sa / (8 * np.pi * radius)
-        cutoff = patch_cutoff 
+        patch_cutoff = np.sqrt((patch_sa)/(4*np.pi))
 
-        #spherical_points = cartesian_to_spherical(pos=pattern.points)
-        
         bottom_patch1 = np.array((radius, 0, (0 + (109.5 * np.pi / 180))))
         bottom_patch2 = np.array((radius, (120 * np.pi / 180), bottom_patch1[2]))
         bottom_patch3 = np.array((radius, bottom_patch2[1] + (120 * np.pi / 180), bottom_patch1[2]))
 
-        bottom_patch1_cartesian = spherical_to_cartesian(pos=bottom_patch1)
-        bottom_patch2_cartesian = spherical_to_cartesian(pos=bottom_patch2)
-        bottom_patch3_cartesian = spherical_to_cartesian(pos=bottom_patch3)
-       
-        points = []
-
-        '''
-        for xyz in pattern.points:
-            if xyz[0] > top_patch_cartesian[0]-patch_cutoff and xyz[0] < top_patch_cartesian[0]+patch_cutoff and xyz[1] > top_patch_cartesian[1]-patch_cutoff and xyz[1] < top_patch_cartesian[1]+patch_cutoff and xyz[2] > top_patch_cartesian[2]-patch_cutoff and xyz[2] < top_patch_cartesian[2]+patch_cutoff:
-                points.append(xyz)
-        '''
-        for xyz in pattern.points:
-            if xyz[0] > bottom_patch1_cartesian[0]-patch_cutoff and xyz[0] < bottom_patch1_cartesian[0]+patch_cutoff and xyz[1] > bottom_patch1_cartesian[1]-patch_cutoff and xyz[1] < bottom_patch1_cartesian[1]+patch_cutoff and xyz[2] > bottom_patch1_cartesian[2]-patch_cutoff and xyz[2] < bottom_patch1_cartesian[2]+patch_cutoff:
-                points.append(xyz)
-
-        for xyz in pattern.points:
-            if xyz[0] > bottom_patch2_cartesian[0]-patch_cutoff and xyz[0] < bottom_patch2_cartesian[0]+patch_cutoff and xyz[1] > bottom_patch2_cartesian[1]-patch_cutoff and xyz[1] < bottom_patch2_cartesian[1]+patch_cutoff and xyz[2] > bottom_patch2_cartesian[2]-patch_cutoff and xyz[2] < bottom_patch2_cartesian[2]+patch_cutoff:
-                points.append(xyz)
-
-        for xyz in pattern.points:
-            if xyz[0] > bottom_patch3_cartesian[0]-patch_cutoff and xyz[0] < bottom_patch3_cartesian[0]+patch_cutoff and xyz[1] > bottom_patch3_cartesian[1]-patch_cutoff and xyz[1] < bottom_patch3_cartesian[1]+patch_cutoff and xyz[2] > bottom_patch3_cartesian[2]-patch_cutoff and xyz[2] < bottom_patch3_cartesian[2]+patch_cutoff:
-                points.append(xyz)
-        
-        reverse_pattern = []
-        for point in pattern:
-            if not np.all(np.isin(point, points)):
-                    reverse_pattern.append(point)
+        centers = np.array([spherical_to_cartesian(pos=patch) for patch in
+                            (bottom_patch1, bottom_patch2, bottom_patch3)])
+
+        # Points inside the patches are removed; the remaining points are coated.
+        mask = ~in_box_mask(lattice, centers, patch_cutoff)
 
-        super(RingPattern, self).__init__(points=reverse_pattern, orientations=None)
+        super(RingPattern, self).__init__(lattice, mask)
 
 
 if __name__ == "__main__":
@@ -1,10 +1,11 @@
 from __future__ import division
 
-import mbuild as mb
 import numpy as np
 
+from cgnp_patchy.lib.patterns.coating_pattern import CoatingPattern, isotropic_lattice
 
-class SquarePattern(mb.Pattern):
+
+class SquarePattern(CoatingPattern):
     """A nanoparticle coating pattern where points are removed from two opposite poles on two axes.
 
     Parameters
@@ -17,15 +18,13 @@ class SquarePattern(mb.Pattern):
         Fractional surface area of the nanoparticle to exclude coating (nm^2)
     """
     def __init__(self, chain_density, radius, fractional_sa, **args):
-        pattern = mb.SpherePattern(int(chain_density * 4.0 * np.pi * radius**2.0))
-        pattern.scale(radius)
+        lattice = isotropic_lattice(chain_density, radius)
         total_sa = 4.0 * np.pi * radius**2.0
         patch_sa = total_sa * fractional_sa
         cutoff = patch_sa / (8 * np.pi * radius)
-        points = np.array([xyz for xyz in pattern.points if xyz[2] < radius-cutoff
-                           and xyz[2] > cutoff-radius and xyz[1] < radius-cutoff
-                           and xyz[1] > cutoff-radius])
-        super(SquarePattern, self).__init__(points=points, orientations=None)
+        yz = lattice[:, 1:]
+        mask = np.all((yz < radius-cutoff) & (yz > cutoff-radius), axis=1)
+        super(SquarePattern, self).__init__(lattice, mask)
 
 if __name__ == "__main__":
     from save_pattern import save_pattern
@@ -1,8 +1,9 @@
 from __future__ import division
 
-import mbuild as mb
 import numpy as np
 
+from cgnp_patchy.lib.patterns.coating_pattern import CoatingPattern, in_box_mask, isotropic_lattice
+
 def cartesian_to_spherical(origin=None, pos=None):
     """ Converts cartesian coordinates to spherical coordinates.
 
@@ -74,7 +75,7 @@ def spherical_to_cartesian(pos=None):
 
     return np.array((x, y, z))
 
-class TetrahedralPattern(mb.Pattern):
+class TetrahedralPattern(CoatingPattern):
     """A nanoparticle coating pattern where points are removed from four poles.
 
     Parameters
@@ -87,163 +88,23 @@ class TetrahedralPattern(mb.Pattern):
         Fractional surface area of the nanoparticle to exclude coating (nm^2)
     """
     def __init__(self, chain_density, radius, fractional_sa, **args):
-        
-        pattern = mb.SpherePattern(int(chain_density * 4.0 * np.pi * radius**2.0))
-        pattern.scale(radius)
+        lattice = isotropic_lattice(chain_density, radius)
         total_sa = 4.0 * np.pi * radius**2.0
         patch_sa = total_sa * fractional_sa
-        patch_cutoff = np.sqrt((patch_sa)/(4*np.pi)) 
-        #cutoff = patch_sa / (8 * np.pi * radius)
-        cutoff = patch_cutoff 
+        patch_cutoff = np.sqrt((patch_sa)/(4*np.pi))
 
-        #spherical_points = cartesian_to_spherical(pos=pattern.points)
-        
         top_patch = np.array((radius, 0, 0))
         bottom_patch1 = np.array((radius, 0, (top_patch[2] + (109.5 * np.pi / 180))))
         bottom_patch2 = np.array((radius, (120 * np.pi / 180), bottom_patch1[2]))
         bottom_patch3 = np.array((radius, bottom_patch2[1] + (120 * np.pi / 180), bottom_patch1[2]))
 
-        top_patch_cartesian = spherical_to_cartesian(pos=top_patch)
-        bottom_patch1_cartesian = spherical_to_cartesian(pos=bottom_patch1)
-        bottom_patch2_cartesian = spherical_to_cartesian(pos=bottom_patch2)
-        bottom_patch3_cartesian = spherical_to_cartesian(pos=bottom_patch3)
- 
-        points = []
-
-        for xyz in pattern.points:
-            if xyz[0] > top_patch_cartesian[0]-patch_cutoff and xyz[0] < top_patch_cartesian[0]+patch_cutoff and xyz[1] > top_patch_cartesian[1]-patch_cutoff and xyz[1] < top_patch_cartesian[1]+patch_cutoff and xyz[2] > top_patch_cartesian[2]-patch_cutoff and xyz[2] < top_patch_cartesian[2]+patch_cutoff:
-                points.append(xyz)
-
-        for xyz in pattern.points:
-            if xyz[0] > bottom_patch1_cartesian[0]-patch_cutoff and xyz[0] < bottom_patch1_cartesian[0]+patch_cutoff and xyz[1] > bottom_patch1_cartesian[1]-patch_cutoff and xyz[1] < bottom_patch1_cartesian[1]+patch_cutoff and xyz[2] > bottom_patch1_cartesian[2]-patch_cutoff and xyz[2] < bottom_patch1_cartesian[2]+patch_cutoff:
-                points.append(xyz)
-
-        for xyz in pattern.points:
-            if xyz[0] > bottom_patch2_cartesian[0]-patch_cutoff and xyz[0] < bottom_patch2_cartesian[0]+patch_cutoff and xyz[1] > bottom_patch2_cartesian[1]-patch_cutoff and xyz[1] < bottom_patch2_cartesian[1]+patch_cutoff and xyz[2] > bottom_patch2_cartesian[2]-patch_cutoff and xyz[2] < bottom_patch2_cartesian[2]+patch_cutoff:
-                points.append(xyz)
-
-        for xyz in pattern.points:
-            if xyz[0] > bottom_patch3_cartesian[0]-patch_cutoff and xyz[0] < bottom_patch3_cartesian[0]+patch_cutoff and xyz[1] > bottom_patch3_cartesian[1]-patch_cutoff and xyz[1] < bottom_patch3_cartesian[1]+patch_cutoff and xyz[2] > bottom_patch3_cartesian[2]-patch_cutoff and xyz[2] < bottom_patch3_cartesian[2]+patch_cutoff:
-                points.append(xyz)
-
-
-        '''for xyz in pattern.points:
-            if xyz[0] < (cutoff-radius)-top_patch_cartesian[0] and xyz[1] < (cutoff-radius)-top_patch_cartesian[1] and xyz[2] < (cutoff-radius)-top_patch_cartesian[2]:
-                points.append(xyz)
-            else:
-                continue
-
-
-        for xyz in pattern.points:
-            if xyz[0] > (cutoff-radius)-top_patch_cartesian[0]: # or xyz[0] > cutoff-top_patch_cartesian[0]:
-                if xyz[1] > (cutoff-radius)-top_patch_cartesian[1]: # or xyz[1] > cutoff-top_patch_cartesian[1]:
-                    if xyz[2] > (cutoff-radius)-top_patch_cartesian[2]: # or xyz[2] > cutoff-top_patch_cartesian[2]:
-                        points.append(xyz)
-                    else:
-                        continue
-                else:
-                    continue
-            else:
-                continue
-
-
-        for xyz in pattern.points:
-            if xyz[0] < (cutoff)-bottom_patch1_cartesian[0] and xyz[1] < (cutoff)-bottom_patch1_cartesian[1] and xyz[2] < (cutoff)-bottom_patch1_cartesian[2]:
-                points.append(xyz)
-            else:
-                continue
-        
-        for xyz in pattern.points:
-            if xyz[0] < (cutoff-radius)-bottom_patch1_cartesian[0]:# or xyz[0] > cutoff-bottom_patch1_cartesian[0]:
-                if xyz[1] < (cutoff-radius)-bottom_patch1_cartesian[1]: # or xyz[1] > cutoff-bottom_patch1_cartesian[1]:
-                    if xyz[2] < (cutoff-radius)-bottom_patch1_cartesian[2]: # or xyz[2] > cutoff-bottom_patch1_cartesian[2]:
-                        points.append(xyz)
-                    else:
-                        continue
-                else:
-                    continue
-            else:
-                continue
-
-        for xyz in pattern.points:
-            if xyz[0] > (cutoff-radius)-bottom_patch1_cartesian[0]:# or xyz[0] > cutoff-bottom_patch1_cartesian[0]:
-                if xyz[1] > (cutoff-radius)-bottom_patch1_cartesian[1]: # or xyz[1] > cutoff-bottom_patch1_cartesian[1]:
-                    if xyz[2] > (cutoff-radius)-bottom_patch1_cartesian[2]: # or xyz[2] > cutoff-bottom_patch1_cartesian[2]:
-                        points.append(xyz)
-                    else:
-                        continue
-                else:
-                    continue
-            else:
-                continue
-
-        for xyz in pattern.points:
-            if xyz[0] < (cutoff)-bottom_patch2_cartesian[0] and xyz[1] < (cutoff)-bottom_patch2_cartesian[1] and xyz[2] < (cutoff)-bottom_patch2_cartesian[2]:
-                points.append(xyz)
-            else:
-                continue
-
-        for xyz in pattern.points:
-            if xyz[0] < (cutoff-radius)-bottom_patch2_cartesian[0]: # or xyz[0] > cutoff-bottom_patch2_cartesian[0]:
-                if xyz[1] < (cutoff-radius)-bottom_patch2_cartesian[1]: # or xyz[1] > cutoff-bottom_patch2_cartesian[1]:
-                    if xyz[2] < (cutoff-radius)-bottom_patch2_cartesian[2]: # or xyz[2] > cutoff-bottom_patch2_cartesian[2]:
-                        points.append(xyz)
-                    else:
-                        continue
-                else:
-                    continue
-            else:
-                continue
-
-        for xyz in pattern.points:
-            if xyz[0] > (cutoff-radius)-bottom_patch2_cartesian[0]:# or xyz[0] > cutoff-bottom_patch1_cartesian[0]:
-                if xyz[1] > (cutoff-radius)-bottom_patch2_cartesian[1]: # or xyz[1] > cutoff-bottom_patch1_cartesian[1]:
-                    if xyz[2] > (cutoff-radius)-bottom_patch2_cartesian[2]: # or xyz[2] > cutoff-bottom_patch1_cartesian[2]:
-                        points.append(xyz)
-                    else:
-                        continue
-                else:
-                    continue
-            else:
-                continue
-
-        for xyz in pattern.points:
-            if xyz[0] > (cutoff-radius)-bottom_patch3_cartesian[0]: # or xyz[0] > cutoff-bottom_patch3_cartesian[0]:
-                if xyz[1] > (cutoff-radius)-bottom_patch3_cartesian[1]: # or xyz[1] > cutoff-bottom_patch3_cartesian[1]:
-                    if xyz[2] > (cutoff-radius)-bottom_patch3_cartesian[2]: # or xyz[2] > cutoff-bottom_patch3_cartesian[2]:
-                        points.append(xyz)
-                    else:
-                        continue
-                else:
-                    continue
-            else:
-                continue
-
-        for xyz in pattern.points:
-            if xyz[0] < (cutoff-radius)-bottom_patch3_cartesian[0]: # or xyz[0] > cutoff-bottom_patch3_cartesian[0]:
-                if xyz[1] < (cutoff-radius)-bottom_patch3_cartesian[1]: # or xyz[1] > cutoff-bottom_patch3_cartesian[1]:
-                    if xyz[2] < (cutoff-radius)-bottom_patch3_cartesian[2]: # or xyz[2] > cutoff-bottom_patch3_cartesian[2]:
-                        points.append(xyz)
-                    else:
-                        continue
-                else:
-                    continue
-            else:
-                continue
-        
-        for xyz in pattern.points:
-            if xyz[0] < (cutoff)-bottom_patch3_cartesian[0] and xyz[1] < (cutoff)-bottom_patch3_cartesian[1] and xyz[2] < (cutoff)-bottom_patch3_cartesian[2]:
-                points.append(xyz)
-            else:
-                continue'''
-       
-        # This pattern was written backwards, meaning that it returned the patches instead of everything but the patches. The code below is a temporary way to fix this until the math can be altered.
-        reverse_pattern = []
-        for point in pattern:
-            if not np.all(np.isin(point, points)):
-                reverse_pattern.append(point)
-
-        super(TetrahedralPattern, self).__init__(points=reverse_pattern, orientations=None)
+        centers = np.array([spherical_to_cartesian(pos=patch) for patch in
+                            (top_patch, bottom_patch1, bottom_patch2, bottom_patch3)])
+
+        # Points inside the patches are removed; the remaining points are coated.
+        mask = ~in_box_mask(lattice, centers, patch_cutoff)
+
+        super(TetrahedralPattern, self).__init__(lattice, mask)
 
 
 if __name__ == "__main__":
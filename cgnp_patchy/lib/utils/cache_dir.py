@@ -0,0 +1,13 @@
+import os
+
+def cache_dir():
+    ''' Returns the directory used for on-disk caches, creating it if needed.
+
+    The location is taken from the CGNP_PATCHY_CACHE_DIR environment variable
+    and defaults to ~/.cache/cgnp_patchy.
+    '''
+    path = os.environ.get('CGNP_PATCHY_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'cgnp_patchy'))
+    os.makedirs(path, exist_ok=True)
+
+    return path
@@ -1,8 +1,14 @@
 import mbuild as mb
 import numpy as np
 from cgnp_patchy.lib.patterns import *
+from cgnp_patchy.lib.patterns.coating_pattern import isotropic_lattice
 from cgnp_patchy.lib.utils.save_pattern import save_pattern
 
+def _row_view(points):
+    """ Views each row of a point array as a single value so whole points can be compared. """
+    points = np.ascontiguousarray(points, dtype=float).reshape(-1, 3)
+    return points.view(np.dtype((np.void, points.dtype.itemsize * 3))).ravel()
+
 def count_patch_points(pattern, radius, chain_density):
     ''' Counts and returns the amount of points that are being removed in a certain nanoparticle coating pattern.
 
@@ -15,12 +21,11 @@ def count_patch_points(pattern, radius, chain_density):
     chain_density : float
         Density of chains on the nanoparticle surface
     '''
-    isotropic_pattern = mb.SpherePattern(int(chain_density*4.0*np.pi*radius**2))
-    isotropic_pattern.scale(radius)
-     
-    patch = []
-    for point in isotropic_pattern.points:
-        if not np.all(np.isin(point, pattern.points)):
-            patch.append(point)
+    if isinstance(pattern, CoatingPattern):
+        return len(pattern.removed_indices)
+
+    # Patterns not built on the shared lattice are matched point by point.
+    lattice = isotropic_lattice(chain_density, radius)
+    kept = np.isin(_row_view(lattice), _row_view(pattern.points))
 
-    return len(patch)
+    return int(np.count_nonzero(~kept))
@@ -0,0 +1,120 @@
+import itertools
+
+import mbuild as mb
+import numpy as np
+
+from cgnp_patchy.lib.utils.particle_array import ParticleArray
+
+def _ragged_arange(starts, counts):
+    ''' Concatenates np.arange(start, start + count) for each start and count. '''
+    total = counts.sum()
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+
+    return offsets + np.arange(total)
+
+def neighbor_pairs(xyz, lengths, cutoff, labels=None):
+    ''' Finds every pair of points closer than a cutoff in a periodic box, using a cell list.
+
+    The box is split into cells at least `cutoff` wide, so each point is only
+    compared with the points of its own and the neighboring cells. All points
+    are binned at once and every pair of neighboring cells is checked with
+    array operations, one cell offset at a time. Only the nearest periodic
+    image of each pair is considered, so `cutoff` should be under half of the
+    box lengths.
+
+    Parameters
+    ----------
+    xyz : np.ndarray (n, 3)
+        Positions
+    lengths : np.ndarray (3,)
+        Periodic box lengths
+    cutoff : float
+        Largest distance of a pair
+    labels : np.ndarray (n,), optional, default=None
+        Label of each point, e.g. its molecule id. Pairs with the same label are skipped.
+
+    Returns
+    -------
+    pairs : np.ndarray (m, 2)
+        Indices (i < j) of each pair
+    vectors : np.ndarray (m, 3)
+        Minimum image vector from the second point of each pair to the first
+    '''
+    xyz = np.asarray(xyz, dtype=float).reshape(-1, 3)
+    lengths = np.asarray(lengths, dtype=float)
+    if len(xyz) == 0:
+        return np.empty((0, 2), dtype=np.int64), np.empty((0, 3))
+
+    # Only occupied cells are stored, so sparse systems do not need a dense grid.
+    # Axes too short for 3 cells get a single cell, where every point is a neighbor.
+    n_cells = np.floor(lengths / cutoff).astype(np.int64)
+    n_cells[n_cells < 3] = 1
+    cells = np.floor(xyz / lengths * n_cells).astype(np.int64) % n_cells
+    order = np.argsort(np.ravel_multi_index(cells.T, n_cells), kind='stable')
+    occupied, starts, counts = np.unique(np.ravel_multi_index(cells[order].T, n_cells),
+                                         return_index=True, return_counts=True)
+
+    # Half of the neighboring offsets, so each pair of cells is visited once
+    axes = [[-1, 0, 1] if n >= 3 else [0] for n in n_cells]
+    offsets = [offset for offset in itertools.product(*axes) if offset > (0, 0, 0)]
+
+    pairs, vectors = [], []
+    points = np.arange(len(xyz))
+    for offset in [(0, 0, 0)] + offsets:
+        # Each point against every point of the neighboring cell at this offset
+        neighbor = np.ravel_multi_index(((cells + offset) % n_cells).T, n_cells)
+        index = np.minimum(np.searchsorted(occupied, neighbor), len(occupied) - 1)
+        n_neighbors = np.where(occupied[index] == neighbor, counts[index], 0)
+        i = np.repeat(points, n_neighbors)
+        j = order[_ragged_arange(starts[index], n_neighbors)]
+        keep = i < j if offset == (0, 0, 0) else i != j
+        if labels is not None:
+            keep &= labels[i] != labels[j]
+        i, j = i[keep], j[keep]
+        # Each pair as (lower index, higher index)
+        i, j = np.minimum(i, j), np.maximum(i, j)
+        d = xyz[i] - xyz[j]
+        d -= lengths * np.round(d / lengths)
+        close = np.einsum('ij,ij->i', d, d) < cutoff**2
+        pairs.append(np.column_stack((i, j))[close])
+        vectors.append(d[close])
+
+    return np.concatenate(pairs), np.concatenate(vectors)
+
+def find_overlaps(system, cutoff=0.5, periodicity=None, same_molecule=False):
+    ''' Finds pairs of beads of different molecules closer than a cutoff, using
+    the periodic cell list of `neighbor_pairs`.
+
+    Parameters
+    ----------
+    system : ParticleArray or mb.Compound
+        System to check, e.g. a PatchyBox. Each top-level child of a compound is taken as one molecule.
+    cutoff : float, default=0.5
+        Beads closer than this are overlapping (nm). The default is the buffer
+        added to the exclusion diameters of `PatchyBox`.
+    periodicity : np.ndarray (3,), optional, default=None
+        Periodic box lengths (nm). Defaults to the periodicity of the system,
+        or a box around the beads large enough to have no periodic images.
+    same_molecule : bool, default=False
+        Also report overlaps between beads of the same molecule (nanoparticle)
+
+    Returns
+    -------
+    np.ndarray (m, 2)
+        Indices (i < j) of the overlapping pairs, sorted
+    '''
+    if isinstance(system, mb.Compound):
+        system = ParticleArray.from_compound(system, molecule_id=None)
+    xyz = system.xyz
+    if periodicity is None:
+        periodicity = system.periodicity
+    if periodicity is None or not np.all(np.asarray(periodicity) > 0):
+        xyz = xyz - xyz.min(axis=0)
+        periodicity = xyz.max(axis=0) + 2 * cutoff
+    lengths = np.asarray(periodicity, dtype=float)
+
+    labels = None if same_molecule else system.molecule_id
+    pairs, vectors = neighbor_pairs(xyz, lengths, cutoff, labels)
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+
+    return pairs[order]
@@ -0,0 +1,150 @@
+import hashlib
+from collections import OrderedDict
+
+import mbuild as mb
+import numpy as np
+from cgnp_patchy.lib.utils.particle_array import ParticleArray
+from cgnp_patchy.lib.utils.transforms import rotations_between, transform_points
+
+# Maximum number of chain templates kept by `_chain_template`
+TEMPLATE_CACHE_SIZE = 64
+_template_cache = OrderedDict()
+
+def _prototype_key(chain, port_name='up'):
+    ''' Returns a hash of the particles, bonds and graft port of a chain prototype.
+
+    Coordinates are taken relative to the prototype's center and rounded, so
+    translated copies of the same prototype share a key.
+    '''
+    particles = list(chain.particles())
+    index = dict((id(particle), i) for i, particle in enumerate(particles))
+    port = chain[port_name]
+    center = chain.center
+    bonds = sorted(tuple(sorted((index[id(a)], index[id(b)]))) for a, b in chain.bonds())
+    digest = hashlib.sha1()
+    digest.update(' '.join(particle.name for particle in particles).encode())
+    # Adding 0.0 turns -0.0 into 0.0 so both hash the same
+    digest.update((np.round(chain.xyz - center, 6) + 0.0).tobytes())
+    digest.update(np.array(bonds, dtype=np.int64).tobytes())
+    digest.update((np.round(np.concatenate([port.center - center, port.direction]), 6) + 0.0).tobytes())
+    digest.update(str(index[id(port.anchor)]).encode())
+
+    return port_name, digest.hexdigest()
+
+def _chain_template(chain, port_name='up'):
+    ''' Returns a port-free copy of a chain prototype with the geometry of its graft port.
+
+    Templates are cached by the content of the prototype, keeping at most
+    TEMPLATE_CACHE_SIZE of the most recently used. The returned template is
+    shared and must not be modified.
+    '''
+    key = _prototype_key(chain, port_name)
+    if key in _template_cache:
+        _template_cache.move_to_end(key)
+        return _template_cache[key]
+
+    template = mb.clone(chain)
+    port = template[port_name]
+    anchor = port.anchor
+    direction = port.direction
+    separation = np.linalg.norm(port.center - anchor.pos)
+    template.remove(port)
+    anchor_index = list(template.particles()).index(anchor)
+
+    _template_cache[key] = template, anchor_index, direction, separation
+    while len(_template_cache) > TEMPLATE_CACHE_SIZE:
+        _template_cache.popitem(last=False)
+
+    return _template_cache[key]
+
+def graft_coordinates(xyz, anchor_index, direction, separation, points, center, radius):
+    ''' Computes the coordinates of a chain grafted radially at every point on a sphere.
+
+    Parameters
+    ----------
+    xyz : np.ndarray (n, 3)
+        Coordinates of the chain prototype
+    anchor_index : int
+        Index of the particle attached to the sphere
+    direction : np.ndarray (3,)
+        Unit vector pointing from the anchor toward the sphere in the prototype
+    separation : float
+        Distance between the anchor and the sphere surface
+    points : np.ndarray (m, 3)
+        Graft sites relative to the center of the sphere
+    center : np.ndarray (3,)
+        Center of the sphere
+    radius : float
+        Radius of the sphere
+
+    Returns
+    -------
+    np.ndarray (m, n, 3)
+        Coordinates of each grafted chain
+    '''
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    normals = points / np.linalg.norm(points, axis=1)[:, None]
+    rotations = rotations_between(direction, -normals)
+    translations = center + normals * (radius + separation)
+
+    return transform_points(xyz - xyz[anchor_index], rotations, translations)
+
+def graft_chains(chain, points, center, radius, port_name='up'):
+    ''' Builds copies of a chain prototype grafted radially to a sphere.
+
+    The chain is placed once and the coordinates of every copy are computed
+    with a single stacked rotation and translation, so no ports are created
+    or consumed per graft site.
+
+    Parameters
+    ----------
+    chain : mb.Compound
+        Prototype of the chain to graft
+    points : np.ndarray (n, 3)
+        Graft sites relative to the center of the sphere
+    center : np.ndarray (3,)
+        Center of the sphere
+    radius : float
+        Radius of the sphere
+    port_name : str, default='up'
+        Label of the port on the chain that attaches to the sphere
+
+    Returns
+    -------
+    chains : list of mb.Compound
+        Grafted copies of the chain
+    anchors : list of mb.Compound
+        The particle of each copy that is attached to the sphere
+    '''
+    template, anchor_index, direction, separation = _chain_template(chain, port_name)
+    coords = graft_coordinates(template.xyz, anchor_index, direction, separation,
+                               points, center, radius)
+
+    chains = []
+    anchors = []
+    for chain_xyz in coords:
+        new_chain = mb.clone(template)
+        new_chain.xyz = chain_xyz
+        chains.append(new_chain)
+        anchors.append(list(new_chain.particles())[anchor_index])
+
+    return chains, anchors
+
+def graft_arrays(chain, points, center, radius, port_name='up'):
+    ''' Builds the chains grafted radially to a sphere as a single ParticleArray.
+
+    Anchor particles are given rigid id 0 so they belong to the rigid body
+    of the core they are grafted to. Parameters are the same as `graft_chains`.
+    '''
+    template, anchor_index, direction, separation = _chain_template(chain, port_name)
+    template = ParticleArray.from_compound(template)
+    coords = graft_coordinates(template.xyz, anchor_index, direction, separation,
+                               points, center, radius)
+    n_chains, n = coords.shape[:2]
+
+    offsets = (np.arange(n_chains) * n)[:, None, None]
+    rigid_id = -np.ones((n_chains, n))
+    rigid_id[:, anchor_index] = 0
+
+    return ParticleArray(coords.reshape(-1, 3), template.types, np.tile(template.typeid, n_chains),
+                         (template.bonds[None, :, :] + offsets).reshape(-1, 2), rigid_id.ravel())
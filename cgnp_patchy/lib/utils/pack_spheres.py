@@ -0,0 +1,201 @@
+import itertools
+
+import numpy as np
+
+from cgnp_patchy.lib.utils.rng import as_random_state
+
+class _CellList(object):
+    ''' A periodic cell list that spheres can be added to one at a time. '''
+    def __init__(self, lengths, cell_size):
+        self.lengths = np.asarray(lengths, dtype=float)
+        self.n_cells = np.maximum(np.floor(self.lengths / cell_size).astype(int), 1)
+        self.cells = {}
+        self.positions = []
+        self.diameters = []
+        offsets = itertools.product(*[[-1, 0, 1] if n > 2 else range(n) for n in self.n_cells])
+        self.offsets = [np.array(offset) for offset in offsets]
+        # Small cell counts are covered by every cell, not just the neighbors
+        self.absolute = self.n_cells <= 2
+
+    def _cell(self, pos):
+        return np.floor(pos / self.lengths * self.n_cells).astype(int) % self.n_cells
+
+    def _neighbors(self, cell):
+        keys = set()
+        for offset in self.offsets:
+            key = np.where(self.absolute, offset, (cell + offset) % self.n_cells)
+            keys.add(tuple(key))
+
+        return keys
+
+    def overlaps(self, pos, diameter):
+        ''' Checks if a sphere overlaps any sphere already in the cell list. '''
+        for key in self._neighbors(self._cell(pos)):
+            for i in self.cells.get(key, ()):
+                d = pos - self.positions[i]
+                d -= self.lengths * np.round(d / self.lengths)
+                if np.dot(d, d) < (0.5 * (diameter + self.diameters[i]))**2:
+                    return True
+
+        return False
+
+    def add(self, pos, diameter):
+        self.cells.setdefault(tuple(self._cell(pos)), []).append(len(self.positions))
+        self.positions.append(pos)
+        self.diameters.append(diameter)
+
+def pack_spheres(lengths, n, diameters, seed=12345, max_attempts=1000, origin=None):
+    ''' Places spheres of several species in a periodic box by random sequential addition.
+
+    Candidate positions are drawn uniformly in the box and accepted if they do
+    not overlap any sphere already placed, using a periodic cell list so each
+    check only looks at neighboring cells. Two spheres overlap if their
+    centers are closer than the mean of their diameters. Larger species are
+    placed first.
+
+    Parameters
+    ----------
+    lengths : np.ndarray (3,)
+        Box lengths (nm)
+    n : list of int
+        Number of spheres of each species
+    diameters : list of float
+        Exclusion diameter of each species (nm)
+    seed : int, np.random.SeedSequence or np.random.RandomState, default=12345
+        Seed for the random number generator, or the generator itself (see `as_random_state`)
+    max_attempts : int, default=1000
+        Maximum number of rejected candidates in a row before giving up
+    origin : np.ndarray (3,), optional, default=None
+        Lower corner of the box. Defaults to the origin.
+
+    Returns
+    -------
+    indices : np.ndarray (N,)
+        Species index of each sphere, ordered by species
+    positions : np.ndarray (N, 3)
+        Position of each sphere
+    '''
+    lengths = np.asarray(lengths, dtype=float)
+    if origin is None:
+        origin = np.zeros(3)
+    random_state = as_random_state(seed)
+    cell_list = _CellList(lengths, max(diameters))
+
+    positions = [None] * len(n)
+    for species in sorted(range(len(n)), key=lambda i: -diameters[i]):
+        placed = np.empty((n[species], 3))
+        for i in range(n[species]):
+            for attempt in range(max_attempts):
+                pos = random_state.random_sample(3) * lengths
+                if not cell_list.overlaps(pos, diameters[species]):
+                    break
+            else:
+                raise Exception("Could not place {} spheres of diameter {} in a box of lengths {} after "
+                                "{} attempts. Try a larger box.".format(n[species], diameters[species],
+                                                                        lengths, max_attempts))
+            cell_list.add(pos, diameters[species])
+            placed[i] = pos
+        positions[species] = placed
+
+    indices = np.repeat(np.arange(len(n)), n)
+
+    return indices, np.concatenate(positions) + origin
+
+def _relax_overlaps(positions, diameters, lengths, tolerance, max_iterations, skin):
+    ''' Pushes overlapping spheres apart until no overlap is larger than `tolerance`
+    (nm). Returns the largest remaining overlap.
+
+    Every overlapping pair is moved apart by half its overlap at each
+    iteration, all pairs at once, plus a small margin so that pairs separate
+    instead of only approaching contact. Pairs are taken from a neighbor list
+    built with a cell list out to the largest contact distance plus `skin`, which is
+    rebuilt once any sphere has moved more than half the skin.
+    '''
+    from cgnp_patchy.lib.utils.find_overlaps import neighbor_pairs
+    n = len(positions)
+    cutoff = diameters.max() + skin
+    margin = 1e-3 * diameters.max()
+    moved = np.full(n, np.inf)
+    worst = np.inf
+    for iteration in range(max_iterations):
+        if moved.max() > 0.5 * skin:
+            pairs, _ = neighbor_pairs(positions, lengths, cutoff)
+            i, j = pairs.T
+            contact = 0.5 * (diameters[i] + diameters[j])
+            moved = np.zeros(n)
+        d = positions[i] - positions[j]
+        d -= lengths * np.round(d / lengths)
+        r = np.sqrt(np.einsum('ij,ij->i', d, d))
+        overlap = contact - r
+        worst = max(overlap.max() if len(overlap) else 0.0, 0.0)
+        if worst <= tolerance:
+            break
+        push = np.where(overlap > 0, 0.5 * (overlap + margin) / np.maximum(r, 1e-12), 0.0)[:, None] * d
+        displacement = np.column_stack([np.bincount(i, push[:, k], minlength=n)
+                                        - np.bincount(j, push[:, k], minlength=n) for k in range(3)])
+        positions += displacement
+        moved += np.sqrt(np.einsum('ij,ij->i', displacement, displacement))
+
+    return worst
+
+def compress_spheres(positions, diameters, lengths, packing_fraction, origin=None, max_strain=0.01,
+                     tolerance=0.0, max_iterations=1000):
+    ''' Compresses a periodic box of spheres to a packing fraction, treating the spheres as soft.
+
+    The box and the sphere positions are scaled down together in small steps;
+    after each step, the overlaps this creates are removed by pushing
+    overlapping spheres apart (see `_relax_overlaps`). Starting from a dilute
+    packing, e.g. from `pack_spheres`, this reaches packing fractions well
+    beyond the ~0.38 at which random sequential addition jams.
+
+    Parameters
+    ----------
+    positions : np.ndarray (N, 3)
+        Sphere positions (nm)
+    diameters : np.ndarray (N,)
+        Diameter of each sphere (nm)
+    lengths : np.ndarray (3,)
+        Box lengths (nm)
+    packing_fraction : float
+        Fraction of the box volume taken by the spheres after compression
+    origin : np.ndarray (3,), optional, default=None
+        Lower corner of the box, kept fixed. Defaults to the origin.
+    max_strain : float, default=0.01
+        Largest relative decrease of the box lengths in one step
+    tolerance : float, default=0.0
+        Largest overlap left between two spheres after each step (nm). By
+        default no spheres overlap, so when they are exclusion spheres, e.g.
+        in `PatchyBox`, the buffer added to their diameters is kept.
+    max_iterations : int, default=1000
+        Maximum number of overlap removal iterations after each step
+
+    Returns
+    -------
+    positions : np.ndarray (N, 3)
+        Sphere positions in the compressed box
+    lengths : np.ndarray (3,)
+        Compressed box lengths
+    '''
+    lengths = np.asarray(lengths, dtype=float)
+    diameters = np.broadcast_to(np.asarray(diameters, dtype=float), (len(positions),))
+    if origin is None:
+        origin = np.zeros(3)
+    positions = (np.asarray(positions, dtype=float) - origin) % lengths
+    volume = np.sum(np.pi / 6.0 * diameters**3)
+    skin = 0.1 * diameters.max()
+
+    while volume / np.prod(lengths) < packing_fraction * (1.0 - 1e-9):
+        strain = max((volume / np.prod(lengths) / packing_fraction)**(1.0/3.0), 1.0 - max_strain)
+        lengths = lengths * strain
+        positions *= strain
+        if np.any(lengths < 2.0 * (diameters.max() + skin)):
+            raise Exception("The box is too small for spheres of diameter {} at packing fraction {}; "
+                            "add more spheres.".format(diameters.max(), packing_fraction))
+        worst = _relax_overlaps(positions, diameters, lengths, tolerance, max_iterations, skin)
+        if worst > tolerance:
+            raise Exception("Could not remove the overlaps after compressing to packing fraction {:.3f} "
+                            "(largest overlap {:.3f} nm). Try a lower packing "
+                            "fraction.".format(volume / np.prod(lengths), worst))
+        positions %= lengths
+
+    return positions + origin, lengths
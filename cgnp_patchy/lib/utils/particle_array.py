@@ -0,0 +1,231 @@
+import mbuild as mb
+import numpy as np
+
+class ParticleArray(object):
+    ''' A lightweight, array-backed collection of particles.
+
+    Positions, types, bonds, rigid body ids and molecule ids are stored in
+    flat NumPy arrays instead of one mb.Compound per particle. Use
+    `to_compound` or `to_parmed` to convert to the full mBuild/ParmEd
+    representations when needed.
+
+    Parameters
+    ----------
+    xyz : np.ndarray (n, 3)
+        Particle positions (nm)
+    types : list of str
+        Unique particle type names
+    typeid : np.ndarray (n,)
+        Index into `types` for each particle
+    bonds : np.ndarray (m, 2), optional, default=None
+        Indices of the bonded particle pairs
+    rigid_id : np.ndarray (n,), optional, default=None
+        Rigid body id of each particle, -1 for particles that are not in a rigid body
+    molecule_id : np.ndarray (n,), optional, default=None
+        Molecule (nanoparticle) id of each particle
+    periodicity : np.ndarray (3,), optional, default=None
+        Periodic box lengths (nm)
+
+    Attributes
+    ----------
+    timings : StageTimer or None
+        Timing report of the build that produced the array, if any
+    '''
+    def __init__(self, xyz, types, typeid, bonds=None, rigid_id=None, molecule_id=None, periodicity=None):
+        self.xyz = np.asarray(xyz, dtype=float).reshape(-1, 3)
+        n = len(self.xyz)
+        self.types = list(types)
+        self.typeid = np.asarray(typeid, dtype=np.int32).reshape(n)
+        if bonds is None:
+            bonds = np.empty((0, 2))
+        self.bonds = np.asarray(bonds, dtype=np.int64).reshape(-1, 2)
+        if rigid_id is None:
+            rigid_id = -np.ones(n)
+        self.rigid_id = np.asarray(rigid_id, dtype=np.int32).reshape(n)
+        if molecule_id is None:
+            molecule_id = np.zeros(n)
+        self.molecule_id = np.asarray(molecule_id, dtype=np.int32).reshape(n)
+        self.periodicity = None if periodicity is None else np.asarray(periodicity, dtype=float)
+        self.timings = None
+
+    @property
+    def n_particles(self):
+        return len(self.xyz)
+
+    @property
+    def n_bonds(self):
+        return len(self.bonds)
+
+    @property
+    def n_molecules(self):
+        return len(np.unique(self.molecule_id))
+
+    @property
+    def names(self):
+        ''' Type name of each particle. '''
+        return np.asarray(self.types)[self.typeid]
+
+    @property
+    def center(self):
+        return self.xyz.mean(axis=0)
+
+    def copy(self):
+        return ParticleArray(self.xyz.copy(), self.types, self.typeid.copy(), self.bonds.copy(),
+                             self.rigid_id.copy(), self.molecule_id.copy(),
+                             None if self.periodicity is None else self.periodicity.copy())
+
+    def translate(self, by):
+        self.xyz += np.asarray(by, dtype=float)
+
+    def translate_to(self, pos):
+        self.translate(np.asarray(pos, dtype=float) - self.center)
+
+    @classmethod
+    def from_compound(cls, compound, molecule_id=0):
+        ''' Converts an mb.Compound to a ParticleArray.
+
+        Parameters
+        ----------
+        compound : mb.Compound
+            Compound to convert
+        molecule_id : int or None, default=0
+            Molecule id given to every particle of the compound. If None, each
+            top-level child of the compound is its own molecule, numbered in
+            order, as for the nanoparticles of a PatchyBox.
+        '''
+        particles = list(compound.particles())
+        index = dict((id(particle), i) for i, particle in enumerate(particles))
+        types = []
+        type_index = {}
+        typeid = np.empty(len(particles), dtype=np.int32)
+        for i, particle in enumerate(particles):
+            if particle.name not in type_index:
+                type_index[particle.name] = len(types)
+                types.append(particle.name)
+            typeid[i] = type_index[particle.name]
+        bonds = [(index[id(a)], index[id(b)]) for a, b in compound.bonds()
+                 if id(a) in index and id(b) in index]
+        rigid_id = [-1 if particle.rigid_id is None else particle.rigid_id for particle in particles]
+        periodicity = compound.periodicity if np.any(compound.periodicity) else None
+        if molecule_id is None:
+            molecule_ids = np.zeros(len(particles), dtype=np.int32)
+            for child_index, child in enumerate(compound.children):
+                for particle in child.particles():
+                    molecule_ids[index[id(particle)]] = child_index
+        else:
+            molecule_ids = np.full(len(particles), molecule_id)
+
+        return cls(compound.xyz, types, typeid, bonds, rigid_id, molecule_ids, periodicity)
+
+    @classmethod
+    def concatenate(cls, arrays, periodicity=None, offset_ids=True):
+        ''' Combines ParticleArrays into one.
+
+        Parameters
+        ----------
+        arrays : list of ParticleArray
+            Arrays to combine, in order
+        periodicity : np.ndarray (3,), optional, default=None
+            Periodic box lengths of the combined array
+        offset_ids : bool, default=True
+            Offset the molecule and rigid body ids of each array so they stay
+            distinct. If False, the ids are kept, e.g. to join parts of one molecule.
+        '''
+        if len(arrays) == 0:
+            return cls(np.empty((0, 3)), [], [], periodicity=periodicity)
+        types = []
+        type_index = {}
+        xyz, typeid, bonds, rigid_id, molecule_id = [], [], [], [], []
+        n_particles = 0
+        n_molecules = 0
+        n_rigid = 0
+        for array in arrays:
+            type_map = np.empty(len(array.types), dtype=np.int32)
+            for i, name in enumerate(array.types):
+                if name not in type_index:
+                    type_index[name] = len(types)
+                    types.append(name)
+                type_map[i] = type_index[name]
+            xyz.append(array.xyz)
+            typeid.append(type_map[array.typeid])
+            bonds.append(array.bonds + n_particles)
+            rigid = array.rigid_id.copy()
+            rigid[rigid >= 0] += n_rigid
+            rigid_id.append(rigid)
+            molecule_id.append(array.molecule_id + n_molecules)
+            n_particles += array.n_particles
+            if offset_ids and array.n_particles:
+                n_molecules += array.molecule_id.max() + 1
+                n_rigid += array.rigid_id.max() + 1 if np.any(array.rigid_id >= 0) else 0
+
+        return cls(np.concatenate(xyz), types, np.concatenate(typeid), np.concatenate(bonds),
+                   np.concatenate(rigid_id), np.concatenate(molecule_id), periodicity)
+
+    def replicate(self, xyz, periodicity=None):
+        ''' Builds a ParticleArray holding copies of this one at new coordinates.
+
+        Each copy gets its own molecule and rigid body ids.
+
+        Parameters
+        ----------
+        xyz : np.ndarray (m, n, 3)
+            Coordinates of each of the m copies
+        periodicity : np.ndarray (3,), optional, default=None
+            Periodic box lengths of the new array
+        '''
+        xyz = np.asarray(xyz, dtype=float).reshape(-1, self.n_particles, 3)
+        copies = np.arange(len(xyz))[:, None]
+        n_molecules = self.molecule_id.max() + 1 if self.n_particles else 0
+        n_rigid = self.rigid_id.max() + 1 if np.any(self.rigid_id >= 0) else 0
+
+        bonds = self.bonds[None, :, :] + (copies * self.n_particles)[:, :, None]
+        rigid_id = np.where(self.rigid_id >= 0, self.rigid_id + copies * n_rigid, -1)
+        molecule_id = self.molecule_id + copies * n_molecules
+
+        return ParticleArray(xyz.reshape(-1, 3), self.types, np.tile(self.typeid, len(xyz)),
+                             bonds.reshape(-1, 2), rigid_id.ravel(), molecule_id.ravel(), periodicity)
+
+    def to_compound(self):
+        ''' Converts the ParticleArray to an mb.Compound with one child per molecule. '''
+        compound = mb.Compound()
+        names = self.names
+        particles = [mb.Particle(name=str(name), pos=pos) for name, pos in zip(names, self.xyz)]
+        for molecule in np.unique(self.molecule_id):
+            molecule_compound = mb.Compound()
+            molecule_compound.add([particles[i] for i in np.flatnonzero(self.molecule_id == molecule)])
+            compound.add(molecule_compound)
+        for i, j in self.bonds:
+            compound.add_bond((particles[i], particles[j]))
+        for particle, rigid in zip(particles, self.rigid_id):
+            particle.rigid_id = None if rigid < 0 else int(rigid)
+        if self.periodicity is not None:
+            compound.periodicity = self.periodicity
+
+        return compound
+
+    def to_parmed(self, **kwargs):
+        ''' Converts the ParticleArray to a parmed.Structure through mb.Compound.to_parmed. '''
+        return self.to_compound().to_parmed(**kwargs)
+
+    def save(self, filename, **kwargs):
+        ''' Saves the ParticleArray. GSD and NumPy .npz files are written directly
+        from the arrays; other formats go through `to_compound` and mb.Compound.save.
+        '''
+        if filename.endswith('.gsd'):
+            from cgnp_patchy.lib.utils.write_gsd import write_gsd
+            write_gsd(filename, self, **kwargs)
+        elif filename.endswith('.npz'):
+            periodicity = np.zeros(0) if self.periodicity is None else self.periodicity
+            np.savez(filename, xyz=self.xyz, types=np.asarray(self.types, dtype=str), typeid=self.typeid,
+                     bonds=self.bonds, rigid_id=self.rigid_id, molecule_id=self.molecule_id,
+                     periodicity=periodicity)
+        else:
+            self.to_compound().save(filename, **kwargs)
+
+    @classmethod
+    def load(cls, filename):
+        ''' Loads a ParticleArray saved to a NumPy .npz file. '''
+        with np.load(filename) as data:
+            periodicity = data['periodicity'] if len(data['periodicity']) else None
+            return cls(data['xyz'], data['types'].tolist(), data['typeid'], data['bonds'],
+                       data['rigid_id'], data['molecule_id'], periodicity)
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+import cgnp_patchy
+from cgnp_patchy.lib.utils.cache_dir import cache_dir
+from cgnp_patchy.lib.utils.particle_array import ParticleArray
+
+# Arrays stored for each particle, with the dtypes ParticleArray uses so they load without a copy
+_FIELDS = (('xyz', np.float64), ('typeid', np.int32), ('bonds', np.int64),
+           ('rigid_id', np.int32), ('molecule_id', np.int32))
+
+# Version of the built particles, part of every key. Bump it whenever a change to the
+# builders (core, patterns, grafting) or to the stored arrays changes what is cached.
+_CACHE_FORMAT = 1
+
+def _json_default(value):
+    # Arrays are listed in full, their repr elides long arrays
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return repr(value)
+
+def particle_key(**params):
+    ''' Returns a hash of build parameters, the package version and the cache format.
+
+    Values must be JSON serializable or NumPy arrays, or are otherwise hashed by their repr.
+    '''
+    params = dict(params, version=cgnp_patchy.__version__, cache_format=_CACHE_FORMAT)
+    text = json.dumps(params, sort_keys=True, default=_json_default)
+
+    return hashlib.sha1(text.encode()).hexdigest()
+
+class ParticleCache(object):
+    ''' A content-addressed, on-disk cache of built particles.
+
+    Each entry is a directory of .npy files holding the positions, types,
+    bonds, rigid body ids and molecule ids of a ParticleArray, loaded
+    memory-mapped and read-only. When the total size of the entries exceeds
+    `max_size`, the least recently used entries are removed.
+
+    Parameters
+    ----------
+    path : str, optional, default=None
+        Directory of the cache. Defaults to 'particles' in `cache_dir()`.
+    max_size : int, default=2**30
+        Maximum total size of the cached arrays (bytes)
+    '''
+    def __init__(self, path=None, max_size=2**30):
+        if path is None:
+            path = os.path.join(cache_dir(), 'particles')
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_size = max_size
+
+    def _entry(self, key):
+        return os.path.join(self.path, key)
+
+    def __contains__(self, key):
+        return os.path.isfile(os.path.join(self._entry(key), 'types.json'))
+
+    def get(self, key):
+        ''' Returns the memory-mapped ParticleArray stored under `key`, or None. '''
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, 'types.json')) as f:
+                meta = json.load(f)
+            arrays = dict((name, np.load(os.path.join(entry, name + '.npy'), mmap_mode='r'))
+                          for name, dtype in _FIELDS)
+        except (OSError, ValueError):
+            return None
+        # Mark the entry as recently used
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+
+        return ParticleArray(arrays['xyz'], meta['types'], arrays['typeid'], arrays['bonds'],
+                             arrays['rigid_id'], arrays['molecule_id'], meta['periodicity'])
+
+    def put(self, key, particles):
+        ''' Stores a ParticleArray under `key` and evicts old entries if the cache is full. '''
+        entry = self._entry(key)
+        tmp = os.path.join(self.path, '.{}.{}'.format(key, uuid.uuid4().hex))
+        os.makedirs(tmp)
+        for name, dtype in _FIELDS:
+            np.save(os.path.join(tmp, name + '.npy'), np.ascontiguousarray(getattr(particles, name), dtype=dtype))
+        periodicity = None if particles.periodicity is None else particles.periodicity.tolist()
+        with open(os.path.join(tmp, 'types.json'), 'w') as f:
+            json.dump({'types': particles.types, 'periodicity': periodicity}, f)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        ''' Returns (key, size, last use) of each entry, least recently used first. '''
+        entries = []
+        for key in os.listdir(self.path):
+            entry = self._entry(key)
+            if key.startswith('.') or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                entries.append((key, size, os.path.getmtime(entry)))
+            except OSError:
+                continue
+
+        return sorted(entries, key=lambda entry: entry[2])
+
+    @property
+    def size(self):
+        return sum(size for key, size, last_use in self.entries())
+
+    def evict(self):
+        ''' Removes the least recently used entries until the cache fits in `max_size`. '''
+        entries = self.entries()
+        total = sum(size for key, size, last_use in entries)
+        for key, size, last_use in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for key, size, last_use in self.entries():
+            shutil.rmtree(self._entry(key), ignore_errors=True)
@@ -0,0 +1,175 @@
+from collections import OrderedDict
+
+import mbuild as mb
+import numpy as np
+
+from cgnp_patchy.lib.utils.particle_array import ParticleArray
+from cgnp_patchy.lib.utils.transforms import rotations_to_quaternions
+
+def _principal_frame(points):
+    ''' Returns the center, principal axes (as columns of a proper rotation) and
+    principal moments of inertia of a set of unit-mass points.
+    '''
+    center = points.mean(axis=0)
+    r = points - center
+    inertia = np.eye(3) * np.sum(r * r) - np.dot(r.T, r)
+    moments, axes = np.linalg.eigh(inertia)
+    if np.linalg.det(axes) < 0:
+        axes[:, 2] *= -1
+
+    return center, axes, moments
+
+def _fit_rotations(template, coords):
+    ''' Finds the rotation of each body that best maps the template onto its
+    centered coordinates (Kabsch algorithm, batched over bodies).
+
+    Parameters
+    ----------
+    template : np.ndarray (k, 3)
+        Body-frame constituent positions
+    coords : np.ndarray (m, k, 3)
+        Centered constituent positions of each body
+    '''
+    H = np.einsum('ki,mkj->mij', template, coords)
+    U, S, Vt = np.linalg.svd(H)
+    V = np.transpose(Vt, (0, 2, 1))
+    d = np.sign(np.linalg.det(np.matmul(V, np.transpose(U, (0, 2, 1)))))
+    D = np.zeros((len(H), 3, 3))
+    D[:, 0, 0] = 1.0
+    D[:, 1, 1] = 1.0
+    D[:, 2, 2] = d
+
+    return np.matmul(np.matmul(V, D), np.transpose(U, (0, 2, 1)))
+
+class CompactBodies(object):
+    ''' A system where each rigid body is reduced to one central particle with an orientation.
+
+    Bodies whose constituents have the same types in the same order share a
+    template of body-frame constituent positions, computed once in the
+    principal frame of the first such body.
+
+    Attributes
+    ----------
+    particles : ParticleArray
+        The central particles, one per body and in body order, followed by the
+        particles that are not in a rigid body. The central particles' rigid
+        ids are their own indices.
+    orientation : np.ndarray (n, 4)
+        Orientation quaternion (w, x, y, z) of each particle
+    moment_inertia : np.ndarray (n, 3)
+        Principal moments of inertia of each particle, for unit-mass constituents (nm^2)
+    templates : OrderedDict
+        For each central particle type, the 'constituent_types', body-frame
+        'positions' (nm) and 'orientations' of its constituents
+    constituent_bonds : np.ndarray (m, 3)
+        Bonds from a particle to a constituent as (particle index, body index, constituent index)
+    constituent_bond_types : list of str
+        Type of each constituent bond, the sorted pair of particle types joined by '-'
+    '''
+    def __init__(self, particles, orientation, moment_inertia, templates, constituent_bonds, constituent_bond_types):
+        self.particles = particles
+        self.orientation = orientation
+        self.moment_inertia = moment_inertia
+        self.templates = templates
+        self.constituent_bonds = constituent_bonds
+        self.constituent_bond_types = constituent_bond_types
+
+    @property
+    def n_bodies(self):
+        return int(np.count_nonzero(self.particles.rigid_id >= 0))
+
+def compact_rigid_bodies(system, tolerance=1e-3):
+    ''' Reduces the rigid bodies of a system to central particles with orientations.
+
+    Parameters
+    ----------
+    system : ParticleArray or mb.Compound
+        System with rigid bodies, e.g. a PatchyBox
+    tolerance : float, default=1e-3
+        Largest allowed deviation (nm) of a constituent from its template after fitting
+
+    Returns
+    -------
+    CompactBodies
+    '''
+    if isinstance(system, mb.Compound):
+        system = ParticleArray.from_compound(system)
+    names = [str(name) for name in system.types]
+
+    # Constituents of each body, in particle order
+    members = np.flatnonzero(system.rigid_id >= 0)
+    members = members[np.argsort(system.rigid_id[members], kind='stable')]
+    _, starts = np.unique(system.rigid_id[members], return_index=True)
+    body_members = np.split(members, starts[1:]) if len(members) else []
+    n_bodies = len(body_members)
+
+    # Bodies with the same constituent types share a template
+    signatures = OrderedDict()
+    for body, indices in enumerate(body_members):
+        signatures.setdefault(tuple(system.typeid[indices]), []).append(body)
+
+    centers = np.empty((n_bodies, 3))
+    rotations = np.empty((n_bodies, 3, 3))
+    moments = np.empty((n_bodies, 3))
+    central_types = np.empty(n_bodies, dtype=np.int32)
+    constituent_index = np.full(system.n_particles, -1)
+    body_of = np.full(system.n_particles, -1)
+    templates = OrderedDict()
+    for template_index, (signature, bodies) in enumerate(signatures.items()):
+        indices = np.array([body_members[body] for body in bodies])
+        coords = system.xyz[indices]
+        center, axes, principal = _principal_frame(coords[0])
+        template = np.dot(coords[0] - center, axes)
+
+        body_centers = coords.mean(axis=1)
+        centered = coords - body_centers[:, None, :]
+        body_rotations = _fit_rotations(template, centered)
+        deviation = np.einsum('mij,kj->mki', body_rotations, template) - centered
+        if np.abs(deviation).max() > tolerance:
+            raise Exception("Rigid bodies with constituent types {} are not rigid copies of one "
+                            "template.".format([names[i] for i in signature]))
+
+        centers[bodies] = body_centers
+        rotations[bodies] = body_rotations
+        moments[bodies] = principal
+        central_types[bodies] = template_index
+        body_of[indices] = np.array(bodies)[:, None]
+        constituent_index[indices] = np.arange(indices.shape[1])
+        templates['_R{}'.format(template_index)] = {
+            'constituent_types': [names[i] for i in signature],
+            'positions': template,
+            'orientations': np.tile([1.0, 0.0, 0.0, 0.0], (len(signature), 1))}
+
+    # Central particles first, then the particles outside rigid bodies
+    free = np.flatnonzero(system.rigid_id < 0)
+    new_index = np.full(system.n_particles, -1)
+    new_index[free] = n_bodies + np.arange(len(free))
+    types = list(templates) + names
+    typeid = np.concatenate([central_types, len(templates) + system.typeid[free]])
+    body_molecules = np.array([system.molecule_id[indices[0]] for indices in body_members], dtype=np.int32)
+
+    # Bonds between free particles are kept; bonds to constituents are listed separately
+    a, b = system.bonds.T
+    a_rigid, b_rigid = body_of[a] >= 0, body_of[b] >= 0
+    if np.any(a_rigid & b_rigid & (body_of[a] != body_of[b])):
+        raise Exception("Bonds between two rigid bodies are not supported.")
+    keep = ~a_rigid & ~b_rigid
+    bonds = new_index[system.bonds[keep]]
+    to_constituent = a_rigid ^ b_rigid
+    particle = np.where(a_rigid, b, a)[to_constituent]
+    constituent = np.where(a_rigid, a, b)[to_constituent]
+    constituent_bonds = np.column_stack((new_index[particle], body_of[constituent], constituent_index[constituent]))
+    constituent_bond_types = ['-'.join(sorted((names[system.typeid[i]], names[system.typeid[j]])))
+                              for i, j in zip(particle, constituent)]
+
+    particles = ParticleArray(np.concatenate([centers, system.xyz[free]]), types, typeid, bonds,
+                              np.concatenate([np.arange(n_bodies), -np.ones(len(free))]),
+                              np.concatenate([body_molecules, system.molecule_id[free]]),
+                              system.periodicity)
+    orientation = np.tile([1.0, 0.0, 0.0, 0.0], (particles.n_particles, 1))
+    orientation[:n_bodies] = rotations_to_quaternions(rotations)
+    moment_inertia = np.zeros((particles.n_particles, 3))
+    moment_inertia[:n_bodies] = moments
+
+    return CompactBodies(particles, orientation, moment_inertia, templates,
+                         constituent_bonds.reshape(-1, 3), constituent_bond_types)
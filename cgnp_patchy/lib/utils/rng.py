@@ -0,0 +1,36 @@
+import numpy as np
+
+def as_random_state(seed=None):
+    ''' Returns a private np.random.RandomState for a seed, without touching NumPy's global state.
+
+    Parameters
+    ----------
+    seed : None, int, np.random.SeedSequence, np.random.RandomState or np.random.Generator
+        An int seeds a new RandomState, so results match `np.random.RandomState(seed)`.
+        A SeedSequence seeds a new RandomState from its entropy. A RandomState is
+        returned as is, and a Generator is wrapped so the two share their stream.
+        None seeds a new RandomState from the operating system.
+    '''
+    if isinstance(seed, np.random.RandomState):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        return np.random.RandomState(seed.bit_generator)
+    if isinstance(seed, np.random.SeedSequence):
+        return np.random.RandomState(np.random.MT19937(seed))
+
+    return np.random.RandomState(seed)
+
+def spawn_streams(seed, n):
+    ''' Returns `n` independent RandomStates derived from a seed.
+
+    Ints, None and SeedSequences are spawned into child SeedSequences, so each
+    stream is independent of the others and reproducible from the seed. A
+    RandomState or Generator cannot be split, so it is returned `n` times and
+    its draws are shared in order.
+    '''
+    if isinstance(seed, (np.random.RandomState, np.random.Generator)):
+        return [as_random_state(seed)] * n
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+
+    return [as_random_state(child) for child in seed.spawn(n)]
@@ -0,0 +1,82 @@
+import cProfile
+import os
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class StageTimer(object):
+    ''' Records the wall time, call count and peak memory of each stage of a build.
+
+    Wall time and calls are always recorded. Memory is only traced if the
+    CGNP_PATCHY_TRACE_MEMORY or CGNP_PATCHY_PROFILE environment variable is
+    set, since `tracemalloc` slows the build down severalfold; otherwise the
+    peak memory is None. When traced, it is the most memory (MB) the stage
+    had allocated at once, above what was allocated when it started, over all
+    of its calls. A stage run while memory is already traced, e.g. inside
+    another stage or a benchmark, is measured against the traced peak so far,
+    so it may report an upper bound. If CGNP_PATCHY_PROFILE is set to a
+    directory, each stage is also run under cProfile and the stats are dumped
+    to '<directory>/<name>-<stage>-<pid>-<count>.prof'.
+
+    Parameters
+    ----------
+    name : str
+        Name of the build, used in the report and in profile file names
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.stages = OrderedDict()
+
+    @contextmanager
+    def stage(self, stage):
+        ''' Context manager that times one call of a stage. '''
+        profile_dir = os.environ.get('CGNP_PATCHY_PROFILE')
+        profiler = cProfile.Profile() if profile_dir else None
+        trace_memory = bool(profile_dir or os.environ.get('CGNP_PATCHY_TRACE_MEMORY'))
+        if trace_memory:
+            tracing = tracemalloc.is_tracing()
+            if not tracing:
+                tracemalloc.start()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            wall_time = time.perf_counter() - start
+            record = self.stages.setdefault(stage, {'wall_time': 0.0, 'calls': 0, 'peak_memory': None})
+            record['wall_time'] += wall_time
+            record['calls'] += 1
+            if trace_memory:
+                peak_memory = (tracemalloc.get_traced_memory()[1] - start_memory) / 1024.0**2
+                if not tracing:
+                    tracemalloc.stop()
+                record['peak_memory'] = max(record['peak_memory'] or 0.0, peak_memory)
+            if profiler:
+                os.makedirs(profile_dir, exist_ok=True)
+                profiler.dump_stats(os.path.join(profile_dir, '{}-{}-{}-{}.prof'.format(
+                    self.name, stage, os.getpid(), record['calls'])))
+
+    @property
+    def total_time(self):
+        return sum(record['wall_time'] for record in self.stages.values())
+
+    def report(self):
+        ''' Returns a table of the recorded stages. '''
+        lines = ['{} build stages'.format(self.name),
+                 '{:<24s} {:>10s} {:>6s} {:>14s}'.format('stage', 'time (s)', 'calls', 'peak mem (MB)')]
+        for stage, record in self.stages.items():
+            memory = record['peak_memory']
+            lines.append('{:<24s} {:>10.4f} {:>6d} {:>14s}'.format(
+                stage, record['wall_time'], record['calls'],
+                '-' if memory is None else '{:.1f}'.format(memory)))
+        lines.append('{:<24s} {:>10.4f}'.format('total', self.total_time))
+
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.report()
@@ -0,0 +1,151 @@
+import numpy as np
+
+from cgnp_patchy.lib.utils.rng import as_random_state
+
+def _skew(vectors):
+    ''' Returns the cross-product matrices of an array of vectors. '''
+    K = np.zeros((len(vectors), 3, 3))
+    K[:, 0, 1] = -vectors[:, 2]
+    K[:, 0, 2] = vectors[:, 1]
+    K[:, 1, 0] = vectors[:, 2]
+    K[:, 1, 2] = -vectors[:, 0]
+    K[:, 2, 0] = -vectors[:, 1]
+    K[:, 2, 1] = vectors[:, 0]
+
+    return K
+
+def rotations_between(a, b):
+    ''' Returns the rotation matrices that take a unit vector onto each of an array of unit vectors.
+
+    Parameters
+    ----------
+    a : np.ndarray (3,)
+        Unit vector to rotate
+    b : np.ndarray (n, 3)
+        Unit vectors to rotate onto
+    '''
+    a = np.asarray(a, dtype=float)
+    b = np.atleast_2d(b)
+    v = np.cross(a, b)
+    c = b.dot(a)
+    K = _skew(v)
+    R = np.tile(np.eye(3), (len(b), 1, 1))
+
+    # Rodrigues' formula, written so the angle never has to be computed
+    parallel = np.isclose(c, -1.0)
+    scale = 1.0 / (1.0 + c[~parallel])
+    R[~parallel] += K[~parallel] + np.matmul(K[~parallel], K[~parallel]) * scale[:, None, None]
+
+    # Antiparallel vectors are a half turn about any perpendicular axis
+    if np.any(parallel):
+        axis = np.cross(a, [1.0, 0.0, 0.0])
+        if np.allclose(axis, 0):
+            axis = np.cross(a, [0.0, 1.0, 0.0])
+        axis /= np.linalg.norm(axis)
+        R[parallel] = 2.0 * np.outer(axis, axis) - np.eye(3)
+
+    return R
+
+def axis_angle_rotations(thetas, axes):
+    ''' Returns the rotation matrices for rotations by angles about axes.
+
+    Parameters
+    ----------
+    thetas : np.ndarray (n,)
+        Rotation angles (radians)
+    axes : np.ndarray (n, 3)
+        Rotation axes, not necessarily normalized
+    '''
+    thetas = np.atleast_1d(thetas)
+    axes = np.atleast_2d(axes).astype(float)
+    axes = axes / np.linalg.norm(axes, axis=1)[:, None]
+    K = _skew(axes)
+    KK = np.matmul(K, K)
+
+    return (np.eye(3) + np.sin(thetas)[:, None, None] * K
+            + (1.0 - np.cos(thetas))[:, None, None] * KK)
+
+def random_quaternions(n, random_state=None):
+    ''' Draws uniformly distributed random unit quaternions (w, x, y, z) using Shoemake's method.
+
+    Parameters
+    ----------
+    n : int
+        Number of quaternions
+    random_state : np.random.RandomState, optional, default=None
+        Random number generator, or a seed for one (see `as_random_state`).
+        A generator seeded by the operating system is used if None.
+    '''
+    u1, u2, u3 = as_random_state(random_state).random_sample((3, n))
+    a = np.sqrt(1.0 - u1)
+    b = np.sqrt(u1)
+
+    return np.column_stack((b * np.cos(2*np.pi*u3), a * np.sin(2*np.pi*u2),
+                            a * np.cos(2*np.pi*u2), b * np.sin(2*np.pi*u3)))
+
+def quaternions_to_rotations(quaternions):
+    ''' Converts unit quaternions (w, x, y, z) to rotation matrices.
+
+    Parameters
+    ----------
+    quaternions : np.ndarray (n, 4)
+        Unit quaternions
+    '''
+    w, x, y, z = np.atleast_2d(quaternions).T
+    R = np.empty((len(w), 3, 3))
+    R[:, 0, 0] = 1 - 2*(y*y + z*z)
+    R[:, 0, 1] = 2*(x*y - z*w)
+    R[:, 0, 2] = 2*(x*z + y*w)
+    R[:, 1, 0] = 2*(x*y + z*w)
+    R[:, 1, 1] = 1 - 2*(x*x + z*z)
+    R[:, 1, 2] = 2*(y*z - x*w)
+    R[:, 2, 0] = 2*(x*z - y*w)
+    R[:, 2, 1] = 2*(y*z + x*w)
+    R[:, 2, 2] = 1 - 2*(x*x + y*y)
+
+    return R
+
+def rotations_to_quaternions(rotations):
+    ''' Converts rotation matrices to unit quaternions (w, x, y, z) with w >= 0.
+
+    Each quaternion is computed from the largest of its four components, as
+    found from the trace and diagonal, to stay accurate for any rotation.
+
+    Parameters
+    ----------
+    rotations : np.ndarray (n, 3, 3)
+        Rotation matrices
+    '''
+    R = np.asarray(rotations, dtype=float).reshape(-1, 3, 3)
+    diagonal = np.stack([np.trace(R, axis1=1, axis2=2), R[:, 0, 0], R[:, 1, 1], R[:, 2, 2]], axis=1)
+    largest = np.argmax(diagonal, axis=1)
+    # 4*w*(w, x, y, z), 4*x*(w, x, y, z), ... for each choice of the largest component
+    products = np.stack([
+        [1 + diagonal[:, 0], R[:, 2, 1] - R[:, 1, 2], R[:, 0, 2] - R[:, 2, 0], R[:, 1, 0] - R[:, 0, 1]],
+        [R[:, 2, 1] - R[:, 1, 2], 1 + 2*R[:, 0, 0] - diagonal[:, 0], R[:, 0, 1] + R[:, 1, 0], R[:, 0, 2] + R[:, 2, 0]],
+        [R[:, 0, 2] - R[:, 2, 0], R[:, 0, 1] + R[:, 1, 0], 1 + 2*R[:, 1, 1] - diagonal[:, 0], R[:, 1, 2] + R[:, 2, 1]],
+        [R[:, 1, 0] - R[:, 0, 1], R[:, 0, 2] + R[:, 2, 0], R[:, 1, 2] + R[:, 2, 1], 1 + 2*R[:, 2, 2] - diagonal[:, 0]],
+    ])
+    q = products[largest, :, np.arange(len(R))]
+    q /= np.linalg.norm(q, axis=1)[:, None]
+
+    return q * np.where(q[:, 0] < 0, -1.0, 1.0)[:, None]
+
+def transform_points(points, rotations, translations):
+    ''' Applies a stack of rigid transforms to one set of points.
+
+    Parameters
+    ----------
+    points : np.ndarray (n, 3)
+        Points to transform
+    rotations : np.ndarray (m, 3, 3)
+        Rotation matrices
+    translations : np.ndarray (m, 3)
+        Translations applied after each rotation
+
+    Returns
+    -------
+    np.ndarray (m, n, 3)
+        The transformed points for each rigid transform
+    '''
+    return np.einsum('mij,nj->mni', rotations, points) + translations[:, None, :]
@@ -0,0 +1,131 @@
+import json
+import os
+
+import mbuild as mb
+import numpy as np
+from cgnp_patchy.lib.utils.particle_array import ParticleArray
+
+def _type_name(name):
+    ''' Strips the leading underscore used for coarse-grained bead names, e.g. '_CGN' -> 'CGN'. '''
+    return name[1:] if name.startswith('_') else name
+
+def _bond_names(types, typeid, bonds):
+    ''' Returns the type of each bond, the sorted pair of bonded particle types joined by '-'. '''
+    return np.array(['-'.join(sorted((types[i], types[j]))) for i, j in
+                     zip(typeid[bonds[:, 0]], typeid[bonds[:, 1]])] if len(bonds) else [], dtype=str)
+
+def _wrap(xyz, lengths, origin):
+    ''' Wraps positions into a periodic box. Returns the positions relative to
+    the center of the box and the image of each particle.
+    '''
+    shifted = xyz - origin
+    image = np.floor(shifted / lengths).astype(np.int32)
+
+    return shifted - image * lengths - lengths / 2.0, image
+
+def _new_frame():
+    import gsd.hoomd
+    return gsd.hoomd.Frame() if hasattr(gsd.hoomd, 'Frame') else gsd.hoomd.Snapshot()
+
+def _write_frame(filename, frame):
+    import gsd
+    import gsd.hoomd
+    # gsd 3 dropped the binary mode suffix
+    mode = 'wb' if int(gsd.__version__.split('.')[0]) < 3 else 'w'
+    with gsd.hoomd.open(filename, mode) as trajectory:
+        trajectory.append(frame)
+
+def _write_templates(filename, bodies, scale):
+    ''' Writes the constituent templates and constituent bonds of compacted rigid bodies to JSON. '''
+    body = dict((_type_name(name), {
+        'constituent_types': [_type_name(name) for name in template['constituent_types']],
+        'positions': (template['positions'] * scale).tolist(),
+        'orientations': template['orientations'].tolist()}) for name, template in bodies.templates.items())
+    bond_types = sorted(set(bodies.constituent_bond_types))
+    constituent_bonds = {
+        'group': bodies.constituent_bonds.tolist(),
+        'types': [_type_name(name) for name in bond_types],
+        'typeid': [bond_types.index(name) for name in bodies.constituent_bond_types]}
+    with open(filename, 'w') as f:
+        json.dump({'body': body, 'constituent_bonds': constituent_bonds}, f)
+
+def write_gsd(filename, system, ref_distance=1.0, overwrite=False, compact_bodies=False):
+    ''' Writes a system to a HOOMD GSD file directly from its coordinate, type and bond arrays.
+
+    Particle types are the bead names without their leading underscore, bond
+    types are the sorted pair of bonded particle types joined by '-', and the
+    rigid body ids are written as the particle bodies.
+
+    With `compact_bodies`, each rigid body is written as one central particle
+    with an orientation and moment of inertia instead of all its constituents
+    (see `compact_rigid_bodies`). The constituent templates are written to
+    '<filename>.bodies.json' as {'body': {central type: template}, 'constituent_bonds': ...},
+    where each template can be assigned to `hoomd.md.constrain.Rigid().body`
+    as is, and each constituent bond is (particle index, body index, constituent index).
+
+    Parameters
+    ----------
+    filename : str
+        Path of the GSD file
+    system : ParticleArray or mb.Compound
+        System to write. The box is taken from its periodicity, or from the
+        bounding box of the particles if it is not periodic.
+    ref_distance : float, default=1.0
+        Reference distance for the conversion to reduced units (Angstrom)
+    overwrite : bool, default=False
+        Overwrite the file if it already exists
+    compact_bodies : bool, default=False
+        Write one central particle per rigid body and a template of its constituents
+    '''
+    try:
+        import gsd
+        import gsd.hoomd
+    except ImportError:
+        raise ImportError("Writing GSD files requires the 'gsd' package.")
+
+    if os.path.exists(filename) and not overwrite:
+        raise IOError("{} exists; not overwriting".format(filename))
+    if isinstance(system, mb.Compound):
+        system = ParticleArray.from_compound(system)
+    bodies = None
+    if compact_bodies:
+        from cgnp_patchy.lib.utils.rigid_bodies import compact_rigid_bodies
+        bodies = compact_rigid_bodies(system)
+        system = bodies.particles
+
+    # nm -> Angstrom -> reduced units
+    scale = 10.0 / ref_distance
+    xyz = system.xyz
+    if system.periodicity is not None and np.all(system.periodicity > 0):
+        lengths = system.periodicity
+        origin = np.zeros(3)
+    else:
+        lengths = xyz.max(axis=0) - xyz.min(axis=0) + 1.0
+        origin = xyz.min(axis=0) - 0.5
+
+    # HOOMD boxes are centered on the origin
+    position, image = _wrap(xyz, lengths, origin)
+    position *= scale
+
+    types = [_type_name(name) for name in system.types]
+    bond_names = _bond_names(types, system.typeid, system.bonds)
+    bond_types, bond_typeid = np.unique(bond_names, return_inverse=True)
+
+    snapshot = _new_frame()
+    snapshot.configuration.box = list(lengths * scale) + [0, 0, 0]
+    snapshot.particles.N = system.n_particles
+    snapshot.particles.types = types
+    snapshot.particles.typeid = system.typeid.astype(np.uint32)
+    snapshot.particles.position = position.astype(np.float32)
+    snapshot.particles.image = image
+    snapshot.particles.body = system.rigid_id.astype(np.int32)
+    snapshot.bonds.N = system.n_bonds
+    snapshot.bonds.types = [str(bond_type) for bond_type in bond_types]
+    snapshot.bonds.typeid = bond_typeid.astype(np.uint32)
+    snapshot.bonds.group = system.bonds.astype(np.uint32)
+    if bodies is not None:
+        snapshot.particles.orientation = bodies.orientation.astype(np.float32)
+        snapshot.particles.moment_inertia = (bodies.moment_inertia * scale**2).astype(np.float32)
+        _write_templates(filename + '.bodies.json', bodies, scale)
+
+    _write_frame(filename, snapshot)
@@ -0,0 +1,230 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from cgnp_patchy.lib.utils.write_gsd import _new_frame, _type_name, _wrap, _write_frame
+
+class _ParticleStream(object):
+    ''' Appends chunks of particles to a file without holding the whole system in memory.
+
+    Each chunk is a ParticleArray with bonds indexed within the chunk; its
+    bond indices, rigid body ids and molecule ids are offset past those of
+    the chunks written before it, as in `ParticleArray.concatenate`. The
+    numbers of particles and bonds must be known when the stream is opened.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the output file
+    types : list of str
+        Particle type names of every chunk, in the order they are written
+    bond_types : list of str
+        Bond type names of every chunk, the sorted pair of bonded particle
+        types (without their leading underscore) joined by '-'
+    n_particles : int
+        Total number of particles
+    n_bonds : int
+        Total number of bonds
+    periodicity : np.ndarray (3,)
+        Periodic box lengths (nm)
+    ref_distance : float, default=1.0
+        Reference distance for the conversion to reduced units (Angstrom)
+    overwrite : bool, default=False
+        Overwrite the file if it already exists
+    '''
+    def __init__(self, filename, types, bond_types, n_particles, n_bonds, periodicity,
+                 ref_distance=1.0, overwrite=False):
+        if os.path.exists(filename) and not overwrite:
+            raise IOError("{} exists; not overwriting".format(filename))
+        self.filename = filename
+        self.types = [_type_name(name) for name in types]
+        self._type_index = dict((name, i) for i, name in enumerate(self.types))
+        self.bond_types = sorted(bond_types)
+        # Bond type of each pair of particle types, -1 for pairs without one
+        bond_index = dict((name, i) for i, name in enumerate(self.bond_types))
+        self._bond_table = np.array([[bond_index.get('-'.join(sorted((a, b))), -1) for b in self.types]
+                                     for a in self.types], dtype=np.int64).reshape(len(self.types), -1)
+        self.n_particles = n_particles
+        self.n_bonds = n_bonds
+        self.lengths = np.asarray(periodicity, dtype=float)
+        # nm -> Angstrom -> reduced units
+        self.scale = 10.0 / ref_distance
+        self.particles_written = 0
+        self.bonds_written = 0
+        self._n_molecules = 0
+        self._n_rigid = 0
+
+    def append(self, particles):
+        ''' Writes a chunk of particles. '''
+        if particles.n_particles == 0:
+            return
+        if self.particles_written + particles.n_particles > self.n_particles:
+            raise Exception("More particles appended than the {} declared.".format(self.n_particles))
+        type_map = np.array([self._type_index[_type_name(name)] for name in particles.types], dtype=np.int32)
+        typeid = type_map[particles.typeid]
+        rigid_id = np.where(particles.rigid_id >= 0, particles.rigid_id + self._n_rigid, -1)
+        molecule_id = particles.molecule_id + self._n_molecules
+        bond_typeid = self._bond_table[typeid[particles.bonds[:, 0]], typeid[particles.bonds[:, 1]]]
+        if np.any(bond_typeid < 0):
+            raise Exception("Chunk has bonds of a type not declared in {}.".format(self.bond_types))
+        bonds = particles.bonds + self.particles_written
+        position, image = _wrap(particles.xyz, self.lengths, np.zeros(3))
+
+        self._write(position * self.scale, image, typeid, rigid_id, molecule_id, bonds, bond_typeid)
+        self.particles_written += particles.n_particles
+        self.bonds_written += particles.n_bonds
+        self._n_molecules += particles.molecule_id.max() + 1
+        if np.any(particles.rigid_id >= 0):
+            self._n_rigid += particles.rigid_id.max() + 1
+
+    def close(self):
+        if (self.particles_written, self.bonds_written) != (self.n_particles, self.n_bonds):
+            self._abort()
+            raise Exception("Wrote {} particles and {} bonds of the {} and {} declared.".format(
+                self.particles_written, self.bonds_written, self.n_particles, self.n_bonds))
+        self._finish()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._abort()
+
+class GSDStream(_ParticleStream):
+    ''' Streams particles into a HOOMD GSD file, with the same contents as `write_gsd`.
+
+    Chunks are written to memory-mapped scratch arrays next to the output
+    file, which are written to the GSD file on `close` and then removed, so
+    only one chunk is held in memory at a time.
+
+    Parameters are the same as `_ParticleStream`.
+    '''
+    def __init__(self, filename, types, bond_types, n_particles, n_bonds, periodicity,
+                 ref_distance=1.0, overwrite=False):
+        try:
+            import gsd.hoomd
+        except ImportError:
+            raise ImportError("Writing GSD files requires the 'gsd' package.")
+        super(GSDStream, self).__init__(filename, types, bond_types, n_particles, n_bonds, periodicity,
+                                        ref_distance, overwrite)
+        self._scratch = tempfile.mkdtemp(prefix='.gsd-stream-', dir=os.path.dirname(os.path.abspath(filename)))
+        fields = (('position', np.float32, (n_particles, 3)), ('image', np.int32, (n_particles, 3)),
+                  ('typeid', np.uint32, (n_particles,)), ('body', np.int32, (n_particles,)),
+                  ('group', np.uint32, (n_bonds, 2)), ('bond_typeid', np.uint32, (n_bonds,)))
+        self._arrays = dict((name, np.lib.format.open_memmap(os.path.join(self._scratch, name + '.npy'),
+                                                             mode='w+', dtype=dtype, shape=shape))
+                            for name, dtype, shape in fields)
+
+    def _write(self, position, image, typeid, rigid_id, molecule_id, bonds, bond_typeid):
+        particles = slice(self.particles_written, self.particles_written + len(position))
+        self._arrays['position'][particles] = position
+        self._arrays['image'][particles] = image
+        self._arrays['typeid'][particles] = typeid
+        self._arrays['body'][particles] = rigid_id
+        bond_slice = slice(self.bonds_written, self.bonds_written + len(bonds))
+        self._arrays['group'][bond_slice] = bonds
+        self._arrays['bond_typeid'][bond_slice] = bond_typeid
+
+    def _finish(self):
+        try:
+            snapshot = _new_frame()
+            snapshot.configuration.box = list(self.lengths * self.scale) + [0, 0, 0]
+            snapshot.particles.N = self.n_particles
+            snapshot.particles.types = self.types
+            snapshot.particles.typeid = self._arrays['typeid']
+            snapshot.particles.position = self._arrays['position']
+            snapshot.particles.image = self._arrays['image']
+            snapshot.particles.body = self._arrays['body']
+            snapshot.bonds.N = self.n_bonds
+            snapshot.bonds.types = self.bond_types
+            snapshot.bonds.typeid = self._arrays['bond_typeid']
+            snapshot.bonds.group = self._arrays['group']
+            _write_frame(self.filename, snapshot)
+        finally:
+            self._abort()
+
+    def _abort(self):
+        self._arrays = {}
+        shutil.rmtree(self._scratch, ignore_errors=True)
+
+class LammpsDataStream(_ParticleStream):
+    ''' Streams particles into a LAMMPS data file with atom style 'full'.
+
+    Atoms are written to the file as they are appended and bonds to a
+    scratch file, which is copied after the Atoms section on `close`. The
+    partial file is removed if the stream is aborted.
+    Positions are in Angstrom divided by `ref_distance`, molecule ids are
+    those of the chunks plus one, and every type is given a mass of 1 with
+    its name as a comment.
+
+    Parameters are the same as `_ParticleStream`.
+    '''
+    def __init__(self, filename, types, bond_types, n_particles, n_bonds, periodicity,
+                 ref_distance=1.0, overwrite=False):
+        super(LammpsDataStream, self).__init__(filename, types, bond_types, n_particles, n_bonds, periodicity,
+                                               ref_distance, overwrite)
+        self._file = open(filename, 'w')
+        self._bonds = tempfile.TemporaryFile(mode='w+', dir=os.path.dirname(os.path.abspath(filename)))
+
+        lengths = self.lengths * self.scale
+        f = self._file
+        f.write('LAMMPS data file written by cgnp_patchy\n\n')
+        f.write('{} atoms\n{} bonds\n\n'.format(n_particles, n_bonds))
+        f.write('{} atom types\n{} bond types\n\n'.format(len(self.types), len(self.bond_types)))
+        for dim, length in zip('xyz', lengths):
+            f.write('{:.6f} {:.6f} {}lo {}hi\n'.format(0.0, length, dim, dim))
+        f.write('\nMasses\n\n')
+        for i, name in enumerate(self.types):
+            f.write('{} 1.0 # {}\n'.format(i + 1, name))
+        f.write('\nAtoms # full\n\n')
+
+    def _write(self, position, image, typeid, rigid_id, molecule_id, bonds, bond_typeid):
+        # Atoms are centered on the origin by `_wrap`; LAMMPS boxes start at 0
+        position = position + self.lengths * self.scale / 2.0
+        ids = self.particles_written + 1 + np.arange(len(position))
+        atoms = np.column_stack((ids, molecule_id + 1, typeid + 1, np.zeros(len(ids)), position, image))
+        np.savetxt(self._file, atoms, fmt='%d %d %d %.1f %.6f %.6f %.6f %d %d %d')
+        if len(bonds):
+            ids = self.bonds_written + 1 + np.arange(len(bonds))
+            np.savetxt(self._bonds, np.column_stack((ids, bond_typeid + 1, bonds + 1)), fmt='%d')
+
+    def _finish(self):
+        try:
+            if self.n_bonds:
+                self._file.write('\nBonds\n\n')
+                self._bonds.seek(0)
+                shutil.copyfileobj(self._bonds, self._file)
+        except Exception:
+            self._abort()
+            raise
+        self._close()
+
+    def _close(self):
+        self._file.close()
+        self._bonds.close()
+
+    def _abort(self):
+        # Atoms are written as they come, so remove the partial file
+        self._close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+def open_stream(filename, types, bond_types, n_particles, n_bonds, periodicity, ref_distance=1.0, overwrite=False):
+    ''' Opens a GSDStream for '.gsd' files or a LammpsDataStream for '.lammps', '.data' and '.lmp' files.
+
+    See `_ParticleStream` for the parameters.
+    '''
+    extension = os.path.splitext(filename)[1]
+    if extension == '.gsd':
+        stream = GSDStream
+    elif extension in ('.lammps', '.data', '.lmp'):
+        stream = LammpsDataStream
+    else:
+        raise Exception("Streaming is only supported for GSD and LAMMPS data files, not '{}'.".format(filename))
+
+    return stream(filename, types, bond_types, n_particles, n_bonds, periodicity, ref_distance, overwrite)
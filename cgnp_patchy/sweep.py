@@ -0,0 +1,176 @@
+""" Builds tethered nanoparticles or boxes of them over a grid of parameters on a process pool.
+
+    cgnp_patchy_sweep grid.json --out sweep/ [--processes 4] [--seed 12345] [--format npz]
+
+The grid file maps each `cgnp_patchy` parameter to a list of values, e.g.
+{"radius": [2.5, 5.0], "chain_density": [2.0, 4.0], "coating_pattern": ["polar", "ring"]}.
+A grid with 'n' (and optionally 'box_length' and 'compress_to') builds a
+PatchyBox of n nanoparticles for each job instead of a single nanoparticle.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import mbuild as mb
+import numpy as np
+
+from cgnp_patchy.lib.utils.particle_cache import particle_key
+
+# Parameters of the box rather than the nanoparticle
+_BOX_PARAMETERS = ('n', 'box_length', 'compress_to')
+MANIFEST = 'manifest.jsonl'
+
+def sweep_jobs(grid):
+    ''' Returns the parameters of every job in a grid, in a fixed order.
+
+    Parameters
+    ----------
+    grid : dict
+        Values of each parameter. Scalars are taken as a single value.
+    '''
+    names = sorted(grid)
+    values = [grid[name] if isinstance(grid[name], (list, tuple)) else [grid[name]] for name in names]
+
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+def job_seed(master_seed, index):
+    ''' Returns the seed of a job, from an independent stream spawned from the master seed. '''
+    sequence = np.random.SeedSequence(master_seed, spawn_key=(index,))
+
+    return int(sequence.generate_state(1)[0])
+
+def job_name(index, params):
+    return '{:06d}-{}'.format(index, particle_key(**params)[:12])
+
+def build_job(params, seed):
+    ''' Builds one job as a ParticleArray. '''
+    from cgnp_patchy.cgnp_patchy import cgnp_patchy
+    from cgnp_patchy.systems import PatchyBox
+
+    nano_params = dict((name, value) for name, value in params.items() if name not in _BOX_PARAMETERS)
+    pattern_seed, box_seed = np.random.SeedSequence(seed).spawn(2)
+    arrays = cgnp_patchy.build_arrays(seed=pattern_seed, **nano_params)
+    if 'n' in params:
+        length = params.get('box_length')
+        if length is None:
+            # Roughly 12 nanoparticle radii of box length per nanoparticle
+            length = 12.0 * nano_params['radius'] * params['n']**(1.0/3.0)
+        box = mb.Box(lengths=np.ones(3) * length)
+        arrays = PatchyBox.build_arrays(arrays, n=params['n'], box=box, seed=box_seed,
+                                        compress_to=params.get('compress_to'))
+
+    return arrays
+
+def _run_job(job):
+    ''' Builds a job and writes it to disk. Returns its manifest record. '''
+    index, name, params, seed, out, extension = job
+    start = time.perf_counter()
+    record = {'job': name, 'index': index, 'params': params, 'seed': seed}
+    try:
+        arrays = build_job(params, seed)
+        filename = os.path.join(out, name + '.' + extension)
+        tmp = os.path.join(out, '.{}.tmp.{}'.format(name, extension))
+        arrays.save(tmp)
+        os.replace(tmp, filename)
+        record.update(file=os.path.basename(filename), n_particles=arrays.n_particles, error=None)
+    except Exception as e:
+        record.update(file=None, error='{}: {}'.format(type(e).__name__, e))
+    record['wall_time'] = time.perf_counter() - start
+
+    return record
+
+def completed_jobs(out):
+    ''' Returns the names of jobs recorded as finished in the manifest of a sweep directory. '''
+    done = set()
+    manifest = os.path.join(out, MANIFEST)
+    if not os.path.isfile(manifest):
+        return done
+    with open(manifest) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interruption
+                continue
+            if record.get('file') and os.path.isfile(os.path.join(out, record['file'])):
+                done.add(record['job'])
+
+    return done
+
+def run_sweep(grid, out, processes=None, seed=12345, extension='npz', verbose=False):
+    ''' Builds every job of a parameter grid on a process pool.
+
+    Each finished build is written to `out` and recorded in its manifest
+    (manifest.jsonl) as it completes, so an interrupted sweep resumes where it
+    stopped when run again. Every job gets its own seed, drawn from an
+    independent stream spawned from `seed` and the job's index in the grid.
+
+    Parameters
+    ----------
+    grid : dict
+        Values of each parameter, see `sweep_jobs`
+    out : str
+        Output directory
+    processes : int, optional, default=None
+        Number of worker processes. Defaults to the number of CPUs; with 1 the
+        jobs are built in this process.
+    seed : int, default=12345
+        Master seed of the sweep
+    extension : str, default='npz'
+        File format of the builds, any format supported by `ParticleArray.save`
+    verbose : bool, default=False
+        Print each record as it completes
+
+    Returns
+    -------
+    list of dict
+        Manifest records of the jobs built in this run
+    '''
+    os.makedirs(out, exist_ok=True)
+    done = completed_jobs(out)
+    jobs = []
+    for index, params in enumerate(sweep_jobs(grid)):
+        name = job_name(index, params)
+        if name not in done:
+            jobs.append((index, name, params, job_seed(seed, index), out, extension))
+
+    records = []
+    pool = multiprocessing.Pool(processes) if processes != 1 and len(jobs) > 1 else None
+    try:
+        results = pool.imap_unordered(_run_job, jobs) if pool else map(_run_job, jobs)
+        with open(os.path.join(out, MANIFEST), 'a') as manifest:
+            for record in results:
+                manifest.write(json.dumps(record) + '\n')
+                manifest.flush()
+                records.append(record)
+                if verbose:
+                    print('{} {}'.format(record['job'], record['error'] or '{:.2f} s'.format(record['wall_time'])))
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    return records
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='cgnp_patchy_sweep',
+                                     description='Builds tethered nanoparticles over a grid of parameters.')
+    parser.add_argument('grid', help='JSON file mapping each parameter to a list of values')
+    parser.add_argument('--out', default='sweep', help='Output directory')
+    parser.add_argument('--processes', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--seed', type=int, default=12345, help='Master seed of the sweep')
+    parser.add_argument('--format', default='npz', help="File format of the builds, e.g. 'npz' or 'gsd'")
+    args = parser.parse_args(argv)
+
+    with open(args.grid) as f:
+        grid = json.load(f)
+    records = run_sweep(grid, args.out, args.processes, args.seed, args.format, verbose=True)
+
+    return 1 if any(record['error'] for record in records) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
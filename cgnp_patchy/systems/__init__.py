@@ -1,2 +1,3 @@
 from cgnp_patchy.systems.patchy_pair import PatchyPair
-from cgnp_patchy.systems.patchy_box import PatchyBox
+from cgnp_patchy.systems.patchy_box import PatchyBox, PatchyBoxPlan
+from cgnp_patchy.systems.population import PolydispersePopulation
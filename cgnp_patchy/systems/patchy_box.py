@@ -1,58 +1,400 @@
 from __future__ import division
 
-import os
-from pkg_resources import resource_filename
-
 import mbuild as mb
 import numpy as np
-import random
 from copy import deepcopy
 
+from cgnp_patchy.lib.utils.pack_spheres import compress_spheres, pack_spheres
+from cgnp_patchy.lib.utils.particle_array import ParticleArray
+from cgnp_patchy.lib.utils.rng import spawn_streams
+from cgnp_patchy.lib.utils.stage_timer import StageTimer
+from cgnp_patchy.lib.utils.transforms import quaternions_to_rotations, random_quaternions, transform_points
+from cgnp_patchy.systems.population import PolydispersePopulation
+
+def _prototype_lists(nano, n):
+    """Returns the prototypes and counts of a box as lists, taking both from a PolydispersePopulation. """
+    if isinstance(nano, PolydispersePopulation):
+        if n is not None:
+            raise Exception("The counts of a PolydispersePopulation come from the population; pass n=None.")
+        return list(nano.prototypes), list(nano.counts)
+    if type(nano) is not list:
+        nano = [nano]
+    if type(n) is not list:
+        n = [n]
+
+    return nano, n
+
+def _resolve_prototype(proto, cache=None, compound=True):
+    """Returns a nanoparticle prototype, building or loading it from `cache` if it is given
+    as a dict of `cgnp_patchy` parameters, or building it if it is a NanoparticlePlan.
+
+    With `compound`, the prototype is returned as an mb.Compound, otherwise as a ParticleArray.
+    """
+    from cgnp_patchy.cgnp_patchy import NanoparticlePlan, cgnp_patchy
+    if isinstance(proto, dict):
+        proto = cgnp_patchy.build_cached(cache=cache, **proto)
+    elif isinstance(proto, NanoparticlePlan):
+        proto = proto.build() if compound else proto.arrays
+    if compound and isinstance(proto, ParticleArray):
+        return proto.to_compound()
+    if not compound and not isinstance(proto, ParticleArray):
+        return ParticleArray.from_compound(proto)
+
+    return proto
+
+def _exclusion_sphere(np_proto, percentile=100.0):
+    """Center and diameter of the exclusion sphere of a nanoparticle prototype.
+
+    The sphere is centered on the rigid core (or on all beads if there is no
+    core) and holds every core bead and the given percentile of the other
+    beads by distance from the center, plus a 0.5 nm buffer. Unlike the
+    extent along the box axes, the sphere bounds every rotated copy.
+    """
+    if isinstance(np_proto, ParticleArray):
+        core = np_proto.rigid_id >= 0
+    else:
+        core = np.array([particle.rigid_id is not None for particle in np_proto.particles()])
+    xyz = np_proto.xyz
+    center = xyz[core].mean(axis=0) if np.any(core) else xyz.mean(axis=0)
+    distance = np.linalg.norm(xyz - center, axis=1)
+    radius = distance[core].max() if np.any(core) else 0.0
+    if not np.all(core):
+        radius = max(radius, np.percentile(distance[~core], percentile))
+
+    return center, 2.0 * radius + 0.5
+
+def _place_particles(diameters, n, box, random_state):
+    """Finds non-overlapping positions for each type of nanoparticle in the periodic box.
+
+    Returns the prototype index and the position of each placed nanoparticle.
+    """
+    return pack_spheres(box.lengths, n, diameters, seed=random_state, origin=box.mins)
+
+def _reorient_clashes(nano, centers, diameters, indices, positions, rotations, lengths, random_state,
+                      max_stalled=10):
+    """Redraws the orientations of nanoparticles whose beads are closer than 0.5 nm to another's.
+
+    Exclusion spheres that leave out the outermost chain beads only keep the
+    beads inside them apart. Two beads can only clash if their distances from
+    their own centers add up to more than the two sphere radii, so only the
+    beads in an outer shell of each prototype are checked, with `find_overlaps`.
+    The clashing nanoparticles keep their positions and get new random
+    orientations until no beads clash. Raises an exception if the number of
+    clashing nanoparticles stops falling, e.g. in a box compressed too far
+    for the chain ends to fit. Returns the rotations.
+    """
+    from cgnp_patchy.lib.utils.find_overlaps import find_overlaps
+    radii = (np.asarray(diameters) - 0.5) / 2.0
+    distances = [np.linalg.norm(np_proto.xyz - center, axis=1) for np_proto, center in zip(nano, centers)]
+    excess = max(max(distance.max() - radius for distance, radius in zip(distances, radii)), 0.0)
+    shells = [np_proto.xyz[distance > radius - excess]
+              for np_proto, distance, radius in zip(nano, distances, radii)]
+    if sum(len(shell) for shell in shells) == 0:
+        return rotations
+
+    rotations = rotations.copy()
+    fewest, stalled = len(indices) + 1, 0
+    while stalled < max_stalled:
+        xyz, molecule_id = [], []
+        for nano_index, (shell, center) in enumerate(zip(shells, centers)):
+            copies = np.flatnonzero(indices == nano_index)
+            xyz.append(_replicate(shell, center, positions[copies], rotations[copies]).reshape(-1, 3))
+            molecule_id.append(np.repeat(copies, len(shell)))
+        molecule_id = np.concatenate(molecule_id)
+        shell_beads = ParticleArray(np.concatenate(xyz), ['_shell'], np.zeros(len(molecule_id)),
+                                    molecule_id=molecule_id, periodicity=lengths)
+        clashing = np.unique(molecule_id[find_overlaps(shell_beads)])
+        if len(clashing) == 0:
+            return rotations
+        fewest, stalled = (len(clashing), 0) if len(clashing) < fewest else (fewest, stalled + 1)
+        rotations[clashing] = quaternions_to_rotations(random_quaternions(len(clashing), random_state))
+
+    raise Exception("Could not orient {} nanoparticles without clashing beads; raise exclusion_percentile "
+                    "or lower the packing fraction.".format(len(clashing)))
+
+def _layout(nano, n, box, seed, exclusion_percentile, compress_to, timings):
+    """Places and orients every nanoparticle of a box, timing each step.
+
+    Nanoparticles whose beads clash with a neighbor's are reoriented (see
+    `_reorient_clashes`), so no beads of different nanoparticles are closer
+    than 0.5 nm. Returns the exclusion sphere center and diameter of each prototype, the
+    prototype index, position and rotation of each nanoparticle, and the box,
+    which is smaller than the given one if it was compressed.
+    """
+    spheres = [_exclusion_sphere(np_proto, exclusion_percentile) for np_proto in nano]
+    centers = [center for center, diameter in spheres]
+    diameters = [diameter for center, diameter in spheres]
+    placement_state, orientation_state = spawn_streams(seed, 2)
+    with timings.stage('placement'):
+        indices, positions = _place_particles(diameters, n, box, placement_state)
+
+    if compress_to is not None:
+        with timings.stage('compression'):
+            positions, lengths = compress_spheres(positions, np.asarray(diameters)[indices], box.lengths,
+                                                  compress_to, origin=box.mins)
+            box = mb.Box(mins=box.mins, maxs=box.mins + lengths)
+
+    # Draw uniformly distributed orientations for every copy at once
+    with timings.stage('orientations'):
+        rotations = quaternions_to_rotations(random_quaternions(len(indices), orientation_state))
+        rotations = _reorient_clashes(nano, centers, diameters, indices, positions, rotations, box.lengths,
+                                      orientation_state)
+
+    return centers, diameters, indices, positions, rotations, box
+
+def _replicate(proto_xyz, proto_center, positions, rotations):
+    """Rotates copies of a prototype about its center and moves them to each position in one pass.
+
+    Returns an array (m, n, 3) of the coordinates of every copy.
+    """
+    return transform_points(proto_xyz - proto_center, rotations, positions)
+
+def _replicate_chunks(nano, centers, indices, positions, rotations, chunk_size=None):
+    """Yields ParticleArrays of up to `chunk_size` placed copies of each prototype, in box order.
+
+    Concatenated, the chunks give the particles of `PatchyBox.build_arrays`.
+    """
+    for nano_index, (np_proto, center) in enumerate(zip(nano, centers)):
+        copies = np.flatnonzero(indices == nano_index)
+        step = chunk_size or max(len(copies), 1)
+        for start in range(0, len(copies), step):
+            chunk = copies[start:start + step]
+            coords = _replicate(np_proto.xyz, center, positions[chunk], rotations[chunk])
+            yield np_proto.replicate(coords)
+
+def _stream_box(filename, nano, centers, n, box, indices, positions, rotations, chunk_size, ref_distance,
+                overwrite):
+    """Writes placed copies of ParticleArray prototypes to a GSD or LAMMPS data file one chunk at a time. """
+    from cgnp_patchy.lib.utils.write_gsd import _bond_names, _type_name
+    from cgnp_patchy.lib.utils.write_stream import open_stream
+    types = ParticleArray.concatenate(nano).types
+    bond_types = set()
+    for np_proto in nano:
+        bond_types.update(_bond_names([_type_name(name) for name in np_proto.types],
+                                      np_proto.typeid, np_proto.bonds))
+    n_particles = int(np.dot(n, [np_proto.n_particles for np_proto in nano]))
+    n_bonds = int(np.dot(n, [np_proto.n_bonds for np_proto in nano]))
+
+    with open_stream(filename, types, bond_types, n_particles, n_bonds, box.lengths,
+                     ref_distance=ref_distance, overwrite=overwrite) as stream:
+        for chunk in _replicate_chunks(nano, centers, indices, positions, rotations, chunk_size):
+            stream.append(chunk)
+
 class PatchyBox(mb.Compound):
-    def __init__(self, nano, n, box, seed=12345):
+    """
+    Builds a periodic box of randomly placed and oriented nanoparticles.
+
+    Parameters
+    ----------
+    nano : mb.Compound, ParticleArray, NanoparticlePlan or dict, a list of them, or a PolydispersePopulation
+        Prototype of each type of nanoparticle. A dict is taken as `cgnp_patchy`
+        parameters and the prototype is loaded from `cache`, or built and stored
+        there. A PolydispersePopulation gives the prototypes and counts of its bins.
+    n : int or list of int
+        Number of copies of each prototype, or None for a PolydispersePopulation
+    box : mb.Box
+        Periodic box to fill
+    seed : int, np.random.SeedSequence or np.random.RandomState, default=12345
+        Seed for the placement and orientations. Independent streams are spawned
+        from it for each, and NumPy's global random state is not used.
+    cache : ParticleCache, optional, default=None
+        Cache of prototypes given as parameters. Defaults to a ParticleCache in `cache_dir()`.
+    exclusion_percentile : float, default=100.0
+        Percentile of the chain beads, by distance from the core center, inside
+        the exclusion sphere of each prototype. The default holds every bead.
+        Lower values, e.g. 80 to leave out about the outermost bead of each
+        chain, give smaller spheres and denser boxes; nanoparticles whose chain
+        ends then clash are reoriented, and an exception is raised if they
+        can't be. Either way no beads of different nanoparticles are closer
+        than 0.5 nm.
+    compress_to : float, optional, default=None
+        Packing fraction of the exclusion spheres to compress the box to before
+        the nanoparticles are built, treating each as a soft sphere (see
+        `compress_spheres`). The nanoparticles are first placed in `box`, so it
+        should be dilute enough for `pack_spheres`; the box of the result is the
+        compressed one.
+    """
+    def __init__(self, nano, n, box, seed=12345, cache=None, exclusion_percentile=100.0, compress_to=None):
         super(PatchyBox, self).__init__()
         
-        if type(nano) is not list:
-            nano = [nano]
-        if type(n) is not list:
-            n = [n] 
-        
-        # Define positions for nanoparticles (use points to speed
-        # this up)
-        point_rep = mb.Particle(name='point0')
-        d_vdw = max([max(nano[0].xyz[:,dim]) - min(nano[0].xyz[:,dim])
-                     for dim in range(3)]) 
-        point_box = mb.fill_box(point_rep, n[0], box, overlap=d_vdw+0.5, edge=d_vdw/2+0.25, seed=seed)
+        nano, n = _prototype_lists(nano, n)
+        nano = [_resolve_prototype(proto, cache) for proto in nano]
         
-        for i, (np_proto, np_n) in enumerate(zip(nano[1:], n[1:])):
-            point_rep = mb.Particle(name='point{:d}'.format(i+1))
-            d_vdw = max([max(np_proto.xyz[:,dim]) - min(np_proto.xyz[:,dim])
-                     for dim in range(3)])
-            point_box = mb.solvate(solute=point_box, solvent=point_rep, n_solvent=np_n, box=box,
-                                   overlap=d_vdw+0.5, edge=d_vdw/2+0.25, seed=seed)
+        self.timings = StageTimer('PatchyBox')
+        centers, diameters, indices, positions, rotations, box = _layout(
+            nano, n, box, seed, exclusion_percentile, compress_to, self.timings)
         self.periodicity = box.lengths
-        random.seed(seed)
-        
+
         # Replicate the nanoparticle at the defined positions
-        for particle in point_box.particles():
-            nano_index = int(particle.name.strip('point'))
-            nano_clone = mb.clone(nano[nano_index])
-            nano_clone.spin(random.random()*2*np.pi, np.array([random.random(), random.random(), random.random()]) - 0.5)
-            #mb.translate_to(nano_clone, particle.pos)
-            nano_clone.translate_to(particle.pos)
-            self.add(nano_clone)
+        with self.timings.stage('replication'):
+            for nano_index, (np_proto, center) in enumerate(zip(nano, centers)):
+                copies = np.flatnonzero(indices == nano_index)
+                coords = _replicate(np_proto.xyz_with_ports, center, positions[copies], rotations[copies])
+                clones = []
+                for xyz in coords:
+                    nano_clone = mb.clone(np_proto)
+                    nano_clone.xyz_with_ports = xyz
+                    clones.append(nano_clone)
+                self.add(clones)
+
+    @classmethod
+    def plan(cls, nano, n, box, seed=12345, cache=None, exclusion_percentile=100.0, compress_to=None):
+        """Returns a PatchyBoxPlan with the placement and counts of the box, without building it.
+
+        Parameters are the same as `PatchyBox`.
+        """
+        return PatchyBoxPlan(nano, n, box, seed=seed, cache=cache, exclusion_percentile=exclusion_percentile,
+                             compress_to=compress_to)
+
+    @classmethod
+    def build_arrays(cls, nano, n, box, seed=12345, cache=None, exclusion_percentile=100.0, compress_to=None):
+        """Builds the box as a ParticleArray with one molecule id per nanoparticle.
+
+        Parameters are the same as `PatchyBox`.
+        """
+        nano, n = _prototype_lists(nano, n)
+        nano = [_resolve_prototype(proto, cache, compound=False) for proto in nano]
+
+        timings = StageTimer('PatchyBox')
+        centers, diameters, indices, positions, rotations, box = _layout(
+            nano, n, box, seed, exclusion_percentile, compress_to, timings)
+
+        with timings.stage('replication'):
+            particles = list(_replicate_chunks(nano, centers, indices, positions, rotations))
+            arrays = ParticleArray.concatenate(particles, periodicity=box.lengths)
+        arrays.timings = timings
+
+        return arrays
+
+    @classmethod
+    def stream(cls, nano, n, box, filename, seed=12345, cache=None, exclusion_percentile=100.0, compress_to=None,
+               chunk_size=100, ref_distance=1.0, overwrite=False):
+        """Builds the box straight into a GSD or LAMMPS data file, `chunk_size` nanoparticles at a time.
+
+        Only the prototypes, the placement and one chunk of replicated
+        nanoparticles are held in memory, so the peak memory does not grow with
+        the number of particles in the box. The file has the same contents as
+        saving `build_arrays` with the same seed.
+
+        Parameters
+        ----------
+        nano, n, box, seed, cache, exclusion_percentile, compress_to
+            Same as `PatchyBox`
+        filename : str
+            Output file, '.gsd' for HOOMD or '.lammps', '.data' or '.lmp' for a LAMMPS data file
+        chunk_size : int, default=100
+            Number of nanoparticles replicated and written at a time
+        ref_distance : float, default=1.0
+            Reference distance for the conversion to reduced units (Angstrom)
+        overwrite : bool, default=False
+            Overwrite the file if it already exists
+
+        Returns
+        -------
+        StageTimer
+            Timing report of the build
+        """
+        nano, n = _prototype_lists(nano, n)
+        nano = [_resolve_prototype(proto, cache, compound=False) for proto in nano]
+
+        timings = StageTimer('PatchyBox')
+        centers, diameters, indices, positions, rotations, box = _layout(
+            nano, n, box, seed, exclusion_percentile, compress_to, timings)
+
+        with timings.stage('stream'):
+            _stream_box(filename, nano, centers, n, box, indices, positions, rotations, chunk_size,
+                        ref_distance, overwrite)
+
+        return timings
+
+class PatchyBoxPlan(object):
+    """
+    Placement, orientations and counts of a PatchyBox, computed without building it.
+
+    Prototypes are only converted to ParticleArrays to find their exclusion
+    diameters; no mb.Compound is built. Use `build` or `build_arrays` to build
+    the box, which gives the same placement for the same int or SeedSequence
+    seed. Parameters are the same as `PatchyBox`.
+
+    Attributes
+    ----------
+    indices : np.ndarray (N,)
+        Prototype index of each nanoparticle
+    positions : np.ndarray (N, 3)
+        Center of the exclusion sphere of each nanoparticle
+    rotations : np.ndarray (N, 3, 3)
+        Orientation of each nanoparticle
+    centers : list of np.ndarray (3,)
+        Exclusion sphere center of each prototype, in its own coordinates
+    diameters : list of float
+        Exclusion diameter of each prototype (nm)
+    particles_per_nano : list of int
+        Number of beads in each prototype
+    final_box : mb.Box
+        Box of the built system, the given box or the compressed one with `compress_to`
+    timings : StageTimer
+        Timing report of the planning and of `stream`
+    """
+    def __init__(self, nano, n, box, seed=12345, cache=None, exclusion_percentile=100.0, compress_to=None):
+        nano, n = _prototype_lists(nano, n)
+        self.nano = nano
+        self.n = n
+        self.box = box
+        self.seed = seed
+        self.cache = cache
+        self.exclusion_percentile = exclusion_percentile
+        self.compress_to = compress_to
+
+        self.timings = StageTimer('PatchyBoxPlan')
+        self._prototypes = [_resolve_prototype(proto, cache, compound=False) for proto in nano]
+        self.particles_per_nano = [np_proto.n_particles for np_proto in self._prototypes]
+        self.centers, self.diameters, self.indices, self.positions, self.rotations, self.final_box = _layout(
+            self._prototypes, n, box, seed, exclusion_percentile, compress_to, self.timings)
+
+    @property
+    def n_nanoparticles(self):
+        return len(self.indices)
+
+    @property
+    def n_particles(self):
+        return int(np.dot(self.n, self.particles_per_nano))
+
+    @property
+    def packing_fraction(self):
+        """Fraction of the box volume taken by the exclusion spheres of the nanoparticles. """
+        volume = np.prod(self.final_box.lengths)
+        return np.dot(self.n, np.pi / 6.0 * np.asarray(self.diameters)**3) / volume
+
+    def build(self):
+        """Builds the planned box as a `PatchyBox` compound. """
+        return PatchyBox(self.nano, self.n, self.box, seed=self.seed, cache=self.cache,
+                         exclusion_percentile=self.exclusion_percentile, compress_to=self.compress_to)
+
+    def build_arrays(self):
+        """Builds the planned box with `PatchyBox.build_arrays`. """
+        return PatchyBox.build_arrays(self.nano, self.n, self.box, seed=self.seed, cache=self.cache,
+                                      exclusion_percentile=self.exclusion_percentile,
+                                      compress_to=self.compress_to)
+
+    def stream(self, filename, chunk_size=100, ref_distance=1.0, overwrite=False):
+        """Writes the planned box to a file with `PatchyBox.stream`, reusing the planned placement.
+
+        Returns the plan's `timings`, with the planning and the 'stream' stage.
+        """
+        with self.timings.stage('stream'):
+            _stream_box(filename, self._prototypes, self.centers, self.n, self.final_box, self.indices,
+                        self.positions, self.rotations, chunk_size, ref_distance, overwrite)
+
+        return self.timings
 
 if __name__ == "__main__":
     import mbuild as mb
     from cgnp_patchy.cgnp_patchy import cgnp_patchy
     from cgnp_patchy.lib.chains import CGAlkane
+    from cgnp_patchy.lib.utils.write_gsd import write_gsd
     chain_proto = CGAlkane(n=6, cap_front=False, cap_end=True)
     tnp = cgnp_patchy(radius=2.5, chain=chain_proto, chain_density=2.5, coating_pattern='bipolar', fractional_sa = 0.2)
     box = mb.Box(lengths=np.ones(3)*20)
     patchy_box = PatchyBox(tnp, n=10, box=box)
     
-    forcefield_dir = resource_filename('cgnp_patchy', '/forcefields')
-    patchy_box.save('patchy-box.hoomdxml',
-                    forcefield_files=[os.path.join(forcefield_dir, 'cg-alkane.xml'),
-                                      os.path.join(forcefield_dir, 'nano-0.6.xml')],
-                    ref_distance=3.95, ref_energy=0.091493, overwrite=True)
+    write_gsd('patchy-box.gsd', patchy_box, ref_distance=3.95, overwrite=True)
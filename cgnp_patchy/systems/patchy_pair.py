@@ -1,10 +1,26 @@
 import mbuild as mb
 import numpy as np
 
+from cgnp_patchy.systems.patchy_box import _resolve_prototype
+
 class PatchyPair(mb.Compound):
-    def __init__(self, nano, sep=4):
+    """
+    Builds a pair of nanoparticles separated along x.
+
+    Parameters
+    ----------
+    nano : mb.Compound, ParticleArray or dict
+        Nanoparticle prototype. A dict is taken as `cgnp_patchy` parameters and
+        the prototype is loaded from `cache`, or built and stored there.
+    sep : float, default=4
+        Center to center separation (nm)
+    cache : ParticleCache, optional, default=None
+        Cache of prototypes given as parameters. Defaults to a ParticleCache in `cache_dir()`.
+    """
+    def __init__(self, nano, sep=4, cache=None):
         super(PatchyPair, self).__init__()
 
+        nano = _resolve_prototype(nano, cache)
         nano.translate_to(np.zeros(3))
 
         nano2 = mb.clone(nano)
@@ -0,0 +1,109 @@
+from __future__ import division
+
+import numpy as np
+
+from cgnp_patchy.lib.utils.rng import as_random_state
+
+def _sample(distribution, n, random_state):
+    """Draws n values of a nanoparticle parameter.
+
+    The distribution may be a scipy.stats distribution (anything with `rvs`),
+    a function of (n, random_state), a sequence of n values or a constant.
+    """
+    if hasattr(distribution, 'rvs'):
+        values = distribution.rvs(size=n, random_state=random_state)
+    elif callable(distribution):
+        values = distribution(n, random_state)
+    else:
+        values = distribution
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 0:
+        return np.full(n, float(values))
+    if values.shape != (n,):
+        raise Exception("Expected {} values of a nanoparticle parameter, got {}.".format(n, values.shape))
+
+    return values
+
+def _bin_index(values, bins):
+    """Index of the bin of equal counts (up to ties) that each value falls in.
+
+    The edges are quantiles of the values, so long tails don't stretch the
+    bins and leave most of the values in one or two of them.
+    """
+    if bins < 2 or np.ptp(values) == 0:
+        return np.zeros(len(values), dtype=int)
+    edges = np.unique(np.quantile(values, np.linspace(0.0, 1.0, bins + 1)[1:-1]))
+
+    return np.searchsorted(edges, values, side='right')
+
+class PolydispersePopulation(object):
+    """
+    A polydisperse population of tethered nanoparticles, binned into a few prototypes.
+
+    The radius and grafting density of each nanoparticle are drawn from their
+    distributions, and each parameter that varies is split at its quantiles
+    into bins holding equal numbers of nanoparticles. The number of bins of
+    each is the largest that keeps the number of combinations within `bins`,
+    so there are at most `bins` prototypes: `bins` if only one parameter
+    varies and floor(sqrt(bins))**2 if both do, fewer if some combinations are
+    empty. Every occupied combination becomes one prototype, given as
+    `cgnp_patchy` parameters with the mean radius and grafting density of the
+    nanoparticles in it. Pass the population as `nano` to `PatchyBox`
+    (with `n=None`) to build each prototype once, or load it from the
+    particle cache, and replicate it for every nanoparticle in its bin.
+
+    Parameters
+    ----------
+    n : int
+        Number of nanoparticles
+    radius : float, sequence, callable or scipy.stats distribution
+        Distribution of the radius (nm): a constant, n values, a function of
+        (n, random_state) returning n values, or a frozen scipy.stats distribution
+    chain_density : float, sequence, callable or scipy.stats distribution
+        Distribution of the chain density (chains / nm^2), as for `radius`
+    bins : int, default=10
+        Largest number of prototypes
+    seed : int, np.random.SeedSequence or np.random.RandomState, default=12345
+        Seed for drawing the parameters
+    **params
+        Other `cgnp_patchy` parameters, shared by every prototype
+
+    Attributes
+    ----------
+    samples : dict
+        Drawn 'radius' and 'chain_density' of each nanoparticle
+    bin_index : np.ndarray (n,)
+        Prototype index of each nanoparticle
+    prototypes : list of dict
+        `cgnp_patchy` parameters of each prototype
+    counts : list of int
+        Number of nanoparticles of each prototype
+    """
+    def __init__(self, n, radius, chain_density, bins=10, seed=12345, **params):
+        random_state = as_random_state(seed)
+        self.samples = {'radius': _sample(radius, n, random_state),
+                        'chain_density': _sample(chain_density, n, random_state)}
+        if np.any(self.samples['radius'] <= 0) or np.any(self.samples['chain_density'] <= 0):
+            raise Exception("Drew a radius or chain density that is not positive; truncate the distributions.")
+
+        names = sorted(self.samples)
+        varying = [name for name in names if np.ptp(self.samples[name]) > 0]
+        # Bins per varying parameter, so their combinations number at most `bins`
+        per_parameter = int(np.floor(bins ** (1.0 / len(varying)) + 1e-9)) if varying else 1
+        keys = np.column_stack([_bin_index(self.samples[name], per_parameter) for name in names])
+        occupied, self.bin_index = np.unique(keys, axis=0, return_inverse=True)
+        self.bin_index = self.bin_index.ravel()
+        self.counts = np.bincount(self.bin_index, minlength=len(occupied)).tolist()
+        self.prototypes = []
+        for prototype in range(len(occupied)):
+            members = self.bin_index == prototype
+            means = dict((name, float(self.samples[name][members].mean())) for name in names)
+            self.prototypes.append(dict(params, **means))
+
+    @property
+    def n_nanoparticles(self):
+        return len(self.bin_index)
+
+    @property
+    def n_prototypes(self):
+        return len(self.prototypes)
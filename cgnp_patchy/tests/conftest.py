@@ -0,0 +1,11 @@
+import sys
+
+import pytest
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmpdir, monkeypatch):
+    """ Keeps the core table and particle cache of every test out of the user's cache directory """
+    import cgnp_patchy.lib.nanoparticles.Nanoparticle
+    monkeypatch.setenv('CGNP_PATCHY_CACHE_DIR', str(tmpdir.join('user-cache')))
+    # The merged core table is loaded once per session, including the user's table
+    monkeypatch.setattr(sys.modules['cgnp_patchy.lib.nanoparticles.Nanoparticle'], '_core_table', None)
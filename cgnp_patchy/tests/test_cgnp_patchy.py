@@ -4,6 +4,7 @@ Unit and regression test for the cgnp_patchy package.
 
 # Import package, test suite, and other packages as needed
 import cgnp_patchy
+import os
 import pytest
 import sys
 import mbuild as mb
@@ -41,11 +42,485 @@ class TestNanoparticleBuilder(BaseTest):
     def test_core_beads(self, Core):
         assert len(Core.children) == 153 
 
+    def test_core_table(self, monkeypatch):
+        import json
+        from cgnp_patchy.lib.nanoparticles import Nanoparticle
+        assert Nanoparticle.n_beads(2.5, 0.6) == 153
+        assert Nanoparticle._solve_n_beads(2.5, 0.6) == 153
+        # Integer radii find the shipped entries
+        from cgnp_patchy.lib.nanoparticles.Nanoparticle import _CORE_TABLE_FILE, _core_table_key
+        assert _core_table_key(5, 1) == _core_table_key(5.0, 1.0) == '5.0,1.0'
+        with open(_CORE_TABLE_FILE) as f:
+            assert Nanoparticle.n_beads(5, 0.6) == json.load(f)['5.0,0.6']
+
+        import numpy as np
+        from cgnp_patchy.lib.nanoparticles.Nanoparticle import _fibonacci_offsets, _min_spacing
+        from cgnp_patchy.lib.patterns.coating_pattern import _fibonacci_sphere
+        for n in (2, 3, 153, 1000):
+            points = _fibonacci_sphere(n, 2.3)
+            spacing = min(np.linalg.norm(points[offset:] - points[:-offset], axis=1).min()
+                          for offset in _fibonacci_offsets(n))
+            assert np.isclose(_min_spacing(n, 2.3), spacing)
+
+        # Only cores on the 0.01 nm grid are saved
+        Nanoparticle.n_beads(2.1234, 0.6)
+        Nanoparticle.n_beads(2.12, 0.6)
+        with open(os.path.join(os.environ['CGNP_PATCHY_CACHE_DIR'], 'core_table.json')) as f:
+            assert list(json.load(f)) == ['2.12,0.6']
+
+        # An unusable cache directory falls back to the shipped table
+        monkeypatch.setenv('CGNP_PATCHY_CACHE_DIR', '/proc/nope/cache')
+        monkeypatch.setattr(sys.modules['cgnp_patchy.lib.nanoparticles.Nanoparticle'], '_core_table', None)
+        assert Nanoparticle.n_beads(2.5, 0.6) == 153
+        assert Nanoparticle.n_beads(2.1, 0.6) == Nanoparticle._solve_n_beads(2.1, 0.6)
+
+    def test_check_overlap(self, Core):
+        import numpy as np
+        points = np.array([[0.0, 0.0, 0.0], [0.5, 0.0, 0.0], [2.0, 0.0, 0.0]])
+        assert Core._check_overlap(points, 0.3)
+        assert not Core._check_overlap(points, 0.2)
+
     def test_chainlength(self):
         from cgnp_patchy.lib.chains import CGAlkane
         chain = CGAlkane(n=10)
         assert chain.n_particles == 10
 
+    def test_graft_chains(self, Alkane):
+        import numpy as np
+        from cgnp_patchy.lib.utils.graft_chains import graft_chains
+        points = np.array([[0.0, 0.0, 2.5], [0.0, 0.0, -2.5], [2.5, 0.0, 0.0]])
+        chains, anchors = graft_chains(Alkane, points, np.zeros(3), 2.5)
+        assert len(chains) == 3
+        assert all(len(list(chain.all_ports())) == 0 for chain in chains)
+        for anchor, point in zip(anchors, points):
+            assert np.allclose(anchor.pos, point / 2.5 * 2.65)
+
+    def test_chain_templates(self, Alkane):
+        import numpy as np
+        from cgnp_patchy.cgnp_patchy import cgnp_patchy
+        from cgnp_patchy.lib.chains import CGAlkane
+        from cgnp_patchy.lib.utils import graft_chains
+        assert CGAlkane.prototype() is CGAlkane.prototype()
+        assert CGAlkane.prototype(n=4) is not CGAlkane.prototype()
+
+        template = graft_chains._chain_template(Alkane)
+        assert graft_chains._chain_template(CGAlkane.prototype()) is template
+        moved = mb.clone(Alkane)
+        moved.translate([1.0, 2.0, 3.0])
+        assert graft_chains._chain_template(moved) is template
+        assert graft_chains._chain_template(CGAlkane(n=4)) is not template
+        assert len(graft_chains._template_cache) <= graft_chains.TEMPLATE_CACHE_SIZE
+
+        short = cgnp_patchy(radius=2.5, bead_diameter=0.6, chain_density=2.0, chain=CGAlkane(n=4))
+        default = cgnp_patchy(radius=2.5, bead_diameter=0.6, chain_density=2.0)
+        n_chains = len(list(default.particles_by_name('_MME')))
+        assert default.n_particles - short.n_particles == 2 * n_chains
+
+    def test_build_arrays(self, CGNanoparticle):
+        import numpy as np
+        from cgnp_patchy.cgnp_patchy import cgnp_patchy
+        from cgnp_patchy.lib.utils.particle_array import ParticleArray
+        arrays = cgnp_patchy.build_arrays(radius=2.5, bead_diameter=0.6, chain_density=2.0)
+        ref = ParticleArray.from_compound(CGNanoparticle)
+        assert np.allclose(arrays.xyz, ref.xyz)
+        assert np.array_equal(arrays.names, ref.names)
+        assert np.array_equal(arrays.rigid_id, ref.rigid_id)
+        assert arrays.n_bonds == ref.n_bonds
+        compound = arrays.to_compound()
+        assert compound.n_particles == CGNanoparticle.n_particles
+        assert compound.n_bonds == CGNanoparticle.n_bonds
+
+    def test_bond_free(self, CGNanoparticle, Alkane):
+        import numpy as np
+        from cgnp_patchy.cgnp_patchy import cgnp_patchy
+        from cgnp_patchy.lib.utils.particle_array import ParticleArray
+        bonded = cgnp_patchy(radius=2.5, bead_diameter=0.6, chain_density=2.0, bond_free=False)
+        ref = ParticleArray.from_compound(bonded)
+        arrays = ParticleArray.from_compound(CGNanoparticle)
+        assert np.allclose(arrays.xyz, ref.xyz)
+        assert np.array_equal(arrays.rigid_id, ref.rigid_id)
+        assert arrays.n_bonds == ref.n_bonds
+        assert 'remove_bonds' in bonded.timings.stages
+
+        kwargs = dict(radius=2.5, bead_diameter=0.6, chain_density=2.0, backfill=Alkane, coating_pattern='polar')
+        ref = ParticleArray.from_compound(cgnp_patchy(bond_free=False, **kwargs))
+        arrays = ParticleArray.from_compound(cgnp_patchy(**kwargs))
+        assert np.allclose(arrays.xyz, ref.xyz)
+        assert np.array_equal(arrays.rigid_id, ref.rigid_id)
+
+    def test_particle_cache(self, tmpdir, monkeypatch):
+        import numpy as np
+        from cgnp_patchy.cgnp_patchy import cgnp_patchy
+        from cgnp_patchy.lib.utils.particle_cache import ParticleCache
+        from cgnp_patchy.systems import PatchyBox, PatchyPair
+        cache = ParticleCache(str(tmpdir.join('cache')))
+        params = dict(radius=2.5, bead_diameter=0.6, chain_density=2.0)
+        built = cgnp_patchy.build_cached(cache=cache, **params)
+        assert len(cache.entries()) == 1
+        loaded = cgnp_patchy.build_cached(cache=cache, **params)
+        assert not loaded.xyz.flags.writeable
+        assert np.array_equal(loaded.xyz, built.xyz)
+        assert np.array_equal(loaded.names, built.names)
+        assert np.array_equal(loaded.bonds, built.bonds)
+        assert np.array_equal(loaded.rigid_id, built.rigid_id)
+
+        box = PatchyBox.build_arrays(params, n=2, box=mb.Box(lengths=[20, 20, 20]), cache=cache)
+        assert box.n_particles == 2 * built.n_particles
+        pair = PatchyPair(params, cache=cache)
+        assert pair.n_particles == 2 * built.n_particles
+        assert len(cache.entries()) == 1
+
+        cgnp_patchy.build_cached(cache=cache, coating_pattern='polar', **params)
+        assert len(cache.entries()) == 2
+        # Bumping the cache format invalidates every entry
+        from cgnp_patchy.lib.utils import particle_cache
+        key = particle_cache.particle_key(**params)
+        monkeypatch.setattr(particle_cache, '_CACHE_FORMAT', particle_cache._CACHE_FORMAT + 1)
+        assert particle_cache.particle_key(**params) != key
+        cache.max_size = cache.size - 1
+        cache.evict()
+        assert len(cache.entries()) == 1
+
+    def test_plan(self, CGNanoparticle, Alkane):
+        import numpy as np
+        from cgnp_patchy.cgnp_patchy import cgnp_patchy
+        from cgnp_patchy.systems import PatchyBox
+        plan = cgnp_patchy.plan(radius=2.5, bead_diameter=0.6, chain_density=2.0)
+        assert plan.n_particles == CGNanoparticle.n_particles
+        assert plan.n_core == len(list(CGNanoparticle.particles_by_name('_CGN')))
+        assert plan.n_chains == len(list(CGNanoparticle.particles_by_name('_MME')))
+        assert plan.patch_area == 0.0
+        assert np.isclose(plan.grafting_density, plan.n_chains / (4 * np.pi * 2.5**2))
+
+        plan = cgnp_patchy.plan(radius=2.5, bead_diameter=0.6, chain_density=2.0, coating_pattern='polar',
+                                backfill=Alkane)
+        assert plan.n_particles == plan.build_arrays().n_particles
+        assert plan.n_backfill == len(plan.pattern.removed_points)
+        assert 0 < plan.patch_area < plan.surface_area
+
+        box = mb.Box(lengths=[20, 20, 20])
+        box_plan = PatchyBox.plan(plan, n=3, box=box)
+        assert box_plan.n_nanoparticles == 3
+        assert box_plan.n_particles == 3 * plan.n_particles
+        assert 0 < box_plan.packing_fraction < 1
+        arrays = box_plan.build_arrays()
+        assert arrays.n_particles == box_plan.n_particles
+        cores = [arrays.xyz[(arrays.molecule_id == i) & (arrays.rigid_id >= 0)].mean(axis=0) for i in range(3)]
+        assert np.allclose(cores, box_plan.positions)
+
+    def test_replicate(self):
+        import numpy as np
+        from cgnp_patchy.cgnp_patchy import cgnp_patchy
+        from cgnp_patchy.lib.utils.transforms import quaternions_to_rotations, random_quaternions, transform_points
+        proto = cgnp_patchy.build_arrays(radius=2.5, bead_diameter=0.6, chain_density=2.0)
+        rotations = quaternions_to_rotations(random_quaternions(3, np.random.RandomState(1)))
+        positions = np.array([[0.0, 0.0, 0.0], [10.0, 0.0, 0.0], [0.0, 10.0, 0.0]])
+        coords = transform_points(proto.xyz - proto.center, rotations, positions)
+        box = proto.replicate(coords)
+        assert box.n_molecules == 3
+        assert np.array_equal(np.unique(box.rigid_id), [-1, 0, 1, 2])
+        assert box.n_bonds == 3 * proto.n_bonds
+        for i in range(3):
+            xyz = box.xyz[box.molecule_id == i]
+            assert np.allclose(xyz.mean(axis=0), positions[i])
+            assert np.allclose(np.linalg.norm(xyz - xyz[0], axis=1), np.linalg.norm(proto.xyz - proto.xyz[0], axis=1))
+
+    def test_pack_spheres(self):
+        import numpy as np
+        from scipy.spatial import cKDTree
+        from cgnp_patchy.lib.utils.pack_spheres import pack_spheres
+        lengths = np.ones(3) * 15
+        indices, positions = pack_spheres(lengths, [50, 50], [3.0, 2.0], seed=1)
+        assert np.array_equal(np.bincount(indices), [50, 50])
+        pairs = cKDTree(positions, boxsize=lengths).query_pairs(2.0 - 1e-9)
+        assert len(pairs) == 0
+
+    def test_compress_spheres(self):
+        import numpy as np
+        from scipy.spatial import cKDTree
+        from cgnp_patchy.cgnp_patchy import cgnp_patchy
+        from cgnp_patchy.lib.utils.find_overlaps import find_overlaps
+        from cgnp_patchy.lib.utils.pack_spheres import compress_spheres, pack_spheres
+        from cgnp_patchy.systems import PatchyBox
+        lengths = np.ones(3) * 20
+        indices, positions = pack_spheres(lengths, [200], [2.0], seed=1)
+        positions, lengths = compress_spheres(positions, 2.0, lengths, 0.55)
+        assert np.isclose(200 * np.pi / 6 * 2.0**3 / np.prod(lengths), 0.55)
+        assert np.all((positions >= 0) & (positions < lengths))
+        pairs = cKDTree(positions, boxsize=lengths).query_pairs(2.0 - 1e-9)
+        assert len(pairs) == 0
+
+        nano = cgnp_patchy.build_arrays(radius=2.5, bead_diameter=0.6, chain_density=2.0, coating_pattern='polar')
+        plan = PatchyBox.plan(nano, n=40, box=mb.Box(lengths=np.ones(3) * 50), compress_to=0.45)
+        assert np.isclose(plan.packing_fraction, 0.45)
+        arrays = plan.build_arrays()
+        assert np.allclose(arrays.periodicity, plan.final_box.lengths)
+        assert len(find_overlaps(arrays)) == 0
+
+        # Dense packings keep the buffer between the exclusion spheres
+        plan = PatchyBox.plan(nano, n=200, box=mb.Box(lengths=np.ones(3) * 90), compress_to=0.6)
+        assert len(find_overlaps(plan.build_arrays())) == 0
+
+    def test_polydisperse_population(self, tmpdir):
+        import numpy as np
+        from scipy import stats
+        from cgnp_patchy.lib.utils.particle_cache import ParticleCache
+        from cgnp_patchy.systems import PatchyBox, PolydispersePopulation
+        population = PolydispersePopulation(30, stats.uniform(2.0, 1.0), 2.0, bins=3, bead_diameter=0.6)
+        assert population.n_prototypes == 3
+        assert sum(population.counts) == population.n_nanoparticles == 30
+        for index, prototype in enumerate(population.prototypes):
+            radii = population.samples['radius'][population.bin_index == index]
+            assert radii.min() <= prototype['radius'] <= radii.max()
+            assert prototype['chain_density'] == 2.0 and prototype['bead_diameter'] == 0.6
+        same = PolydispersePopulation(30, stats.uniform(2.0, 1.0), 2.0, bins=3, bead_diameter=0.6)
+        assert np.array_equal(same.samples['radius'], population.samples['radius'])
+        with pytest.raises(Exception):
+            PolydispersePopulation(3, [2.0, -1.0, 3.0], 2.0)
+
+        # Both parameters vary: at most `bins` prototypes, and a long tail doesn't empty the bins
+        wide = PolydispersePopulation(1000, stats.lognorm(1.0, scale=3.0), stats.uniform(1.0, 2.0), bins=10)
+        assert wide.n_prototypes == 9
+        assert min(wide.counts) > 50
+
+        cache = ParticleCache(str(tmpdir.join('cache')))
+        arrays = PatchyBox.build_arrays(population, None, box=mb.Box(lengths=np.ones(3) * 60), cache=cache)
+        assert arrays.n_molecules == 30
+        assert len(cache.entries()) == 3
+
+    def test_independent_streams(self):
+        import numpy as np
+        from cgnp_patchy.cgnp_patchy import cgnp_patchy
+        from cgnp_patchy.lib.utils.rng import as_random_state, spawn_streams
+        from cgnp_patchy.systems import PatchyBox
+        assert np.array_equal(as_random_state(5).random_sample(3), np.random.RandomState(5).random_sample(3))
+        first, second = spawn_streams(5, 2)
+        assert not np.array_equal(first.random_sample(3), second.random_sample(3))
+        generator = np.random.default_rng(5)
+        assert as_random_state(generator).random_sample() != as_random_state(generator).random_sample()
+
+        state = np.random.get_state()
+        proto = cgnp_patchy.build_arrays(radius=2.5, bead_diameter=0.6, chain_density=2.0)
+        box = mb.Box(lengths=[20, 20, 20])
+        arrays = PatchyBox.build_arrays(proto, n=4, box=box, seed=7)
+        assert np.array_equal(arrays.xyz, PatchyBox.build_arrays(proto, n=4, box=box, seed=7).xyz)
+        assert not np.array_equal(arrays.xyz, PatchyBox.build_arrays(proto, n=4, box=box, seed=8).xyz)
+        assert np.array_equal(np.random.get_state()[1], state[1])
+
+    def test_patchy_box(self, CGNanoparticle):
+        import numpy as np
+        from cgnp_patchy.systems import PatchyBox
+        box = mb.Box(lengths=np.ones(3) * 20)
+        patchy_box = PatchyBox(CGNanoparticle, n=3, box=box)
+        arrays = PatchyBox.build_arrays(CGNanoparticle, n=3, box=box)
+        assert patchy_box.n_particles == 3 * CGNanoparticle.n_particles
+        assert arrays.n_particles == patchy_box.n_particles
+        assert np.allclose(arrays.xyz, patchy_box.xyz)
+        assert np.allclose(patchy_box.periodicity, box.lengths)
+
+    def test_find_overlaps(self):
+        import numpy as np
+        from cgnp_patchy.cgnp_patchy import cgnp_patchy
+        from cgnp_patchy.lib.utils.find_overlaps import find_overlaps
+        from cgnp_patchy.lib.utils.particle_array import ParticleArray
+        from cgnp_patchy.systems import PatchyBox
+        xyz = np.array([[0.1, 0.1, 0.1], [9.8, 0.1, 0.1], [5.0, 5.0, 5.0], [5.3, 5.0, 5.0], [5.0, 5.0, 6.0]])
+        points = ParticleArray(xyz, ['A'], np.zeros(5), molecule_id=[0, 1, 2, 3, 3], periodicity=np.ones(3) * 10)
+        assert np.array_equal(find_overlaps(points), [[0, 1], [2, 3]])
+        assert np.array_equal(find_overlaps(points, cutoff=1.1), [[0, 1], [2, 3], [2, 4]])
+        assert np.array_equal(find_overlaps(points, cutoff=1.1, same_molecule=True), [[0, 1], [2, 3], [2, 4], [3, 4]])
+        points.periodicity = None
+        assert np.array_equal(find_overlaps(points), [[2, 3]])
+
+        nano = cgnp_patchy.build_arrays(radius=2.5, bead_diameter=0.6, chain_density=2.0, coating_pattern='polar')
+        box = mb.Box(lengths=np.ones(3) * 30)
+        plan = PatchyBox.plan(nano, n=20, box=box)
+        assert len(find_overlaps(plan.build_arrays())) == 0
+        # Smaller exclusion spheres let the coatings interpenetrate, but clashing chain ends are reoriented
+        tight = PatchyBox.plan(nano, n=20, box=box, exclusion_percentile=80)
+        assert tight.packing_fraction < plan.packing_fraction
+        assert len(find_overlaps(tight.build_arrays())) == 0
+        with pytest.raises(Exception):
+            PatchyBox.plan(nano, n=8, box=mb.Box(lengths=np.ones(3) * 16), exclusion_percentile=0)
+
+        # The 80th percentile sphere is tighter than the old extent along the box axes plus 0.5 nm
+        for coating_pattern in ('isotropic', 'polar', 'bipolar'):
+            proto = cgnp_patchy.build_arrays(radius=2.5, bead_diameter=0.6, chain_density=2.0,
+                                             coating_pattern=coating_pattern)
+            extent = max(proto.xyz[:, dim].max() - proto.xyz[:, dim].min() for dim in range(3)) + 0.5
+            assert PatchyBox.plan(proto, n=1, box=box, exclusion_percentile=80).diameters[0] < extent
+
+        # Each nanoparticle of a compound box is its own molecule
+        shifted = ParticleArray(nano.xyz + [1.0, 0.0, 0.0], nano.types, nano.typeid, nano.bonds, nano.rigid_id)
+        arrays = ParticleArray.concatenate([nano, shifted])
+        overlaps = find_overlaps(arrays)
+        assert len(overlaps) > 0
+        assert np.array_equal(find_overlaps(arrays.to_compound()), overlaps)
+
+    def test_write_gsd(self):
+        import numpy as np
+        gsd_hoomd = pytest.importorskip('gsd.hoomd')
+        from cgnp_patchy.cgnp_patchy import cgnp_patchy
+        arrays = cgnp_patchy.build_arrays(radius=2.5, bead_diameter=0.6, chain_density=2.0)
+        arrays.periodicity = np.ones(3) * 20
+        arrays.save('nanoparticle.gsd')
+        with gsd_hoomd.open('nanoparticle.gsd', 'rb') as f:
+            snapshot = f[0]
+        assert snapshot.particles.N == arrays.n_particles
+        assert snapshot.particles.types == ['CGN', 'MMM', 'MME']
+        assert snapshot.bonds.types == ['MME-MMM', 'MMM-MMM']
+        assert np.array_equal(snapshot.particles.body, arrays.rigid_id)
+        assert np.allclose(snapshot.configuration.box[:3], 200)
+
+    def test_stream_box(self):
+        import numpy as np
+        from cgnp_patchy.cgnp_patchy import cgnp_patchy
+        from cgnp_patchy.systems import PatchyBox
+        nano = cgnp_patchy.build_arrays(radius=2.5, bead_diameter=0.6, chain_density=2.0, coating_pattern='polar')
+        box = mb.Box(lengths=np.ones(3) * 30)
+        arrays = PatchyBox.build_arrays(nano, n=5, box=box)
+        PatchyBox.stream(nano, n=5, box=box, filename='box.lammps', chunk_size=2)
+        with open('box.lammps') as f:
+            lines = f.read().splitlines()
+        assert '{} atoms'.format(arrays.n_particles) in lines
+        assert '{} bonds'.format(arrays.n_bonds) in lines
+        atoms = np.loadtxt(lines[lines.index('Atoms # full') + 2:lines.index('Bonds') - 1])
+        assert np.array_equal(atoms[:, 1] - 1, arrays.molecule_id)
+        assert np.allclose(atoms[:, 4:7] / 10.0 + atoms[:, 7:] * 30, arrays.xyz, atol=1e-5)
+        bonds = np.loadtxt(lines[lines.index('Bonds') + 2:], dtype=int)
+        assert np.array_equal(bonds[:, 2:] - 1, arrays.bonds)
+
+        # Boxes without nanoparticles are empty
+        empty = PatchyBox.build_arrays([nano, nano], n=[0, 0], box=box)
+        assert empty.n_particles == empty.n_bonds == 0
+        assert np.allclose(empty.periodicity, box.lengths)
+
+        # A failed stream leaves no partial file behind
+        from cgnp_patchy.lib.utils.write_stream import LammpsDataStream
+        with pytest.raises(Exception):
+            with LammpsDataStream('partial.lammps', arrays.types, [], arrays.n_particles, 0, box.lengths) as stream:
+                stream.append(nano)
+                raise RuntimeError()
+        assert not os.path.exists('partial.lammps')
+        plan = PatchyBox.plan(nano, n=5, box=box)
+        assert 'stream' in plan.stream('plan.lammps', chunk_size=2).stages
+
+        gsd_hoomd = pytest.importorskip('gsd.hoomd')
+        arrays.save('box.gsd')
+        plan.stream('stream.gsd', chunk_size=2)
+        with gsd_hoomd.open('box.gsd', 'rb') as f, gsd_hoomd.open('stream.gsd', 'rb') as g:
+            ref, snapshot = f[0], g[0]
+        assert snapshot.particles.types == ref.particles.types
+        assert np.array_equal(snapshot.particles.position, ref.particles.position)
+        assert np.array_equal(snapshot.particles.body, ref.particles.body)
+        assert np.array_equal(snapshot.bonds.group, ref.bonds.group)
+        assert np.array_equal(snapshot.bonds.typeid, ref.bonds.typeid)
+
+    def test_compact_bodies(self):
+        import json
+        import numpy as np
+        from cgnp_patchy.cgnp_patchy import cgnp_patchy
+        from cgnp_patchy.lib.utils.rigid_bodies import compact_rigid_bodies
+        from cgnp_patchy.lib.utils.transforms import quaternions_to_rotations, rotations_to_quaternions
+        from cgnp_patchy.systems import PatchyBox
+        quaternions = np.random.RandomState(0).normal(size=(5, 4))
+        rotations = quaternions_to_rotations(quaternions / np.linalg.norm(quaternions, axis=1)[:, None])
+        assert np.allclose(quaternions_to_rotations(rotations_to_quaternions(rotations)), rotations)
+
+        nano = cgnp_patchy.build_arrays(radius=2.5, bead_diameter=0.6, chain_density=2.0)
+        arrays = PatchyBox.build_arrays(nano, n=3, box=mb.Box(lengths=np.ones(3) * 20))
+        bodies = compact_rigid_bodies(arrays)
+        assert bodies.n_bodies == 3 and len(bodies.templates) == 1
+        n_free = np.count_nonzero(arrays.rigid_id < 0)
+        assert bodies.particles.n_particles == n_free + 3
+        assert bodies.particles.n_bonds + len(bodies.constituent_bonds) == arrays.n_bonds
+
+        # The constituents are recovered from the central particles and the template
+        template = bodies.templates['_R0']['positions']
+        rotations = quaternions_to_rotations(bodies.orientation[:3])
+        constituents = np.einsum('mij,kj->mki', rotations, template) + bodies.particles.xyz[:3, None]
+        assert np.allclose(constituents.reshape(-1, 3), arrays.xyz[arrays.rigid_id >= 0])
+
+        gsd_hoomd = pytest.importorskip('gsd.hoomd')
+        arrays.save('compact.gsd', overwrite=True, compact_bodies=True)
+        with gsd_hoomd.open('compact.gsd', 'rb') as f:
+            snapshot = f[0]
+        assert snapshot.particles.N == bodies.particles.n_particles
+        assert snapshot.particles.types[0] == 'R0'
+        assert np.array_equal(snapshot.particles.body[:4], [0, 1, 2, -1])
+        with open('compact.gsd.bodies.json') as f:
+            templates = json.load(f)
+        assert len(templates['body']['R0']['positions']) == len(template)
+        assert len(templates['constituent_bonds']['group']) == len(bodies.constituent_bonds)
+
+    def test_timings(self, CGNanoparticle, tmpdir, monkeypatch):
+        from cgnp_patchy.cgnp_patchy import cgnp_patchy
+        stages = ['core', 'pattern', 'grafting', 'label_rigid_bodies', 'rigid_ids']
+        assert list(CGNanoparticle.timings.stages) == stages
+        assert all(record['calls'] == 1 for record in CGNanoparticle.timings.stages.values())
+        assert 'rigid_ids' in CGNanoparticle.timings.report()
+
+        import numpy as np
+        from cgnp_patchy.lib.utils.stage_timer import StageTimer
+        timer = StageTimer('test')
+        with timer.stage('untraced'):
+            pass
+        assert timer.stages['untraced']['peak_memory'] is None
+        monkeypatch.setenv('CGNP_PATCHY_TRACE_MEMORY', '1')
+        with timer.stage('small'):
+            small = np.ones(1000)
+        with timer.stage('large'):
+            large = np.ones(10**6)
+        assert timer.stages['small']['peak_memory'] < 0.1 < 7.5 < timer.stages['large']['peak_memory']
+        monkeypatch.delenv('CGNP_PATCHY_TRACE_MEMORY')
+
+        monkeypatch.setenv('CGNP_PATCHY_PROFILE', str(tmpdir.join('profiles')))
+        arrays = cgnp_patchy.build_arrays(radius=2.5, bead_diameter=0.6, chain_density=2.0)
+        assert list(arrays.timings.stages) == ['core', 'pattern', 'grafting', 'concatenate']
+        assert len(tmpdir.join('profiles').listdir()) == 4
+
+    def test_benchmarks(self):
+        from cgnp_patchy.benchmarks import compare, load_baseline, run_benchmarks
+        baseline = load_baseline()
+        assert set(run_benchmarks(['zzz'])['results']) == set()
+        results = run_benchmarks(['nanoparticle[r=2.5]', 'pattern[polar'], repeat=1)
+        assert set(results['results']) <= set(baseline['results'])
+        assert len(results['results']) == 4
+        assert compare(results, results) == []
+        slow = dict(results, results=dict((name, {'wall_time': result['wall_time'] + 1.0,
+                                                  'peak_memory': result['peak_memory'] * 2 + 2.0})
+                                          for name, result in results['results'].items()))
+        assert len(compare(slow, results)) == 8
+        assert compare(slow, results, time_tolerance=1e6, memory_tolerance=1e6) == []
+
+    def test_sweep(self, tmpdir):
+        import json
+        import numpy as np
+        from cgnp_patchy.lib.utils.particle_array import ParticleArray
+        from cgnp_patchy.sweep import MANIFEST, job_seed, main, run_sweep, sweep_jobs
+        grid = {'radius': 2.5, 'chain_density': [1.0, 2.0], 'coating_pattern': ['polar', 'ring']}
+        assert len(sweep_jobs(grid)) == 4
+        assert len(set(job_seed(1, i) for i in range(4))) == 4
+        assert job_seed(1, 0) == job_seed(1, 0) != job_seed(2, 0)
+
+        out = str(tmpdir.join('sweep'))
+        records = run_sweep(grid, out, processes=2)
+        assert len(records) == 4 and not any(record['error'] for record in records)
+        arrays = ParticleArray.load(os.path.join(out, records[0]['file']))
+        assert arrays.n_particles == records[0]['n_particles']
+
+        # Finished jobs are skipped, so only the removed build is redone
+        os.remove(os.path.join(out, records[0]['file']))
+        assert [record['job'] for record in run_sweep(grid, out, processes=1)] == [records[0]['job']]
+        assert run_sweep(grid, out) == []
+
+        box_grid = tmpdir.join('box.json')
+        box_grid.write(json.dumps({'radius': 2.5, 'chain_density': 2.0, 'n': 3}))
+        assert main([str(box_grid), '--out', out, '--processes', '1']) == 0
+        with open(os.path.join(out, MANIFEST)) as f:
+            record = json.loads(f.readlines()[-1])
+        assert ParticleArray.load(os.path.join(out, record['file'])).n_molecules == 3
+
     def test_save(self, CGNanoparticle):
         CGNanoparticle.save('nanoparticle.mol2', overwrite=True)
 
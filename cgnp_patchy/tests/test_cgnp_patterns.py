@@ -26,6 +26,53 @@ class TestPatterns(BaseTest):
         ''' If this fails, it's likely mBuild's SpherePattern has been changed ''' 
         assert len(IsotropicPattern.points) == 235
 
+    def test_isotropic_lattice(self, IsotropicPattern):
+        from cgnp_patchy.lib.patterns import PolarPattern
+        pattern = PolarPattern(radius=2.5, chain_density=3.0, fractional_sa=0.2)
+        assert np.allclose(pattern.lattice, IsotropicPattern.points)
+        assert np.allclose(pattern.points, pattern.lattice[pattern.mask])
+
+    def test_lattice_cache(self, IsotropicPattern):
+        from cgnp_patchy.lib.nanoparticles import Nanoparticle
+        from cgnp_patchy.lib.patterns import PolarPattern, SquarePattern
+        from cgnp_patchy.lib.patterns.coating_pattern import fibonacci_sphere, isotropic_lattice
+        lattice = isotropic_lattice(3.0, 2.5)
+        assert lattice is PolarPattern(radius=2.5, chain_density=3.0, fractional_sa=0.2).lattice
+        assert lattice is SquarePattern(radius=2.5, chain_density=3.0, fractional_sa=0.2).lattice
+        assert np.allclose(lattice, IsotropicPattern.points)
+        assert not lattice.flags.writeable
+        with pytest.raises(ValueError):
+            lattice[0] = 0.0
+        core = Nanoparticle.core_points(2.5, 0.6)
+        assert core is Nanoparticle.core_points(2.5, 0.6)
+        assert not core.flags.writeable
+        assert fibonacci_sphere.cache_info().currsize <= fibonacci_sphere.cache_info().maxsize
+
+    def test_patch_pattern(self, IsotropicPattern):
+        from cgnp_patchy.lib.patterns import PatchPattern
+        from cgnp_patchy.lib.patterns.coating_pattern import fibonacci_sphere
+        from cgnp_patchy.lib.patterns.patch_pattern import cap_angle, in_cap_mask
+        assert np.isclose(cap_angle(0.5), np.pi / 2)
+        pattern = PatchPattern(radius=2.5, chain_density=3.0, centers=[[0, 0, 1]], fractional_sa=0.5)
+        assert np.array_equal(pattern.mask, pattern.lattice[:, 2] < 0)
+        assert count_patch_points(pattern, 2.5, 3.0) == len(IsotropicPattern.points) // 2
+
+        centers = fibonacci_sphere(100)
+        angles = np.linspace(0.05, 0.2, 100)
+        pattern = PatchPattern(radius=2.5, chain_density=3.0, centers=centers, angles=angles)
+        dense = in_cap_mask(pattern.lattice, centers, angles, tree_threshold=len(centers))
+        assert np.array_equal(~pattern.mask, dense)
+        assert 0 < count_patch_points(pattern, 2.5, 3.0) < len(IsotropicPattern.points)
+        with pytest.raises(ValueError):
+            PatchPattern(radius=2.5, chain_density=3.0, centers=[])
+
+    def test_removed_indices(self, IsotropicPattern):
+        from cgnp_patchy.lib.patterns import TetrahedralPattern
+        pattern = TetrahedralPattern(radius=2.5, chain_density=3.0, fractional_sa=0.2)
+        indices = np.union1d(pattern.indices, pattern.removed_indices)
+        assert np.array_equal(indices, np.arange(len(IsotropicPattern.points)))
+        assert count_patch_points(mb.Pattern(pattern.points), 2.5, 3.0) == len(pattern.removed_indices)
+
     def test_bipolar_pattern(self, IsotropicPattern):
         from cgnp_patchy.lib.patterns import BipolarPattern
         pattern = BipolarPattern(radius=2.5, chain_density=3.0, fractional_sa=0.2)
@@ -59,6 +106,33 @@ class TestPatterns(BaseTest):
         pattern = RandomPattern(radius=2.5, chain_density=3.0, seed=123)
         assert len(pattern.points) > 200 and len(pattern.points) < 300
 
+    def test_random_pattern_seed(self):
+        from cgnp_patchy.lib.patterns import RandomPattern
+        state = np.random.get_state()
+        pattern = RandomPattern(radius=2.5, chain_density=3.0, seed=123)
+        assert np.array_equal(pattern.mask, RandomPattern(radius=2.5, chain_density=3.0, seed=123).mask)
+        assert not np.array_equal(pattern.mask, RandomPattern(radius=2.5, chain_density=3.0, seed=124).mask)
+        seeded = RandomPattern(radius=2.5, chain_density=3.0, seed=np.random.SeedSequence(123))
+        assert len(seeded.points) == len(pattern.points)
+        assert np.array_equal(np.random.get_state()[1], state[1])
+
+    def test_poisson_random_pattern(self, IsotropicPattern):
+        from scipy.spatial import cKDTree
+        from cgnp_patchy.lib.patterns import RandomPattern
+        pattern = RandomPattern(radius=2.5, chain_density=3.0, seed=123, mode='poisson')
+        assert len(pattern.points) == len(IsotropicPattern.points)
+        assert np.allclose(np.linalg.norm(pattern.points, axis=1), 2.5)
+        dists, _ = cKDTree(pattern.points).query(pattern.points, k=2)
+        assert dists[:, 1].min() >= pattern.min_separation
+        assert np.array_equal(pattern.points, RandomPattern(radius=2.5, chain_density=3.0, seed=123, mode='poisson').points)
+        assert count_patch_points(pattern, 2.5, 3.0) == 0
+
+        pattern = RandomPattern(radius=2.5, chain_density=3.0, mode='poisson', min_separation=0.2)
+        dists, _ = cKDTree(pattern.points).query(pattern.points, k=2)
+        assert dists[:, 1].min() >= 0.2
+        with pytest.raises(Exception):
+            RandomPattern(radius=2.5, chain_density=3.0, mode='poisson', min_separation=1.0)
+
     def test_ring_pattern(self, IsotropicPattern):
         from cgnp_patchy.lib.patterns import RingPattern
         pattern = RingPattern(radius=2.5, chain_density=3.0, fractional_sa=0.2)
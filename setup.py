@@ -1,4 +1,4 @@
-from setuptools import setup
+from setuptools import find_packages, setup
 
 
 setup(
@@ -10,9 +10,14 @@ setup(
     version='0.0.0',
     description='An mBuild recipe for generating parameterized models of polymer-tethered, coarse-grained silica nanoparticles.',
     zip_safe=False,
+    packages=find_packages(),
+    package_data={'cgnp_patchy': ['lib/nanoparticles/core_table.json', 'benchmarks/baseline.json']},
     entry_points={
         'mbuild.plugins':[
         "cgnp_patchy = cgnp_patchy.cgnp_patchy:cgnp_patchy"
+        ],
+        'console_scripts':[
+        "cgnp_patchy_sweep = cgnp_patchy.sweep:main"
         ]
         }
     )